@@ -11,6 +11,7 @@ sys.path.append(os.path.join(BASE_DIR, 'structural_losses_utils'))
 from tf_nndistance import nn_distance
 from tf_approxmatch import approx_match, match_cost
 from tf_hausdorff_distance import directed_hausdorff
+from tf_sliced_wasserstein import sliced_wasserstein_distance, NUM_PROJECTIONS
 
 default_para_config = {
     'exp_name': 'ae',
@@ -131,6 +132,9 @@ class AutoEncoder:
             loss = match_cost(recon, input, match)
             loss = tf.reduce_mean(loss)
             loss = tf.div(loss, self.point_cloud_shape[0]) # return point-wise loss
+        elif self.loss == 'swd':
+            distances = sliced_wasserstein_distance(recon, input, self.paras.get('swd_projections', NUM_PROJECTIONS))
+            loss = tf.reduce_mean(distances) # point-wise, same range as emd
         elif self.loss == 'hausdorff':
             distances = directed_hausdorff(input, recon) # partial-noisy ->fake_clean
             loss = tf.reduce_mean(distances)
@@ -208,6 +212,9 @@ class AutoEncoderDenoise:
             loss = match_cost(recon, input, match)
             loss = tf.reduce_mean(loss)
             loss = tf.div(loss, self.point_cloud_shape[0]) # return point-wise loss
+        elif self.loss == 'swd':
+            distances = sliced_wasserstein_distance(recon, input, self.paras.get('swd_projections', NUM_PROJECTIONS))
+            loss = tf.reduce_mean(distances) # point-wise, same range as emd
         
         return loss
 
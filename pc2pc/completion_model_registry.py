@@ -0,0 +1,159 @@
+'''
+    Host the completion models of several categories in one process.
+    Each category gets its own graph and session, all sessions share the process-wide TF thread pools.
+    Models are loaded lazily on the first request of a category and the least recently used ones
+    are evicted when the estimated model memory exceeds the budget.
+'''
+import os
+import sys
+import threading
+import collections
+
+import numpy as np
+import tensorflow as tf
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR) # model
+from pcl2pcl_completer import PCL2PCLCompleter, FrozenPCL2PCLCompleter
+import config
+
+ALL_CATEGORIES = ['chair', 'table', 'plane', 'car', 'lamp', 'sofa', 'boat', 'dresser']
+
+COMPLETION_SCOPES = ['noisy_Encoder', 'G', 'clean_Decoder']
+
+def get_default_model_filenames(cat_names=ALL_CATEGORIES):
+    '''
+    category -> pcl2pcl gan checkpoint, see config.PCL2PCL_*_3DEPN_ckpt
+    '''
+    return {cat_name: getattr(config, 'PCL2PCL_%s_3DEPN_ckpt'%(cat_name)) for cat_name in cat_names}
+
+def estimate_model_bytes(model_filename):
+    '''
+    a frozen .pb is loaded as is, for a checkpoint only the completion path variables are loaded
+    '''
+    if model_filename.endswith('.pb'):
+        return os.path.getsize(model_filename)
+    reader = tf.train.NewCheckpointReader(model_filename)
+    nb_bytes = 0
+    for var_name, var_shape in reader.get_variable_to_shape_map().items():
+        if var_name.split('/')[0] in COMPLETION_SCOPES:
+            nb_bytes += int(np.prod(var_shape)) * 4
+    return nb_bytes
+
+class CompletionModelRegistry:
+    '''
+    model_filenames: category -> checkpoint or frozen .pb filename
+    memory_budget_mb: max estimated memory of the loaded models, None for no limit
+    '''
+    def __init__(self, model_filenames=None, batch_size=24, memory_budget_mb=None, num_threads=0):
+        if model_filenames is None:
+            model_filenames = get_default_model_filenames()
+        self.model_filenames = model_filenames
+        self.batch_size = batch_size
+        self.memory_budget = memory_budget_mb * 1024 * 1024 if memory_budget_mb is not None else None
+        self.num_threads = num_threads
+
+        # loaded models, in least recently used order
+        self.models = collections.OrderedDict()
+        self.model_bytes = {}
+        # evicted models are closed once no batch is running on them
+        self.nb_running = collections.Counter()
+        self.evicted = set()
+        self.lock = threading.Lock()
+        # one lock per category, so loading one category does not block the others
+        self.cat_locks = {cat_name: threading.Lock() for cat_name in model_filenames}
+
+    def categories(self):
+        return list(self.model_filenames.keys())
+
+    def loaded_categories(self):
+        with self.lock:
+            return list(self.models.keys())
+
+    def _load(self, cat_name):
+        model_filename = self.model_filenames[cat_name]
+        print('Loading completion model of %s: %s'%(cat_name, model_filename))
+        if model_filename.endswith('.pb'):
+            return FrozenPCL2PCLCompleter(model_filename, batch_size=self.batch_size, num_threads=self.num_threads)
+        return PCL2PCLCompleter(model_filename, batch_size=self.batch_size)
+
+    def _evict(self, nb_bytes_needed):
+        '''
+        evict least recently used models until nb_bytes_needed fits into the budget, lock held by caller
+        '''
+        if self.memory_budget is None:
+            return
+        while len(self.models) > 0 and sum(self.model_bytes.values()) + nb_bytes_needed > self.memory_budget:
+            cat_name, completer = self.models.popitem(last=False)
+            del self.model_bytes[cat_name]
+            if self.nb_running[completer] > 0:
+                self.evicted.add(completer)
+            else:
+                completer.close()
+            print('Evicted completion model of %s'%(cat_name))
+
+    def _acquire(self, cat_name):
+        '''
+        return the completer of cat_name and mark it as running, load it if necessary
+        '''
+        if cat_name not in self.model_filenames:
+            raise KeyError('No completion model for category %s!'%(cat_name))
+
+        with self.lock:
+            if cat_name in self.models:
+                self.models.move_to_end(cat_name)
+                self.nb_running[self.models[cat_name]] += 1
+                return self.models[cat_name]
+
+        with self.cat_locks[cat_name]:
+            with self.lock:
+                # loaded by another thread while waiting
+                if cat_name in self.models:
+                    self.models.move_to_end(cat_name)
+                    self.nb_running[self.models[cat_name]] += 1
+                    return self.models[cat_name]
+            nb_bytes = estimate_model_bytes(self.model_filenames[cat_name])
+            completer = self._load(cat_name)
+            with self.lock:
+                self._evict(nb_bytes)
+                self.models[cat_name] = completer
+                self.model_bytes[cat_name] = nb_bytes
+                self.nb_running[completer] += 1
+            return completer
+
+    def _release(self, completer):
+        with self.lock:
+            self.nb_running[completer] -= 1
+            if self.nb_running[completer] == 0:
+                del self.nb_running[completer]
+                if completer in self.evicted:
+                    self.evicted.remove(completer)
+                    completer.close()
+
+    def complete_batch(self, cat_name, point_clouds):
+        completer = self._acquire(cat_name)
+        try:
+            return completer.complete_batch(point_clouds)
+        finally:
+            self._release(completer)
+
+    def close(self):
+        with self.lock:
+            for completer in self.models.values():
+                completer.close()
+            self.models.clear()
+            self.model_bytes.clear()
+
+class CategoryCompleter:
+    '''
+    completer facade of one category in a registry, can be used wherever a completer is expected
+    '''
+    def __init__(self, registry, cat_name):
+        self.registry = registry
+        self.cat_name = cat_name
+
+    def complete_batch(self, point_clouds):
+        return self.registry.complete_batch(self.cat_name, point_clouds)
+
+    def close(self):
+        pass
@@ -0,0 +1,221 @@
+'''
+    Local completion service with dynamic micro-batching.
+    Requests are queued and completed together, a batch is run as soon as it is full (batch_size clouds)
+    or the oldest queued request has waited for max_latency_ms.
+
+    CUDA_VISIBLE_DEVICES=0 python3 completion_server.py --ckpt path/to/model_1000.ckpt --port 8008
+    CUDA_VISIBLE_DEVICES=0 python3 completion_server.py --multi_category --memory_budget_mb 64 --port 8008
+    POST /complete  body: JSON {"points": [[x,y,z], ...]} or a .npy file (application/octet-stream)
+                    return: the completed point cloud in the same format
+    POST /complete?category=chair  with --multi_category, route to the model of the category
+    GET  /metrics   return: JSON with queue depth, batch fill ratio and p50/p99 latency
+'''
+import os
+import sys
+import io
+import json
+import time
+import queue
+import argparse
+import threading
+import collections
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR) # model
+from urllib.parse import urlparse, parse_qs
+from pcl2pcl_completer import PCL2PCLCompleter, FrozenPCL2PCLCompleter
+from completion_model_registry import CompletionModelRegistry, CategoryCompleter
+
+class CompletionRequest:
+    def __init__(self, points):
+        self.points = points
+        self.result = None
+        self.error = None
+        self.start_time = time.time()
+        self.done = threading.Event()
+
+class MicroBatcher:
+    '''
+    collect queued requests into batches and run them with one completer,
+    all model calls happen in a single worker thread
+    '''
+    def __init__(self, completer, batch_size=24, max_latency_ms=10, nb_latency_samples=1000):
+        self.completer = completer
+        self.batch_size = batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self.queue = queue.Queue()
+
+        # metrics
+        self.lock = threading.Lock()
+        self.latencies = collections.deque(maxlen=nb_latency_samples)
+        self.nb_batches = 0
+        self.nb_requests = 0
+        self.sum_fill_ratio = 0.0
+
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, points):
+        '''
+        blocking, return the completed point cloud
+        '''
+        req = CompletionRequest(points)
+        self.queue.put(req)
+        req.done.wait()
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def _next_batch(self):
+        requests = [self.queue.get()]
+        deadline = requests[0].start_time + self.max_latency
+        while len(requests) < self.batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                requests.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return requests
+
+    def _run(self):
+        while True:
+            requests = self._next_batch()
+            try:
+                recons = self.completer.complete_batch([req.points for req in requests])
+                for req_idx, req in enumerate(requests):
+                    req.result = recons[req_idx]
+            except Exception as e:
+                for req in requests:
+                    req.error = e
+
+            end_time = time.time()
+            with self.lock:
+                self.nb_batches += 1
+                self.nb_requests += len(requests)
+                self.sum_fill_ratio += len(requests) / float(self.batch_size)
+                for req in requests:
+                    self.latencies.append(end_time - req.start_time)
+            for req in requests:
+                req.done.set()
+
+    def get_metrics(self):
+        with self.lock:
+            latencies = np.array(self.latencies)
+            metrics = {
+                'queue_depth': self.queue.qsize(),
+                'nb_batches': self.nb_batches,
+                'nb_requests': self.nb_requests,
+                'batch_fill_ratio': self.sum_fill_ratio / self.nb_batches if self.nb_batches > 0 else 0.0,
+            }
+        if len(latencies) > 0:
+            metrics['latency_p50_ms'] = float(np.percentile(latencies, 50) * 1000)
+            metrics['latency_p99_ms'] = float(np.percentile(latencies, 99) * 1000)
+        return metrics
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def make_handler(batchers):
+    '''
+    batchers: category -> MicroBatcher, None as key for the single model server
+    '''
+    class CompletionHandler(BaseHTTPRequestHandler):
+        def _reply(self, code, body, content_type='application/json'):
+            self.send_response(code)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if urlparse(self.path).path != '/metrics':
+                self._reply(404, b'{"error": "not found"}')
+                return
+            if None in batchers:
+                metrics = batchers[None].get_metrics()
+            else:
+                metrics = {cat_name: b.get_metrics() for cat_name, b in batchers.items()}
+            self._reply(200, json.dumps(metrics).encode())
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != '/complete':
+                self._reply(404, b'{"error": "not found"}')
+                return
+            cat_name = parse_qs(url.query).get('category', [None])[0]
+            if None in batchers:
+                batcher = batchers[None]
+            elif cat_name in batchers:
+                batcher = batchers[cat_name]
+            else:
+                self._reply(404, json.dumps({'error': 'unknown category: %s'%(cat_name)}).encode())
+                return
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            is_npy = self.headers.get('Content-Type', '') == 'application/octet-stream'
+            try:
+                if is_npy:
+                    points = np.load(io.BytesIO(body))
+                else:
+                    points = np.array(json.loads(body.decode())['points'], dtype=np.float32)
+                assert(points.ndim == 2 and points.shape[1] >= 3 and points.shape[0] > 0)
+            except Exception as e:
+                self._reply(400, json.dumps({'error': 'invalid point cloud: %s'%(str(e))}).encode())
+                return
+
+            try:
+                recon = batcher.submit(points[:, :3])
+            except Exception as e:
+                self._reply(500, json.dumps({'error': str(e)}).encode())
+                return
+
+            if is_npy:
+                buf = io.BytesIO()
+                np.save(buf, recon)
+                self._reply(200, buf.getvalue(), content_type='application/octet-stream')
+            else:
+                self._reply(200, json.dumps({'points': recon.tolist()}).encode())
+
+        def log_message(self, format, *args):
+            pass # too chatty for high request rates
+
+    return CompletionHandler
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ckpt', default=None, help='pcl2pcl gan checkpoint, e.g. model_1000.ckpt')
+    parser.add_argument('--pb', default=None, help='frozen completion graph, used instead of --ckpt')
+    parser.add_argument('--host', default='127.0.0.1', help='bind address, localhost by default')
+    parser.add_argument('--port', type=int, default=8008, help='port to listen on')
+    parser.add_argument('--batch_size', type=int, default=24, help='max number of clouds completed together')
+    parser.add_argument('--max_latency_ms', type=float, default=10, help='max time a request waits for its batch to fill')
+    parser.add_argument('--multi_category', action='store_true', help='serve all categories of config.PCL2PCL_*_3DEPN_ckpt, loaded lazily')
+    parser.add_argument('--memory_budget_mb', type=float, default=None, help='with --multi_category, evict least recently used models above this')
+    FLAGS = parser.parse_args()
+
+    if FLAGS.multi_category:
+        completer = CompletionModelRegistry(batch_size=FLAGS.batch_size, memory_budget_mb=FLAGS.memory_budget_mb)
+        batchers = {cat_name: MicroBatcher(CategoryCompleter(completer, cat_name), batch_size=FLAGS.batch_size, max_latency_ms=FLAGS.max_latency_ms) for cat_name in completer.categories()}
+    else:
+        if FLAGS.pb is not None:
+            completer = FrozenPCL2PCLCompleter(FLAGS.pb, batch_size=FLAGS.batch_size)
+        elif FLAGS.ckpt is not None:
+            completer = PCL2PCLCompleter(FLAGS.ckpt, batch_size=FLAGS.batch_size)
+        else:
+            print('Error, either --ckpt or --pb should be provided.')
+            exit()
+        batchers = {None: MicroBatcher(completer, batch_size=FLAGS.batch_size, max_latency_ms=FLAGS.max_latency_ms)}
+
+    server = ThreadingHTTPServer((FLAGS.host, FLAGS.port), make_handler(batchers))
+    print('Completion server listening on %s:%d'%(FLAGS.host, FLAGS.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    completer.close()
@@ -93,6 +93,16 @@ AE_scannet_table_ckpt = os.path.join(PC2PC_DIR, 'run_real/run_scannet_table/ae/l
 ########################## AE ckpt - kitti car
 AE_kitti_car_ckpt = os.path.join(PC2PC_DIR, 'run_kitti/run_car/ae/log_kitti_ae_car_2019-03-18-21-31-29/ckpts/model_455.ckpt')
 
+######################### pcl2pcl gan ckpt - 3D-EPN, shared AE
+PCL2PCL_chair_3DEPN_ckpt = os.path.join(PC2PC_DIR, 'run/run_3D-EPN_pcl2pcl/run_chair/log_chair_pcl2pcl_gan_3D-EPN_hausdorff_sharedAE_2019-07-26-13-18-41/ckpts/model_1000.ckpt')
+PCL2PCL_table_3DEPN_ckpt = os.path.join(PC2PC_DIR, 'run/run_3D-EPN_pcl2pcl/run_table/log_table_pcl2pcl_gan_3D-EPN_hausdorff_sharedAE_2019-07-26-13-22-18/ckpts/model_1000.ckpt')
+PCL2PCL_plane_3DEPN_ckpt = os.path.join(PC2PC_DIR, 'run/run_3D-EPN_pcl2pcl/run_plane/log_plane_pcl2pcl_gan_3D-EPN_hausdorff_sharedAE_2019-07-26-13-23-10/ckpts/model_1000.ckpt')
+PCL2PCL_car_3DEPN_ckpt = os.path.join(PC2PC_DIR, 'run/run_3D-EPN_pcl2pcl/run_car/log_car_pcl2pcl_gan_3D-EPN_hausdorff_sharedAE_2019-07-26-13-26-42/ckpts/model_1000.ckpt')
+PCL2PCL_lamp_3DEPN_ckpt = os.path.join(PC2PC_DIR, 'run/run_3D-EPN_pcl2pcl/run_lamp/log_lamp_pcl2pcl_gan_3D-EPN_hausdorff_sharedAE_2019-07-28-13-55-06/ckpts/model_1000.ckpt')
+PCL2PCL_sofa_3DEPN_ckpt = os.path.join(PC2PC_DIR, 'run/run_3D-EPN_pcl2pcl/run_sofa/log_sofa_pcl2pcl_gan_3D-EPN_hausdorff_sharedAE_2019-07-27-15-52-20/ckpts/model_1000.ckpt')
+PCL2PCL_boat_3DEPN_ckpt = os.path.join(PC2PC_DIR, 'run/run_3D-EPN_pcl2pcl/run_boat/log_boat_pcl2pcl_gan_3D-EPN_hausdorff_sharedAE_2019-08-27-21-47-12/ckpts/model_1000.ckpt')
+PCL2PCL_dresser_3DEPN_ckpt = os.path.join(PC2PC_DIR, 'run/run_3D-EPN_pcl2pcl/run_dresser/log_dresser_pcl2pcl_gan_3D-EPN_hausdorff_sharedAE_2019-07-28-14-01-35/ckpts/model_1000.ckpt')
+
 if __name__ == '__main__':
         
     all_local_vars = locals().copy()
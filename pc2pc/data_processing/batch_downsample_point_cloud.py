@@ -1,4 +1,19 @@
+'''
+    Downsample all point clouds of a directory, to a rate or a fixed number of points.
+    mode:
+        random  - uniform random subset (no duplicated points)
+        voxel   - average of the points in every cell of a voxel grid, even density
+        fps     - farthest point sampling, O(N*npoint) per cloud
+        poisson - random subset with a min distance between points, even density
+
+    python3 batch_downsample_point_cloud.py --mode voxel --rate 0.125 --num_workers 8
+    python3 batch_downsample_point_cloud.py --mode fps --npoint 4096
+
+    A manifest (csv: filename, #input points, #output points) is written next to the output directory: <output_dir>_manifest.csv
+'''
 import os,sys
+import argparse
+import multiprocessing
 import numpy as np
 from tqdm import tqdm
 
@@ -7,33 +22,89 @@ ROOT_DIR = os.path.dirname(BASE_DIR)
 sys.path.append(os.path.join(ROOT_DIR, '../utils'))
 
 import pc_util
+import transform_point_clouds
 
-point_cloud_dir = '../data/ShapeNet_v1_point_cloud/03636649/point_cloud_clean_full'
-output_dir = '../data/ShapeNet_v1_point_cloud/03636649/point_cloud_clean_full_ds'
+parser = argparse.ArgumentParser()
+parser.add_argument('--input_dir', default='../data/ShapeNet_v1_point_cloud/03636649/point_cloud_clean_full', help='directory of the .ply point clouds')
+parser.add_argument('--output_dir', default=None, help='<input_dir>_ds by default')
+parser.add_argument('--mode', default='random', help='[random | voxel | fps | poisson]')
+parser.add_argument('--rate', type=float, default=0.125, help='down sample rate, used if --npoint is not given')
+parser.add_argument('--npoint', type=int, default=None, help='target number of points per cloud')
+parser.add_argument('--num_workers', type=int, default=multiprocessing.cpu_count(), help='number of worker processes')
+FLAGS = parser.parse_args()
+
+point_cloud_dir = FLAGS.input_dir
+output_dir = FLAGS.output_dir if FLAGS.output_dir is not None else point_cloud_dir + '_ds'
 if not os.path.exists(output_dir):
     os.makedirs(output_dir)
-down_sample_rate = 0.125
 
-ply_filename_list = [os.path.join(point_cloud_dir, f) for f in os.listdir(point_cloud_dir)]
-ply_filename_list.sort()
+def fit_cell_size(points, npoint, downsample_fn, nb_iters=16):
+    '''
+    bisect the cell size (voxel size or poisson radius) so that downsample_fn gives at least npoint points, as few as possible
+    '''
+    low, high = 0.0, np.linalg.norm(np.amax(points, axis=0) - np.amin(points, axis=0))
+    best = None
+    for _ in range(nb_iters):
+        size = (low + high) / 2.0
+        result = downsample_fn(size)
+        if len(result) >= npoint:
+            best = result
+            low = size
+        else:
+            high = size
+    return best
 
-for pf in tqdm(ply_filename_list):
-    points = pc_util.read_ply_xyz(pf)
+def downsample(points, npoint, mode):
+    if npoint >= points.shape[0]:
+        return points
+    if mode == 'random':
+        return points[np.random.choice(points.shape[0], npoint, replace=False)]
+    elif mode == 'fps':
+        return points[pc_util.farthest_point_sample(points, npoint, start_idx=np.random.randint(points.shape[0]))]
+    elif mode == 'voxel':
+        sampled_points = fit_cell_size(points, npoint, lambda size: pc_util.voxel_downsample_point_cloud(points, size))
+    elif mode == 'poisson':
+        sampled_points = fit_cell_size(points, npoint, lambda size: points[pc_util.poisson_disk_sample(points, size)])
+    else:
+        raise NotImplementedError('Mode %s not implemented!'%(mode))
+    if sampled_points is None:
+        return points
+    # trim the few extra points of the best cell size
+    return sampled_points[np.random.choice(sampled_points.shape[0], npoint, replace=False)]
 
-    choice = np.random.choice(points.shape[0], int(points.shape[0]*down_sample_rate))
+def downsample_one(pf):
+    '''
+    return: filename, #input points, #output points (0 if skipped)
+    '''
+    points = pc_util.read_ply_xyz(pf)
+    npoint = FLAGS.npoint if FLAGS.npoint is not None else int(points.shape[0]*FLAGS.rate)
 
-    sampled_points = points[choice]
+    sampled_points = downsample(points, npoint, FLAGS.mode)
 
     if sampled_points.shape[0] < 1000:
         print('Skip, probably empty scan. %s'%(pf))
-        continue
+        return os.path.basename(pf), points.shape[0], 0
 
     # ensure that the bbox is centerred at the original
-    pts_min = np.amin(sampled_points, axis=0, keepdims=True)
-    pts_max = np.amax(sampled_points, axis=0, keepdims=True)
-    bbox_center = (pts_min + pts_max) / 2.0
-    sampled_points = sampled_points - bbox_center
+    sampled_points = transform_point_clouds.recenter(sampled_points, mode='bbox')
 
     output_filename = os.path.join(output_dir, os.path.basename(pf))
     pc_util.write_ply(sampled_points, output_filename)
-    
\ No newline at end of file
+    return os.path.basename(pf), points.shape[0], sampled_points.shape[0]
+
+if __name__ == "__main__":
+    ply_filename_list = [os.path.join(point_cloud_dir, f) for f in os.listdir(point_cloud_dir) if f.endswith('.ply')]
+    ply_filename_list.sort()
+
+    # reseed every worker, forked workers would draw the same samples
+    pool = multiprocessing.Pool(FLAGS.num_workers, initializer=np.random.seed)
+    manifest = list(tqdm(pool.imap(downsample_one, ply_filename_list), total=len(ply_filename_list)))
+    pool.close()
+    pool.join()
+
+    # next to the output directory, so that it is not listed as a point cloud
+    with open(output_dir.rstrip('/') + '_manifest.csv', 'w') as f:
+        f.write('filename,input_points,output_points,mode\n')
+        for fn, nb_in, nb_out in manifest:
+            f.write('%s,%d,%d,%s\n'%(fn, nb_in, nb_out, FLAGS.mode))
+    print('Downsampled %d point clouds, %d skipped.'%(len(manifest), sum([nb_out == 0 for _, _, nb_out in manifest])))
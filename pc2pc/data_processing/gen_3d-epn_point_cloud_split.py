@@ -1,9 +1,11 @@
 import os, sys
-import numpy as np
-import pickle
 import shutil
 from tqdm import tqdm
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BASE_DIR))
+import dataset_manifest
+
 train_model_list_filename = '../data/3D-EPN_dataset/completion_train.txt'
 test_model_list_filename = '../data/3D-EPN_dataset/completion_test.txt'
 point_cloud_root = '../data/3D-EPN_dataset/tmp/shapenet_dim32_sdf_pc'
@@ -19,59 +21,23 @@ def gen_split_for(cls_id):
         if '.ply' in pf: shutil.move(src_filename, dst_filename)
     print('Total: %d'%(len(all_ply_filenames)))
 
+    # sets, so the lookup per file is O(1)
     train_line_list = [line.rstrip('\n') for line in open(train_model_list_filename)]
-    train_modelname_list = []
-    for tl in train_line_list:
-        if cls_id in tl:
-            train_modelname_list.append(tl.split('\\')[-1])
+    train_modelname_set = set([tl.split('\\')[-1] for tl in train_line_list if cls_id in tl])
     
     test_line_list = [line.rstrip('\n') for line in open(test_model_list_filename)]
-    test_modelname_list = []
-    for tl in test_line_list:
-        if cls_id in tl:
-            test_modelname_list.append(tl.split('\\')[-1])
+    test_modelname_set = set([tl.split('\\')[-1] for tl in test_line_list if cls_id in tl])
 
-    print('#train_model', len(train_modelname_list), '#test_model', len(test_modelname_list))
-    
-    train_ply_filenames = []
-    val_ply_filenames = []
-    trainval_ply_filenames = []
-    test_ply_filenames = []
-
-    for pf in all_ply_filenames:
-        cur_modelname = pf.split('_')[0]
-        
-        if cur_modelname in train_modelname_list:
-            odd = np.random.rand()
-            trainval_ply_filenames.append(pf)
-            if odd < 0.9:
-                train_ply_filenames.append(pf)
-            else:
-                val_ply_filenames.append(pf)
-        else:
-            test_ply_filenames.append(pf)
-
-    print('#trains: %d'%(len(train_ply_filenames)))
-    print('#vals: %d'%(len(val_ply_filenames)))
-    print('#trainvals: %d'%(len(trainval_ply_filenames)))
-    print('#tests: %d'%(len(test_ply_filenames)))
-
-    base_dir = os.path.dirname(class_point_cloud_dir)
-    base_name = os.path.basename(class_point_cloud_dir)
-    with open(os.path.join(base_dir, base_name+'_train_split.pickle'), 'wb') as pf:
-        pickle.dump(train_ply_filenames, pf)
-
-    with open(os.path.join(base_dir, base_name+'_val_split.pickle'), 'wb') as pf:
-        pickle.dump(val_ply_filenames, pf)
-
-    with open(os.path.join(base_dir, base_name+'_trainval_split.pickle'), 'wb') as pf:
-        pickle.dump(trainval_ply_filenames, pf)
-
-    with open(os.path.join(base_dir, base_name+'_test_split.pickle'), 'wb') as pf:
-        pickle.dump(test_ply_filenames, pf)
-
-    with open(os.path.join(base_dir, base_name+'_all_split.pickle'), 'wb') as pf:
-        pickle.dump(all_ply_filenames, pf)
+    print('#train_model', len(train_modelname_set), '#test_model', len(test_modelname_set))
+
+    def split_fn(model_id):
+        # 10% of the train models for validation, by hash of the model id
+        if model_id in train_modelname_set:
+            return 'val' if dataset_manifest.hash_fraction(model_id) >= 0.9 else 'train'
+        return 'test'
+
+    manifest = dataset_manifest.build_manifest(class_point_cloud_dir, split_fn)
+    dataset_manifest.write_manifest(manifest, class_point_cloud_dir)
     return
 
 gen_split_for('02958343')
@@ -1,4 +1,6 @@
 import os, sys
+import functools
+import multiprocessing
 import numpy as np
 from tqdm import tqdm
 import mcubes
@@ -9,26 +11,37 @@ sys.path.append(os.path.join(ROOT_DIR, 'utils'))
 import pc_util
 
 isoval = 0.5
+num_workers = multiprocessing.cpu_count()
 
 EPN_test_result_dir = '/workspace/cnncomplete/results'
 EP_test_label_filename = '/workspace/cnncomplete/data/h5_shapenet_dim32_sdf/test_file_label.txt'
 output_dir = os.path.join(ROOT_DIR, 'pc2pc', 'results', 'EPN_method_results')
 if not os.path.exists(output_dir): os.makedirs(output_dir)
 
-def get_gt_point_clouds(cls_id, model_name, sample_nb=2048):
+@functools.lru_cache(maxsize=16)
+def load_gt_point_cloud(cls_id, model_name):
+    '''
+    full gt point cloud of a model, read once per model, None if missing
+    '''
     SCAN_PC_DIR = '/workspace/pcl2pcl-gan/pc2pc/data/ShapeNet_v1_point_cloud'
     pc_dir = os.path.join(SCAN_PC_DIR, cls_id, 'point_cloud_clean')
 
     mn = model_name
     gt_pc_filename = os.path.join(pc_dir, mn+'_clean.ply')
     if not os.path.exists(gt_pc_filename):
-        print('GT points not found: %s'%(gt_pc_filename))        
-        return np.zeros((sample_nb, 3))
+        print('GT points not found: %s'%(gt_pc_filename))
+        return None
 
     gt_pc = pc_util.read_ply_xyz(gt_pc_filename)
     if 'v1' in SCAN_PC_DIR:
         # for v1 data, rotate it to align with v2 (-z face)
         gt_pc = pc_util.rotate_point_cloud_by_axis_angle(gt_pc, [0,1,0], 90)
+    return gt_pc
+
+def get_gt_point_clouds(cls_id, model_name, sample_nb=2048):
+    gt_pc = load_gt_point_cloud(cls_id, model_name)
+    if gt_pc is None:
+        return np.zeros((sample_nb, 3))
     gt_pc = pc_util.sample_point_cloud(gt_pc, sample_nb)
     
     return gt_pc
@@ -75,9 +88,7 @@ for tl in test_lineList:
     cls_id_list.append(cls_id)
     scan_name_list.append(scan_name.split('.')[0])
 
-test_name_list = os.listdir(EPN_test_result_dir)
-test_name_list.sort()
-for tn in tqdm(test_name_list):
+def convert_one_result(tn):
     test_idx = int(tn.split('.')[0])
 
     model_name = model_name_list[test_idx]
@@ -96,12 +107,24 @@ for tn in tqdm(test_name_list):
     recon_pc, _ = trimesh.sample.sample_surface(new_mesh, 2048)
     recon_pc = np.array(recon_pc)
 
-    # prepare to write out
+    # write out, folders are made beforehand
     output_pcloud_gt_dir = os.path.join(output_dir, cls_id, 'pcloud', 'gt')
     output_pcloud_re_dir = os.path.join(output_dir, cls_id, 'pcloud', 'reconstruction')
-    if not os.path.exists(output_pcloud_gt_dir): os.makedirs(output_pcloud_gt_dir)
-    if not os.path.exists(output_pcloud_re_dir): os.makedirs(output_pcloud_re_dir)
     gt_output_filename = os.path.join(output_pcloud_gt_dir, scan_name_list[test_idx]+'.ply')
     re_output_filename = os.path.join(output_pcloud_re_dir, scan_name_list[test_idx]+'.ply')
     pc_util.write_ply(gt_pc, gt_output_filename)
     pc_util.write_ply(recon_pc, re_output_filename)
+
+if __name__ == "__main__":
+    for cls_id in set(cls_id_list):
+        for sub_dir in ['gt', 'reconstruction']:
+            if not os.path.exists(os.path.join(output_dir, cls_id, 'pcloud', sub_dir)): os.makedirs(os.path.join(output_dir, cls_id, 'pcloud', sub_dir))
+
+    test_name_list = os.listdir(EPN_test_result_dir)
+    # results of the same model next to each other, so each worker mostly reads a gt once
+    test_name_list.sort(key=lambda tn: (cls_id_list[int(tn.split('.')[0])], model_name_list[int(tn.split('.')[0])], tn))
+    pool = multiprocessing.Pool(num_workers, initializer=np.random.seed)
+    for _ in tqdm(pool.imap(convert_one_result, test_name_list, chunksize=8), total=len(test_name_list)):
+        pass
+    pool.close()
+    pool.join()
@@ -1,10 +1,12 @@
 import os, sys
+import multiprocessing
 import numpy as np
 from transforms3d.axangles import axangle2aff
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(os.path.join(ROOT_DIR, 'pc2pc'))
 sys.path.append(os.path.join(ROOT_DIR, 'utils'))
 import pc_util
+import sdf_util
 import shapenet_pc_dataset
 import config
 import trimesh
@@ -16,8 +18,10 @@ from math import radians
 import pymesh
 
 cat_name = 'lamp'
-sdf_resolution = 32
+sdf_resolution = 32 # 32, 64 or 128
 sdf_scale = 1.0
+num_workers = multiprocessing.cpu_count()
+nb_query_workers = 1 if num_workers > 1 else -1 # cKDTree query threads per model
 
 cat_name2id = {
                 'plane': '02691156',
@@ -64,60 +68,15 @@ elif cat_name == 'table':
 if not os.path.exists(output_dir):
     os.makedirs(output_dir)
 
-def plane_which_side(pts_on_plane, plane_normal, query_pts):
-    d = - (plane_normal[0]*pts_on_plane[0] + plane_normal[1]*pts_on_plane[1] + plane_normal[2]*pts_on_plane[2])
-    res = np.dot(np.array([plane_normal[0], plane_normal[1], plane_normal[2], d]), np.array([query_pts[0], query_pts[1], query_pts[2], 1]))
-
-    if res > 0: 
-        return 1 # positive side
-    elif res == 0:
-        return 0 # on
-    else:
-        return -1 # negtive side
-
-def pc2df(pc, df_scale, df_resolution):
-    vox_len = df_scale / df_resolution
-    x_coords = np.linspace(-df_scale/2. + vox_len/2.,  df_scale/2. - vox_len/2., df_resolution)
-    y_coords = np.linspace(-df_scale/2. + vox_len/2.,  df_scale/2. - vox_len/2., df_resolution)
-    z_coords = np.linspace(-df_scale/2. + vox_len/2.,  df_scale/2. - vox_len/2., df_resolution)
-    xv, yv, zv = np.meshgrid(x_coords, y_coords, z_coords, indexing='ij')
-    xv = np.expand_dims(xv, axis=-1)
-    yv = np.expand_dims(yv, axis=-1)
-    zv = np.expand_dims(zv, axis=-1)
-    xyz_center_arr = np.concatenate((xv, yv, zv), axis=-1)
-
-    sdf_volumn = np.ones((df_resolution, df_resolution, df_resolution)) # channels for distance and sign
-
-    tree = spatial.cKDTree(pc)
-    # 
-    print('Querying all points...')
-    distances, pts_indices = tree.query(np.reshape(xyz_center_arr, (-1, 3)))
-    distances = np.reshape(distances, (df_resolution, df_resolution, df_resolution))
-    pts_indices = np.reshape(pts_indices, (df_resolution, df_resolution, df_resolution))
-    print('Querying done.')
-
-    for i in range(df_resolution):
-        for j in range(df_resolution):
-            for k in range(df_resolution):
-                xyz_center = xyz_center_arr[i, j, k]
-                dist, pts_idx = distances[i,j,k], pts_indices[i,j,k]
-                target_pts = pc[pts_idx, :3]
-                sdf_volumn[i, j, k] = dist
-    
-    return sdf_volumn
-
 def mesh_from_volumedata(v, level=0., spacing=[1.]*3):
     verts, faces, normals_, values = skimage.measure.marching_cubes_lewiner(v, level=level, spacing=spacing)
     mesh = trimesh.Trimesh(vertices=verts, faces=faces)
     return mesh
 
-sdf_data = []
-model_id_list = []
-model_list = os.listdir(input_point_cloud_dir)
-model_list.sort()
-for model_name in model_list:
-    #if '90c6d1df1f83329fe1181b0e584cdf9b_clean' not in model_name: continue
-
+def process_one_model(model_name):
+    '''
+    return: model id, 2 x R x R x R sdf volume
+    '''
     model_id = model_name.split('_')[0]
     input_pc_filename = os.path.join(input_point_cloud_dir, model_name)
     gt_mesh_filename = os.path.join(mesh_dir, model_id, 'model.obj')
@@ -140,80 +99,38 @@ for model_name in model_list:
     gt_mesh_point_normals = pc_util.rotate_point_cloud_by_axis_angle(gt_mesh_point_normals, [0,1,0], -90)
     #pc_util.write_ply_versatile(gt_mesh_points, os.path.join(output_dir, model_id+'_gt_points_0.ply'), normals=gt_mesh_point_normals)
 
-    gt_df = pc2df(gt_mesh_points, 1, 128)
+    gt_df = sdf_util.compute_df_volume(gt_mesh_points, 1, 128, nb_query_workers=nb_query_workers)
     gt_mesh_recon = mesh_from_volumedata(gt_df, level=0.01, spacing=[1/128]*3)
     gt_mesh_recon.apply_translation([-0.5,-0.5,-0.5])
     #gt_mesh_recon.export(os.path.join(output_dir, model_id+'_meshfromdf.ply'))
     gt_mesh_points, gt_mesh_sample_fidx  = trimesh.sample.sample_surface(gt_mesh_recon, 20480)
     gt_mesh_point_normals = gt_mesh_recon.face_normals[gt_mesh_sample_fidx]
     #pc_util.write_ply_versatile(gt_mesh_points, os.path.join(output_dir, model_id+'_gt_points_1.ply'), normals=gt_mesh_point_normals)
-    
+
     # get normals for input pc from gt points
-    #print('Querying all input points...')
     gt_tree = spatial.cKDTree(gt_mesh_points)
-    distances, pts_indices = gt_tree.query(input_pc)
+    distances, pts_indices = gt_tree.query(input_pc, workers=nb_query_workers)
     input_pc_normals = gt_mesh_point_normals[pts_indices]
     #pc_util.write_ply_versatile(input_pc, os.path.join(output_dir, model_id+'_input_points.ply'), normals=input_pc_normals)
-    print('Querying done.')
 
-    # get centers of volumn voxels
-    vox_len = sdf_scale / sdf_resolution
-    x_coords = np.linspace(-sdf_scale/2. + vox_len/2.,  sdf_scale/2. - vox_len/2., sdf_resolution)
-    y_coords = np.linspace(-sdf_scale/2. + vox_len/2.,  sdf_scale/2. - vox_len/2., sdf_resolution)
-    z_coords = np.linspace(-sdf_scale/2. + vox_len/2.,  sdf_scale/2. - vox_len/2., sdf_resolution)
-    xv, yv, zv = np.meshgrid(x_coords, y_coords, z_coords, indexing='ij')
-    xv = np.expand_dims(xv, axis=-1)
-    yv = np.expand_dims(yv, axis=-1)
-    zv = np.expand_dims(zv, axis=-1)
-    xyz_center_arr = np.concatenate((xv, yv, zv), axis=-1)
+    sdf_volumn = sdf_util.compute_sdf_volume(input_pc, input_pc_normals, sdf_scale, sdf_resolution, nb_query_workers=nb_query_workers)
 
-    sdf_volumn = np.ones((sdf_resolution, sdf_resolution, sdf_resolution, 2)) # channels for distance and sign
-
-    tree = spatial.cKDTree(input_pc) 
-    # 
-    print('Querying all points...')
-    distances, pts_indices = tree.query(np.reshape(xyz_center_arr, (-1, 3)))
-    distances = np.reshape(distances, (sdf_resolution, sdf_resolution, sdf_resolution))
-    pts_indices = np.reshape(pts_indices, (sdf_resolution, sdf_resolution, sdf_resolution))
-    print('Querying done.')
-
-    for i in tqdm(range(sdf_resolution)):
-        for j in range(sdf_resolution):
-            for k in range(sdf_resolution):
-                xyz_center = xyz_center_arr[i, j, k]
-                dist, pts_idx = distances[i,j,k], pts_indices[i,j,k]
-
-                # debug
-                target_pts = input_pc[pts_idx, :3]
-                #target_pts = gt_mesh_points[pts_idx, :3]
-                target_nor = input_pc_normals[pts_idx, :3]
-                #target_nor = gt_mesh_point_normals[pts_idx, :3]
-
-                # check the sign of distance
-                side = plane_which_side(target_pts, target_nor, xyz_center)
-
-                sdf_volumn[i, j, k, 0] = dist / vox_len # sdf in voxel space
-                sdf_volumn[i, j, k, 1] = 1.
-                if side == 1: # positive side
-                    sdf_volumn[i, j, k, 0] *= -1. 
-                    sdf_volumn[i, j, k, 1] = -1.
-                else:
-                    sdf_volumn[i, j, k, 0] *= 1.
-                    sdf_volumn[i, j, k, 1] = 1.
-    
     verts, faces, normals_, values = skimage.measure.marching_cubes_lewiner(sdf_volumn[:,:,:,0], level=0.02, spacing=[1.] * 3)
     mesh = trimesh.Trimesh(vertices=verts, faces=faces)
     mesh.export(os.path.join(output_dir, model_id+'_sdf_recon.ply'))
-    
-    sdf_for_epn = np.moveaxis(sdf_volumn, -1, 0)
-    sdf_data.append(sdf_for_epn)
-    model_id_list.append(model_id)
 
-sdf_data = np.array(sdf_data)
-print(sdf_data.shape)
-hf = h5py.File(os.path.join(output_dir, 'data.h5'), 'w')
-hf.create_dataset('data', data=sdf_data)
-with open(os.path.join(output_dir, 'names.txt'), 'w') as f:
-    for item in model_id_list:
-        f.write("%s\n" % item)
-hf.close()
+    sdf_for_epn = np.moveaxis(sdf_volumn, -1, 0)
+    return model_id, sdf_for_epn
+
+if __name__ == "__main__":
+    model_list = os.listdir(input_point_cloud_dir)
+    model_list.sort()
+
+    # volumes are appended in model order as they finish
+    writer = sdf_util.SDFWriter(os.path.join(output_dir, 'data.h5'), sdf_resolution, write_names=True)
+    pool = multiprocessing.Pool(num_workers)
+    for model_id, sdf_for_epn in tqdm(pool.imap(process_one_model, model_list), total=len(model_list)):
+        writer.append(sdf_for_epn, model_id)
+    pool.close()
+    pool.join()
+    writer.close()
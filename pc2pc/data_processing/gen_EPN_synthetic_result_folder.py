@@ -1,4 +1,5 @@
 import os, sys
+import multiprocessing
 import numpy as np
 from tqdm import tqdm
 import mcubes
@@ -11,6 +12,7 @@ from shutil import copyfile
 
 cat_name = 'plane'
 isoval = 0.5
+num_workers = multiprocessing.cpu_count()
 
 EPN_test_result_dir = '/workspace/cnncomplete/results_synthetic_'+cat_name
 EPN_test_name_filename = '/workspace/pcl2pcl-gan/pc2pc/data_processing/synthetic_input_sdf/%s/names.txt'%(cat_name)
@@ -62,10 +64,11 @@ with open(EPN_test_name_filename) as f:
     model_name_list = f.readlines()
     # you may also want to remove whitespace characters like `\n` at the end of each line
     model_name_list = [x.strip()+'_clean.ply' for x in model_name_list]
-volumn_name_list = os.listdir(EPN_test_result_dir)
-for vname in volumn_name_list:
-    if not vname.endswith('.npy'): continue
+output_pcloud_in_dir = os.path.join(output_dir, 'pcloud', 'input')
+output_pcloud_gt_dir = os.path.join(output_dir, 'pcloud', 'gt')
+output_pcloud_re_dir = os.path.join(output_dir, 'pcloud', 'reconstruction')
 
+def convert_one_volume(vname):
     v_idxname = int(vname.split('.')[0])
     model_name = model_name_list[v_idxname]
 
@@ -80,26 +83,30 @@ for vname in volumn_name_list:
     recon_pc, _ = trimesh.sample.sample_surface(mesh, 2048)
     recon_pc = np.array(recon_pc)
 
-    output_pcloud_in_dir = os.path.join(output_dir, 'pcloud', 'input')
-    if not os.path.exists(output_pcloud_in_dir): os.makedirs(output_pcloud_in_dir)
     in_output_filename = os.path.join(output_pcloud_in_dir, model_name)
     in_source_filename = os.path.join(EPN_input_dir, model_name)
     if not os.path.exists(in_source_filename):
         print('Skip: ', in_source_filename)
-        continue
+        return
     copyfile(in_source_filename, in_output_filename)
 
-    output_pcloud_gt_dir = os.path.join(output_dir, 'pcloud', 'gt')
-    if not os.path.exists(output_pcloud_gt_dir): os.makedirs(output_pcloud_gt_dir)
     gt_output_filename = os.path.join(output_pcloud_gt_dir, model_name)
     gt_source_filename = os.path.join(EPN_gt_dir, model_name)
     if not os.path.exists(gt_source_filename):
         print('Skip: ', gt_source_filename)
-        continue
+        return
     copyfile(gt_source_filename, gt_output_filename)
 
-    output_pcloud_re_dir = os.path.join(output_dir, 'pcloud', 'reconstruction')
-    if not os.path.exists(output_pcloud_re_dir): os.makedirs(output_pcloud_re_dir)
     re_output_filename = os.path.join(output_pcloud_re_dir, model_name)
     pc_util.write_ply(recon_pc, re_output_filename)
-    
\ No newline at end of file
+
+if __name__ == "__main__":
+    for d in [output_pcloud_in_dir, output_pcloud_gt_dir, output_pcloud_re_dir]:
+        if not os.path.exists(d): os.makedirs(d)
+
+    volumn_name_list = [vname for vname in os.listdir(EPN_test_result_dir) if vname.endswith('.npy')]
+    pool = multiprocessing.Pool(num_workers, initializer=np.random.seed)
+    for _ in tqdm(pool.imap_unordered(convert_one_volume, volumn_name_list), total=len(volumn_name_list)):
+        pass
+    pool.close()
+    pool.join()
@@ -0,0 +1,210 @@
+'''
+    Run a per-item function over many items (e.g. model folders) with a pool of worker processes.
+    Job states are kept in a SQLite table, so an interrupted or crashed run resumes where it stopped.
+    Items are handed out one at a time to idle workers, a worker running an item for longer than
+    the timeout (or dying on it) is restarted and the item is retried up to max_attempts times.
+
+    import job_queue
+    job_queue.run_jobs(process_one_item, items, 'jobs.db', num_workers=15, timeout=600)
+
+    func must take a single item (a string) and raise on failure, its return value is ignored.
+'''
+import os
+import sys
+import time
+import sqlite3
+import traceback
+import multiprocessing
+from multiprocessing.connection import wait
+
+import numpy as np
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+class JobTable:
+    '''
+    persistent job states, only used from the main process
+    '''
+    def __init__(self, db_filename):
+        self.db_filename = db_filename
+        self.conn = sqlite3.connect(db_filename)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                          'item TEXT PRIMARY KEY, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, '
+                          'error TEXT, elapsed REAL)')
+        self.conn.commit()
+
+    def add_items(self, items):
+        '''
+        new items are pending, known items keep their state
+        '''
+        self.conn.executemany('INSERT OR IGNORE INTO jobs (item, status) VALUES (?, ?)', [(str(it), PENDING) for it in items])
+        self.conn.commit()
+
+    def reset(self, retry_failed=False):
+        '''
+        items left running by a crashed run are pending again, also failed ones with retry_failed
+        '''
+        self.conn.execute('UPDATE jobs SET status=? WHERE status=?', (PENDING, RUNNING))
+        if retry_failed:
+            self.conn.execute('UPDATE jobs SET status=?, attempts=0 WHERE status=?', (PENDING, FAILED))
+        self.conn.commit()
+
+    def claim_next(self):
+        '''
+        mark the first pending item as running and return it, None if nothing is pending
+        '''
+        row = self.conn.execute('SELECT item FROM jobs WHERE status=? ORDER BY rowid LIMIT 1', (PENDING,)).fetchone()
+        if row is None:
+            return None
+        self.conn.execute('UPDATE jobs SET status=?, attempts=attempts+1 WHERE item=?', (RUNNING, row[0]))
+        self.conn.commit()
+        return row[0]
+
+    def finish(self, item, elapsed, error=None, max_attempts=1):
+        if error is None:
+            self.conn.execute('UPDATE jobs SET status=?, error=NULL, elapsed=? WHERE item=?', (DONE, elapsed, item))
+        else:
+            attempts = self.conn.execute('SELECT attempts FROM jobs WHERE item=?', (item,)).fetchone()[0]
+            status = PENDING if attempts < max_attempts else FAILED
+            self.conn.execute('UPDATE jobs SET status=?, error=?, elapsed=? WHERE item=?', (status, error, elapsed, item))
+        self.conn.commit()
+
+    def counts(self):
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for status, nb in self.conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status'):
+            counts[status] = nb
+        return counts
+
+    def failed_items(self):
+        return self.conn.execute('SELECT item, error FROM jobs WHERE status=?', (FAILED,)).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+def _worker_loop(func, conn, log_filename):
+    np.random.seed() # forked workers would share the random state of the main process
+    if log_filename is not None:
+        log_file = open(log_filename, 'a', buffering=1)
+        sys.stdout = log_file
+        sys.stderr = log_file
+    while True:
+        item = conn.recv()
+        if item is None:
+            break
+        start_time = time.time()
+        try:
+            func(item)
+            error = None
+        except Exception:
+            error = traceback.format_exc()
+            print(error)
+        conn.send((item, time.time() - start_time, error))
+
+class _Worker:
+    def __init__(self, func, worker_id, log_dir):
+        self.conn, child_conn = multiprocessing.Pipe()
+        log_filename = os.path.join(log_dir, 'log%d.txt'%(worker_id)) if log_dir is not None else None
+        self.process = multiprocessing.Process(target=_worker_loop, args=(func, child_conn, log_filename), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.item = None
+        self.start_time = None
+
+    def send(self, item):
+        self.item = item
+        self.start_time = time.time()
+        self.conn.send(item)
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join()
+
+def print_progress(counts, nb_finished, start_time):
+    elapsed = time.time() - start_time
+    throughput = nb_finished / elapsed if elapsed > 0 else 0.0
+    remaining = counts[PENDING] + counts[RUNNING]
+    eta = '%.1f min'%(remaining / throughput / 60.0) if throughput > 0 else '-'
+    print('[%s] done: %d, failed: %d, running: %d, pending: %d | %.2f items/s, ETA: %s'%(
+          time.strftime('%H:%M:%S'), counts[DONE], counts[FAILED], counts[RUNNING], counts[PENDING], throughput, eta))
+    sys.stdout.flush()
+
+def run_jobs(func, items, db_filename, num_workers=4, timeout=None, max_attempts=2, retry_failed=False, log_dir=None, report_interval=30):
+    '''
+    func: per-item function, module level so workers can run it
+    items: all items of the run, items already done in db_filename are skipped
+    timeout: max seconds for one item, None for no limit
+    log_dir: redirect the output of worker i to log_dir/log<i>.txt, None to keep it on the console
+    return: job counts by state
+    '''
+    if log_dir is not None and not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+    table = JobTable(db_filename)
+    table.add_items(items)
+    table.reset(retry_failed=retry_failed)
+    print_progress(table.counts(), 0, time.time())
+
+    workers = [_Worker(func, w_id, log_dir) for w_id in range(num_workers)]
+    nb_finished = 0
+    start_time = time.time()
+    last_report = start_time
+    try:
+        while True:
+            # hand out items to idle workers
+            for worker in workers:
+                if worker.item is None:
+                    item = table.claim_next()
+                    if item is None:
+                        break
+                    worker.send(item)
+            busy = [w for w in workers if w.item is not None]
+            if len(busy) == 0:
+                break
+
+            for conn in wait([w.conn for w in busy], timeout=1.0):
+                worker = [w for w in busy if w.conn is conn][0]
+                try:
+                    item, elapsed, error = conn.recv()
+                except EOFError:
+                    continue # died, handled below
+                table.finish(item, elapsed, error, max_attempts)
+                worker.item = None
+                nb_finished += 1
+
+            # restart workers that timed out or died on their item
+            for w_id, worker in enumerate(workers):
+                if worker.item is None:
+                    continue
+                elapsed = time.time() - worker.start_time
+                if timeout is not None and elapsed > timeout:
+                    error = 'timeout after %.1f s'%(elapsed)
+                elif not worker.process.is_alive():
+                    error = 'worker died with exit code %s'%(worker.process.exitcode)
+                else:
+                    continue
+                print('%s: %s'%(worker.item, error))
+                worker.kill()
+                table.finish(worker.item, elapsed, error, max_attempts)
+                nb_finished += 1
+                workers[w_id] = _Worker(func, w_id, log_dir)
+
+            if time.time() - last_report > report_interval:
+                print_progress(table.counts(), nb_finished, start_time)
+                last_report = time.time()
+    finally:
+        for worker in workers:
+            if worker.item is None and worker.process.is_alive():
+                worker.conn.send(None)
+            else:
+                worker.kill()
+        for worker in workers:
+            worker.process.join()
+
+    counts = table.counts()
+    print_progress(counts, nb_finished, start_time)
+    for item, error in table.failed_items():
+        print('Failed: %s\n%s'%(item, error))
+    table.close()
+    return counts
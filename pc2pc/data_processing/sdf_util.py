@@ -0,0 +1,78 @@
+'''
+    Batched (signed) distance field volumes from oriented points, shared by gen_EPN_sdf_from_pc.py and gen_EPN_sdf_from_mesh.py.
+    All voxel centers are queried against a cKDTree in chunks, the sign of all voxels is computed with one einsum.
+'''
+import os
+import numpy as np
+from scipy import spatial
+import h5py
+
+def get_voxel_centers(sdf_scale, sdf_resolution, indexing='ij'):
+    '''
+    return: sdf_resolution^3 x 3, centers of the voxels of a cube of size sdf_scale centered at the origin
+    '''
+    vox_len = sdf_scale / sdf_resolution
+    coords = np.linspace(-sdf_scale/2. + vox_len/2.,  sdf_scale/2. - vox_len/2., sdf_resolution)
+    xv, yv, zv = np.meshgrid(coords, coords, coords, indexing=indexing)
+    return np.stack((xv, yv, zv), axis=-1).reshape(-1, 3)
+
+def query_nearest(points, query_points, chunk_size=262144, nb_query_workers=-1):
+    '''
+    nearest point of every query point, in chunks to bound memory at 64^3/128^3
+    nb_query_workers: threads of cKDTree.query, -1 for all cores, use 1 inside a process pool
+    '''
+    tree = spatial.cKDTree(points)
+    distances = np.empty(query_points.shape[0])
+    pts_indices = np.empty(query_points.shape[0], dtype=np.int64)
+    for start_idx in range(0, query_points.shape[0], chunk_size):
+        end_idx = start_idx + chunk_size
+        distances[start_idx:end_idx], pts_indices[start_idx:end_idx] = tree.query(query_points[start_idx:end_idx], workers=nb_query_workers)
+    return distances, pts_indices
+
+def compute_df_volume(points, df_scale=1.0, df_resolution=32, nb_query_workers=-1):
+    '''
+    unsigned distance to the nearest point for all voxels
+    return: df_resolution x df_resolution x df_resolution
+    '''
+    centers = get_voxel_centers(df_scale, df_resolution)
+    distances, _ = query_nearest(points[:, :3], centers, nb_query_workers=nb_query_workers)
+    return distances.reshape(df_resolution, df_resolution, df_resolution)
+
+def compute_sdf_volume(points, normals, sdf_scale=1.0, sdf_resolution=32, indexing='ij', nb_query_workers=-1):
+    '''
+    signed distance in voxel space for all voxels, the sign is given by the side of the tangent plane of the nearest point:
+    negative on the side the normal points to.
+    return: sdf_resolution x sdf_resolution x sdf_resolution x 2, channels for distance and sign
+    '''
+    vox_len = sdf_scale / sdf_resolution
+    centers = get_voxel_centers(sdf_scale, sdf_resolution, indexing)
+    distances, pts_indices = query_nearest(points[:, :3], centers, nb_query_workers=nb_query_workers)
+
+    side = np.einsum('ij,ij->i', normals[pts_indices, :3], centers - points[pts_indices, :3])
+    sign = np.where(side > 0, -1., 1.)
+    sdf_volumn = np.stack((distances / vox_len * sign, sign), axis=-1)
+    return sdf_volumn.reshape(sdf_resolution, sdf_resolution, sdf_resolution, 2)
+
+class SDFWriter:
+    '''
+    append sdf volumes (2 x R x R x R each) to a chunked, resizable 'data' dataset as they are computed,
+    names (if any) are written to names.txt next to the h5 file
+    '''
+    def __init__(self, h5_filename, sdf_resolution, write_names=False):
+        shape = (2, sdf_resolution, sdf_resolution, sdf_resolution)
+        self.hf = h5py.File(h5_filename, 'w')
+        self.dataset = self.hf.create_dataset('data', shape=(0,)+shape, maxshape=(None,)+shape, chunks=(1,)+shape, dtype='f8')
+        self.names_file = open(os.path.join(os.path.dirname(h5_filename), 'names.txt'), 'w') if write_names else None
+
+    def append(self, sdf_for_epn, name=None):
+        nb_volumes = self.dataset.shape[0]
+        self.dataset.resize(nb_volumes + 1, axis=0)
+        self.dataset[nb_volumes] = sdf_for_epn
+        if self.names_file is not None:
+            self.names_file.write("%s\n" % name)
+
+    def close(self):
+        print(self.dataset.shape)
+        self.hf.close()
+        if self.names_file is not None:
+            self.names_file.close()
@@ -0,0 +1,131 @@
+'''
+    Apply a chain of transforms to all point clouds under a directory, with a pool of worker processes.
+    The output directory mirrors the input tree, outputs newer than their inputs are skipped (unless --overwrite).
+
+    transforms, applied in the given order:
+        rotate:x,y,z,deg      - rotate by deg degrees about the axis (x,y,z)
+        recenter[:mode]       - move the bbox center (bbox), the bbox bottom center (bottom) or the mean (mean) to the origin
+        normalize[:tol]       - scale into the unit cube [-.5,.5] centered at the origin, tol leaves a margin
+        sample:npoint         - random sample of npoint points, with replacement if there are less points
+        noise:sigma           - add gaussian noise with deviation sigma
+
+    python3 transform_point_clouds.py --input_dir ../data/3D-EPN_dataset/test-images_dim32_sdf_pc --output_dir ../data/3D-EPN_dataset/test-images_dim32_sdf_pc_processed --transforms rotate:0,1,0,90
+    python3 transform_point_clouds.py --input_dir in_dir --output_dir out_dir --transforms sample:2048 recenter normalize noise:0.01
+
+    import transform_point_clouds
+    transform_point_clouds.transform_tree(input_dir, output_dir, transform_point_clouds.parse_transforms(['rotate:0,1,0,90']))
+'''
+import os,sys
+import argparse
+import functools
+import multiprocessing
+import numpy as np
+from tqdm import tqdm
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+sys.path.append(os.path.join(ROOT_DIR, '../utils'))
+import pc_util
+
+def rotate(points, axis, angle_deg):
+    return pc_util.rotate_point_cloud_by_axis_angle(points, axis, angle_deg)
+
+def recenter(points, mode='bbox'):
+    if mode == 'bbox':
+        pts_min = np.amin(points, axis=0, keepdims=True)
+        pts_max = np.amax(points, axis=0, keepdims=True)
+        return points - (pts_min + pts_max) / 2.0
+    elif mode == 'bottom':
+        return pc_util.point_cloud_bottom_center2ori(points)
+    elif mode == 'mean':
+        return pc_util.point_cloud_center2ori(points)
+    raise NotImplementedError('Recenter mode %s not implemented!'%(mode))
+
+def normalize(points, tol=0.0):
+    return pc_util.point_cloud_normalized(points[np.newaxis, ...], tol)[0]
+
+def sample(points, npoint):
+    return pc_util.sample_point_cloud(points, npoint)
+
+def noise(points, sigma):
+    return pc_util.add_gaussian_noise(points, 0, sigma)
+
+def parse_transform(spec):
+    '''
+    'name:arg1,arg2' -> function of the points only, picklable for the pool
+    '''
+    name, _, arg_str = spec.partition(':')
+    args = arg_str.split(',') if arg_str != '' else []
+    if name == 'rotate':
+        axis = [float(a) for a in args[:3]]
+        return functools.partial(rotate, axis=axis, angle_deg=float(args[3]))
+    elif name == 'recenter':
+        return functools.partial(recenter, mode=args[0] if len(args) > 0 else 'bbox')
+    elif name == 'normalize':
+        return functools.partial(normalize, tol=float(args[0]) if len(args) > 0 else 0.0)
+    elif name == 'sample':
+        return functools.partial(sample, npoint=int(args[0]))
+    elif name == 'noise':
+        return functools.partial(noise, sigma=float(args[0]))
+    raise NotImplementedError('Transform %s not implemented!'%(name))
+
+def parse_transforms(specs):
+    return [parse_transform(spec) for spec in specs]
+
+def apply_transforms(points, transforms):
+    for transform in transforms:
+        points = transform(points)
+    return points
+
+def is_up_to_date(input_filename, output_filename):
+    return os.path.exists(output_filename) and os.path.getmtime(output_filename) >= os.path.getmtime(input_filename)
+
+def transform_one(filename_pair, transforms):
+    input_filename, output_filename = filename_pair
+    points = pc_util.read_ply_xyz(input_filename)
+    pc_util.write_ply(apply_transforms(points, transforms), output_filename)
+
+def list_filename_pairs(input_dir, output_dir, ext='.ply'):
+    '''
+    (input, output) filenames of all point clouds under input_dir, output filenames mirror the input tree
+    '''
+    filename_pairs = []
+    for cur_dir, _, filenames in os.walk(input_dir):
+        for fn in filenames:
+            if fn.endswith(ext):
+                input_filename = os.path.join(cur_dir, fn)
+                filename_pairs.append((input_filename, os.path.join(output_dir, os.path.relpath(input_filename, input_dir))))
+    filename_pairs.sort()
+    return filename_pairs
+
+def transform_tree(input_dir, output_dir, transforms, num_workers=multiprocessing.cpu_count(), overwrite=False):
+    '''
+    transforms: list of functions of the points, see parse_transforms
+    return: #written, #skipped
+    '''
+    filename_pairs = list_filename_pairs(input_dir, output_dir)
+    todo_pairs = [fp for fp in filename_pairs if overwrite or not is_up_to_date(fp[0], fp[1])]
+    print('#point clouds: %d, up to date: %d'%(len(filename_pairs), len(filename_pairs) - len(todo_pairs)))
+
+    for out_dir in set([os.path.dirname(fp[1]) for fp in todo_pairs]):
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+
+    # reseed every worker, forked workers would draw the same samples and noise
+    pool = multiprocessing.Pool(num_workers, initializer=np.random.seed)
+    list(tqdm(pool.imap_unordered(functools.partial(transform_one, transforms=transforms), todo_pairs, chunksize=8), total=len(todo_pairs)))
+    pool.close()
+    pool.join()
+    return len(todo_pairs), len(filename_pairs) - len(todo_pairs)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input_dir', required=True, help='root of the .ply point clouds, searched recursively')
+    parser.add_argument('--output_dir', required=True, help='root of the mirrored output tree')
+    parser.add_argument('--transforms', nargs='+', required=True, help='chain of transforms, e.g. rotate:0,1,0,90 recenter normalize:0.05 sample:2048 noise:0.01')
+    parser.add_argument('--num_workers', type=int, default=multiprocessing.cpu_count(), help='number of worker processes')
+    parser.add_argument('--overwrite', action='store_true', help='also transform point clouds whose outputs are up to date')
+    FLAGS = parser.parse_args()
+
+    nb_written, nb_skipped = transform_tree(FLAGS.input_dir, FLAGS.output_dir, parse_transforms(FLAGS.transforms), FLAGS.num_workers, FLAGS.overwrite)
+    print('Transformed %d point clouds, %d up to date.'%(nb_written, nb_skipped))
@@ -1,8 +1,33 @@
+'''
+    Virtual scan all objects of a category with a pool of workers, see job_queue.py.
+    Models are scheduled one at a time to idle workers, run the same command again to resume an interrupted run.
+
+    python3 virtual_scan_multiple_workers.py --num_workers 15
+'''
 import os
+import importlib
+import argparse
+
+import job_queue
+scan = importlib.import_module('virtual_scan_shapenet-v1_objects')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_workers', type=int, default=15, help='number of worker processes')
+    parser.add_argument('--timeout', type=float, default=1800, help='max seconds to scan one model')
+    parser.add_argument('--max_attempts', type=int, default=2, help='max attempts per model')
+    parser.add_argument('--retry_failed', action='store_true', help='retry models that failed in previous runs')
+    parser.add_argument('--jobs_db', default=None, help='job table, virtual_scan_<synset id>.db by default')
+    parser.add_argument('--log_dir', default='virtual_scan_logs', help='worker logs')
+    FLAGS = parser.parse_args()
 
-num_workers = 15
+    if not os.path.exists(scan.OUTPUT_DATA_PATH):
+        os.makedirs(scan.OUTPUT_DATA_PATH)
+    jobs_db = FLAGS.jobs_db if FLAGS.jobs_db is not None else 'virtual_scan_%s.db'%(scan.cat_synset_id)
 
-for i in range(0,num_workers):
-    #a = 'nohup python3 virtual_scan_shapenet_objects.py --worker_id %d --num_workers %d > log%d.txt 2>&1 &' % (i, num_workers, i)
-    a = 'nohup python3 virtual_scan_shapenet-v1_objects.py --worker_id %d --num_workers %d > log%d.txt 2>&1 &' % (i, num_workers, i)
-    os.system(a)
\ No newline at end of file
+    cat_dir = os.path.join(scan.SHAPENET_V2_PATH, scan.cat_synset_id)
+    object_folders = [os.path.join(cat_dir, dir) for dir in sorted(os.listdir(cat_dir))]
+    print('#Model: %d' % (len(object_folders)))
+    job_queue.run_jobs(scan.virtual_scane_one_model, object_folders, jobs_db,
+                       num_workers=FLAGS.num_workers, timeout=FLAGS.timeout, max_attempts=FLAGS.max_attempts,
+                       retry_failed=FLAGS.retry_failed, log_dir=FLAGS.log_dir)
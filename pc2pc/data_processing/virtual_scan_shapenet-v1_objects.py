@@ -1,5 +1,4 @@
 import os, sys
-import glob
 import numpy as np
 import math
 import argparse
@@ -25,29 +24,16 @@ cat_synset_id = '02933112' # dresser(cabinet)
 OUTPUT_DATA_PATH = os.path.join('../data/ShapeNet_v1_point_cloud', cat_synset_id, 'point_cloud_clean_full')
 PREV_OUTPUT_DATA_PATH = os.path.join('../data/ShapeNet_v1_point_cloud', cat_synset_id, 'point_cloud_clean_full')
 
-EXE_VIRTUAL_SCANNER = '/workspace/pcl/build/bin/pcl_virtual_scanner'
 VERT_DEGREE_RES = 0.125
 HOR_DEGREE_RES = 0.125
 VERT_NB_SCANS = 600
 HOR_BN_SCANS = 600
-'''
-point_mu = 0
-point_sigma = 0.0012 # deviation in m
-'''
+point_sigma = 0 # deviation in m along the rays, 0 as the pcl scanner was run without noise (0.0012 for noisy scans)
 cam_mu = 0
 cam_sigma = 0.1 # deviation
 
-CMD_POSTFIX = '-customized_views 1 -view_points {} -target_points {}' + ' '+ '-nr_scans' + ' ' +str(VERT_NB_SCANS) + ' ' + '-pts_in_scan' + ' ' + str(HOR_BN_SCANS) + ' ' + '-vert_res' + ' ' + str(VERT_DEGREE_RES) + ' ' + '-hor_res' + ' ' + str(HOR_DEGREE_RES)
-
 ####################################################################
 
-def clean_dir(dirname):
-    if not os.path.exists(dirname):
-        return
-    pcd_files = glob.glob(os.path.join(dirname, '*.pcd'))
-    for pf in pcd_files:
-        os.remove(pf)
-
 def generate_camera_view_target_points():
     '''
     gen some samples on a circle on 3 planes
@@ -86,47 +72,29 @@ def generate_camera_view_target_points():
     
     return cam_view_points, cam_target_points
 
-def virtual_scane_one_model(model_dir, worker_id):
+def virtual_scane_one_model(model_dir):
     print('Scanning ' + model_dir)
 
-    ######### prepare some folder for tmp work #############
-    tmp_model_name = 'tmp'+ str(worker_id) +'.ply'
-    TMP_DATA_PATH = './tmp' + str(worker_id)
-    TMP_PLY_POINTCLOUD_PATH =  './tmp'+str(worker_id)+'.ply_output'
-    if not os.path.exists(TMP_DATA_PATH):
-        os.makedirs(TMP_DATA_PATH)
-    clean_dir(TMP_PLY_POINTCLOUD_PATH)
-
     # generate camera parameters
     cam_view_points, cam_target_points = generate_camera_view_target_points()
 
     model_filename = os.path.join(model_dir, 'model.obj')
     if not os.path.exists(model_filename):
-        print('File not found: %s'%(model_filename))
-        return
+        raise IOError('File not found: %s'%(model_filename))
     model_basename = os.path.basename(model_dir)
     prev_clean_output_filename = os.path.join(PREV_OUTPUT_DATA_PATH, model_basename+'_clean.ply')
     if os.path.exists(prev_clean_output_filename):
         print('Previously scanned, skip.', prev_clean_output_filename)
         return
 
-    ply_tmp_name = os.path.join(TMP_DATA_PATH, tmp_model_name)
-    mesh_util.convert_obj2ply(model_filename, ply_tmp_name, recenter=True, center_mode='box_center')
-
-    cmd_str = EXE_VIRTUAL_SCANNER + ' ' + ply_tmp_name + ' ' + CMD_POSTFIX.format(','.join(str(e) for e in cam_view_points), ','.join(str(e) for e in cam_target_points))
-    os.system(cmd_str)
-
-    # collect all scanned point clouds
-    all_xyz = []
-    pcd_files = glob.glob(TMP_PLY_POINTCLOUD_PATH + '/*.pcd')
-    for pf in pcd_files:
-        xyz = pc_util.read_pcd(pf)
-        all_xyz.extend(xyz)
-    all_points = np.array(all_xyz)
+    # ray cast all views in-process, no tmp files
+    mesh = mesh_util.load_obj_recentered(model_filename, center_mode='box_center')
+    all_points = mesh_util.virtual_scan_mesh(mesh, cam_view_points, cam_target_points,
+                                             nb_scans=VERT_NB_SCANS, pts_in_scan=HOR_BN_SCANS, vert_res=VERT_DEGREE_RES, hor_res=HOR_DEGREE_RES,
+                                             point_sigma=point_sigma)
     print('Collecte #points:', all_points.shape)
     if all_points.shape[0] < 2048:
-        print('Failed to scan sufficient points! Move to next model.')
-        return
+        raise RuntimeError('Failed to scan sufficient points of %s: %d'%(model_dir, all_points.shape[0]))
     all_points = pc_util.remove_duplicated_points(all_points)
     print('Total points after merge: %d' % (all_points.shape[0]))
     clean_output_filename = os.path.join(OUTPUT_DATA_PATH, model_basename+'_clean.ply')
@@ -148,7 +116,10 @@ def do_virtual_scan(cat_dir, worker_id, num_workers):
 
     for o_idx, obj_f in enumerate(object_folders):
         if o_idx >= start_idx and o_idx < end_idx:
-            virtual_scane_one_model(os.path.join(cat_dir, obj_f), worker_id)
+            try:
+                virtual_scane_one_model(os.path.join(cat_dir, obj_f))
+            except (IOError, RuntimeError) as e:
+                print('%s, move to next model.'%(e))
     print('Done!')
 
 if __name__ == "__main__":
@@ -0,0 +1,135 @@
+'''
+    One manifest per point cloud directory: <dir>_split_manifest.json, next to the directory.
+    It holds name, path, #points, bbox and split of every point cloud, and the sorted names of every split,
+    so loaders get a split without listing or sorting the directory.
+    Splits are assigned by a stable hash of the model id, all scans of a model fall into the same split
+    and regenerating a manifest always gives the same splits.
+
+    Old <dir>_<split>_split.pickle files are still read when there is no manifest.
+'''
+import os
+import sys
+import json
+import pickle
+import hashlib
+import multiprocessing
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+sys.path.append(os.path.join(ROOT_DIR, 'utils'))
+
+ALL_SPLITS = ['train', 'val', 'trainval', 'test', 'all']
+
+def get_manifest_filename(point_cloud_dir):
+    point_cloud_dir = point_cloud_dir.rstrip('/')
+    return os.path.join(os.path.dirname(point_cloud_dir), os.path.basename(point_cloud_dir)+'_split_manifest.json')
+
+def get_model_id(pc_name):
+    '''
+    e.g. 1a6f615e8b1b5ae4dbbc9440457e303e_clean.ply, 1a6f615e8b1b5ae4dbbc9440457e303e__0__.ply
+    '''
+    return pc_name.split('_')[0]
+
+def hash_fraction(model_id):
+    '''
+    stable across runs and machines (unlike hash()), uniform in [0, 1)
+    '''
+    return int(hashlib.md5(model_id.encode('utf-8')).hexdigest()[:8], 16) / float(2**32)
+
+def hash_split(model_id, train_portion=0.85, val_portion=0.05):
+    '''
+    train/val/test by hash of the model id, same portions as gen_point_cloud_split.py used
+    '''
+    h = hash_fraction(model_id)
+    if h < train_portion:
+        return 'train'
+    elif h < train_portion + val_portion:
+        return 'val'
+    return 'test'
+
+def _read_entry(ply_filename):
+    import numpy as np
+    import pc_util
+    points = pc_util.read_ply_xyz(ply_filename)
+    if points.shape[0] == 0:
+        return points.shape[0], None, None
+    return points.shape[0], np.amin(points, axis=0).tolist(), np.amax(points, axis=0).tolist()
+
+def build_manifest(point_cloud_dir, split_fn=hash_split, num_workers=multiprocessing.cpu_count()):
+    '''
+    split_fn: model id -> 'train', 'val' or 'test'
+    point counts and bboxes are read in parallel
+    '''
+    pc_names = sorted([f for f in os.listdir(point_cloud_dir) if f.endswith('.ply')])
+    pool = multiprocessing.Pool(num_workers)
+    infos = pool.map(_read_entry, [os.path.join(point_cloud_dir, pc_n) for pc_n in pc_names], chunksize=16)
+    pool.close()
+    pool.join()
+
+    entries = []
+    splits = {split: [] for split in ALL_SPLITS}
+    for pc_n, (npoint, bbox_min, bbox_max) in zip(pc_names, infos):
+        split = split_fn(get_model_id(pc_n))
+        entries.append({'name': pc_n, 'path': os.path.join(point_cloud_dir, pc_n), 'npoint': npoint,
+                        'bbox_min': bbox_min, 'bbox_max': bbox_max, 'split': split})
+        splits[split].append(pc_n)
+        if split in ['train', 'val']:
+            splits['trainval'].append(pc_n)
+        splits['all'].append(pc_n)
+    return {'point_cloud_dir': point_cloud_dir, 'entries': entries, 'splits': splits}
+
+def write_manifest(manifest, point_cloud_dir):
+    manifest_filename = get_manifest_filename(point_cloud_dir)
+    with open(manifest_filename, 'w') as f:
+        json.dump(manifest, f)
+    for split in ALL_SPLITS:
+        print('#%s: %d'%(split, len(manifest['splits'][split])))
+    print('Manifest saved to %s'%(manifest_filename))
+
+def load_manifest(point_cloud_dir):
+    '''
+    None if the directory has no manifest
+    '''
+    manifest_filename = get_manifest_filename(point_cloud_dir)
+    if not os.path.exists(manifest_filename):
+        return None
+    with open(manifest_filename, 'r') as f:
+        return json.load(f)
+
+def get_split_filenames(point_cloud_dir, split):
+    '''
+    sorted full filenames of a split, from the manifest, or the split pickle if there is none
+    '''
+    manifest = load_manifest(point_cloud_dir)
+    if manifest is not None:
+        pc_name_list = manifest['splits'][split]
+    else:
+        split_filename = os.path.join(os.path.dirname(point_cloud_dir), os.path.basename(point_cloud_dir)+'_%s_split.pickle'%(split))
+        with open(split_filename, 'rb') as pf:
+            pc_name_list = sorted(pickle.load(pf))
+    return [os.path.join(point_cloud_dir, pc_n) for pc_n in pc_name_list]
+
+
+def load_point_cloud_cache(pickle_filename, pc_filenames):
+    '''
+    cached point clouds of pc_filenames, None if there is no cache or it was written for other files
+    (e.g. an old cache of a random split, which holds a bare list of clouds)
+    '''
+    if not os.path.exists(pickle_filename):
+        return None
+    with open(pickle_filename, 'rb') as p_f:
+        cache = pickle.load(p_f)
+    pc_names = [os.path.basename(fn) for fn in pc_filenames]
+    if not isinstance(cache, dict) or cache.get('pc_names') != pc_names:
+        print('Cached pickle file %s does not match the split, rebuilding.'%(pickle_filename))
+        return None
+    print('Loading cached pickle file: %s'%(pickle_filename))
+    return cache['point_clouds']
+
+def save_point_cloud_cache(pickle_filename, pc_filenames, point_clouds):
+    '''
+    point clouds are stored with the names they were read from, checked by load_point_cloud_cache
+    '''
+    with open(pickle_filename, 'wb') as p_f:
+        pickle.dump({'pc_names': [os.path.basename(fn) for fn in pc_filenames], 'point_clouds': point_clouds}, p_f)
+    print('Cache to %s'%(pickle_filename))
@@ -0,0 +1,94 @@
+'''
+    Benchmark the sliced wasserstein (swd) reconstruction loss against the approxmatch emd on the 3D-EPN validation set.
+    Every validation cloud is paired with another validation shape (far pairs) and with a noisy resample of itself (near pairs).
+    Reports the time per batch of loss + gradient for both, and how well the swd of a pair tracks its emd
+    (pearson and spearman correlation, swd / emd ratio).
+
+    python3 benchmark_swd_vs_emd.py --cat_name chair --num_projections 25 50 100 200
+'''
+import os,sys
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, 'structural_losses_utils'))
+sys.path.append(os.path.join(ROOT_DIR, '../utils'))
+import config
+import shapenet_pc_dataset
+from tf_approxmatch import approx_match, match_cost
+from tf_sliced_wasserstein import sliced_wasserstein_distance
+
+def emd_distance(point_cloud_A, point_cloud_B):
+    '''
+    point-wise emd of every pair, as _reconstruction_loss without the mean over the batch
+    '''
+    match = approx_match(point_cloud_A, point_cloud_B)
+    return match_cost(point_cloud_A, point_cloud_B, match) / point_cloud_A.get_shape()[1].value
+
+def get_validation_pairs(cat_name, npoint, noise_sigma):
+    '''
+    return: A, B (P x npoint x 3) of far pairs (shape i, shape i+1) and near pairs (shape i, noisy resample of shape i)
+    '''
+    point_cloud_dir = getattr(config, 'EPN_%s_point_cloud_dir'%(cat_name))
+    dataset = shapenet_pc_dataset.ShapeNet_3DEPN_PointsDataset(point_cloud_dir, batch_size=1, npoint=npoint, shuffle=False, split='val')
+    rand_gen = np.random.RandomState(0)
+    clouds = [pc[rand_gen.choice(pc.shape[0], npoint, replace=True)] for pc in dataset.point_clouds]
+    resampled = [pc[rand_gen.choice(pc.shape[0], npoint, replace=True)] + rand_gen.normal(0, noise_sigma, (npoint, 3)) for pc in dataset.point_clouds]
+    A = np.array(clouds + clouds, dtype=np.float32)
+    B = np.array(clouds[1:] + clouds[:1] + resampled, dtype=np.float32)
+    return A, B
+
+def run_distance(sess, distance, grad, A_pl, B_pl, A, B, batch_size):
+    '''
+    return: distances of all pairs, seconds per batch of distance + gradient
+    '''
+    nb_batches = len(A) // batch_size
+    sess.run([distance, grad], feed_dict={A_pl: A[:batch_size], B_pl: B[:batch_size]}) # warm up
+    distances = []
+    start_time = time.time()
+    for i in range(nb_batches):
+        feed_dict = {A_pl: A[i*batch_size:(i+1)*batch_size], B_pl: B[i*batch_size:(i+1)*batch_size]}
+        distances.append(sess.run([distance, grad], feed_dict=feed_dict)[0])
+    return np.concatenate(distances), (time.time() - start_time) / nb_batches
+
+def rank(x):
+    r = np.empty(len(x))
+    r[np.argsort(x)] = np.arange(len(x))
+    return r
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cat_name', default='chair', help='3D-EPN category')
+    parser.add_argument('--npoint', type=int, default=2048)
+    parser.add_argument('--batch_size', type=int, default=24)
+    parser.add_argument('--noise_sigma', type=float, default=0.01, help='noise of the near pairs')
+    parser.add_argument('--num_projections', type=int, nargs='+', default=[25, 50, 100, 200], help='swd settings to compare')
+    FLAGS = parser.parse_args()
+
+    A, B = get_validation_pairs(FLAGS.cat_name, FLAGS.npoint, FLAGS.noise_sigma)
+    print('#pairs: %d, %d points'%(len(A), FLAGS.npoint))
+
+    A_pl = tf.placeholder(tf.float32, shape=[FLAGS.batch_size, FLAGS.npoint, 3])
+    B_pl = tf.placeholder(tf.float32, shape=[FLAGS.batch_size, FLAGS.npoint, 3])
+    losses = [('emd', emd_distance(A_pl, B_pl))]
+    for L in FLAGS.num_projections:
+        losses.append(('swd L=%d'%(L), sliced_wasserstein_distance(A_pl, B_pl, L)))
+
+    config_proto = tf.ConfigProto()
+    config_proto.gpu_options.allow_growth = True
+    with tf.Session(config=config_proto) as sess:
+        results = []
+        for name, distance in losses:
+            grad = tf.gradients(tf.reduce_mean(distance), A_pl)[0]
+            results.append((name,) + run_distance(sess, distance, grad, A_pl, B_pl, A, B, FLAGS.batch_size))
+
+    emd = results[0][1]
+    print('%-12s %10s %10s %10s %10s'%('loss', 'ms/batch', 'pearson', 'spearman', 'swd/emd'))
+    for name, distances, elapsed in results:
+        pearson = np.corrcoef(distances, emd)[0, 1]
+        spearman = np.corrcoef(rank(distances), rank(emd))[0, 1]
+        print('%-12s %10.2f %10.4f %10.4f %10.4f'%(name, elapsed*1000, pearson, spearman, np.mean(distances / emd)))
@@ -0,0 +1,91 @@
+'''
+    Compare a TFLite completion model against the float frozen graph on the 3D-EPN test split, on CPU.
+    Reports the directed hausdorff (input -> completion) of both models, the chamfer distance between
+    their outputs, the chamfer distance to the ground truth and the throughput of both models.
+
+    python3 compare_tflite_completion.py --pb path/to/completion.pb --tflite path/to/completion_int8.tflite --cat_name chair
+'''
+import os,sys
+os.environ['CUDA_VISIBLE_DEVICES'] = '' # CPU only, set before tensorflow is imported
+import time
+import argparse
+import numpy as np
+import evaluation_utils
+from tqdm import tqdm
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, '../utils'))
+import pc_util
+import config
+import shapenet_pc_dataset
+from pcl2pcl_completer import FrozenPCL2PCLCompleter
+from export_completion_tflite import TFLiteCompleter
+
+def get_gt_point_cloud(cat_name, pc_name, sample_nb=2048):
+    '''
+    same ground truth as test_pcl2pcl_gan_3D-EPN.py, None if missing
+    '''
+    cls_id = shapenet_pc_dataset.get_cls_id(cat_name)
+    gt_pc_filename = os.path.join(config.ShapeNet_v1_point_cloud_dir, cls_id, 'point_cloud_clean', pc_name.split('_')[0]+'_clean.ply')
+    if not os.path.exists(gt_pc_filename):
+        return None
+    gt_pc = pc_util.read_ply_xyz(gt_pc_filename)
+    gt_pc = pc_util.rotate_point_cloud_by_axis_angle(gt_pc, [0,1,0], 90)
+    return pc_util.sample_point_cloud(gt_pc, sample_nb)
+
+def run_timed(completer, point_clouds, batch_size):
+    '''
+    return all completions and the throughput in clouds per second
+    '''
+    completer.complete_batch(point_clouds[:batch_size]) # warm up
+    recons = []
+    start_time = time.time()
+    for start_idx in range(0, len(point_clouds), batch_size):
+        recons.append(completer.complete_batch(point_clouds[start_idx:start_idx+batch_size]))
+    elapsed = time.time() - start_time
+    return np.concatenate(recons, axis=0), len(point_clouds) / elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pb', required=True, help='float frozen completion graph')
+    parser.add_argument('--tflite', required=True, help='TFLite completion model')
+    parser.add_argument('--cat_name', default='chair', help='category of the 3D-EPN test inputs')
+    parser.add_argument('--split_name', default='test', help='split name of the 3D-EPN inputs')
+    parser.add_argument('--batch_size', type=int, default=24, help='batch size for both models')
+    parser.add_argument('--num_threads', type=int, default=None, help='CPU threads of both models, None for the default')
+    FLAGS = parser.parse_args()
+
+    point_cloud_dir = getattr(config, 'EPN_%s_point_cloud_dir'%(FLAGS.cat_name))
+    dataset = shapenet_pc_dataset.ShapeNet_3DEPN_PointsDataset(point_cloud_dir, batch_size=1, npoint=2048, shuffle=False, split=FLAGS.split_name, preprocess=False)
+    # resample once, so both models see exactly the same inputs
+    rand_gen = np.random.RandomState(0)
+    inputs = np.array([pc[rand_gen.choice(pc.shape[0], 2048, replace=pc.shape[0] < 2048)] for pc in dataset.point_clouds], dtype=np.float32)
+    names = [fn.split('/')[-1] for fn in dataset.pc_filenames]
+
+    float_completer = FrozenPCL2PCLCompleter(FLAGS.pb, batch_size=FLAGS.batch_size, num_threads=FLAGS.num_threads if FLAGS.num_threads is not None else 0)
+    tflite_completer = TFLiteCompleter(FLAGS.tflite, batch_size=FLAGS.batch_size, num_threads=FLAGS.num_threads)
+
+    float_recons, float_throughput = run_timed(float_completer, inputs, FLAGS.batch_size)
+    tflite_recons, tflite_throughput = run_timed(tflite_completer, inputs, FLAGS.batch_size)
+
+    float_hausdorff, tflite_hausdorff, agreement_chamfer = [], [], []
+    float_gt_chamfer, tflite_gt_chamfer = [], []
+    for pc_idx in tqdm(range(len(inputs))):
+        float_hausdorff.append(evaluation_utils.directed_hausdorff(inputs[pc_idx], float_recons[pc_idx]))
+        tflite_hausdorff.append(evaluation_utils.directed_hausdorff(inputs[pc_idx], tflite_recons[pc_idx]))
+        agreement_chamfer.append(evaluation_utils.chamfer_distance(tflite_recons[pc_idx], float_recons[pc_idx]))
+
+        gt_pc = get_gt_point_cloud(FLAGS.cat_name, names[pc_idx])
+        if gt_pc is None:
+            continue
+        float_gt_chamfer.append(evaluation_utils.chamfer_distance(float_recons[pc_idx], gt_pc))
+        tflite_gt_chamfer.append(evaluation_utils.chamfer_distance(tflite_recons[pc_idx], gt_pc))
+
+    print('#test inputs: %d (%d with gt)'%(len(inputs), len(float_gt_chamfer)))
+    print('Hausdorff (input -> completion): float %f, tflite %f'%(np.mean(float_hausdorff), np.mean(tflite_hausdorff)))
+    print('Chamfer (tflite <-> float): %f'%(np.mean(agreement_chamfer)))
+    if len(float_gt_chamfer) > 0:
+        print('Chamfer to gt: float %f, tflite %f'%(np.mean(float_gt_chamfer), np.mean(tflite_gt_chamfer)))
+    print('Throughput on CPU (clouds/s): float %.2f, tflite %.2f'%(float_throughput, tflite_throughput))
@@ -1,6 +1,7 @@
 import os,sys
 
 import numpy as np
+from scipy.spatial import cKDTree
 
 def avg_dist(P_recon, P_gt):
     '''
@@ -82,6 +83,26 @@ def completeness(P_recon, P_gt, thre=0.01):
     fraction = matched.shape[0] / npoint
     return fraction, avg_min_dist
 
+def chamfer_distance(P_recon, P_gt):
+    '''
+    CHAMFER, same as the nn_distance based loss
+    mean squared distance to the nearest neighbour, summed over both directions
+    P_gt: N x 3, np array
+    P_recon: M x 3, np array
+    '''
+    dists_recon, _ = cKDTree(P_gt).query(P_recon)
+    dists_gt, _ = cKDTree(P_recon).query(P_gt)
+    return np.mean(dists_recon**2) + np.mean(dists_gt**2)
+
+def directed_hausdorff(P_A, P_B):
+    '''
+    HAUSDORFF, A -> B, same as tf_hausdorff_distance.directed_hausdorff
+    P_A: N x 3, np array
+    P_B: M x 3, np array
+    '''
+    dists, _ = cKDTree(P_B).query(P_A)
+    return np.max(dists)
+
 def compute_F1_score(precision, recall):
     f = 2 * precision * recall / (precision + recall)
     return f
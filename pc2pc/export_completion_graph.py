@@ -0,0 +1,173 @@
+'''
+    Export the pcl2pcl gan completion path (noisy encoder -> G -> clean decoder) as a single frozen .pb graph.
+    Weights are read straight from the checkpoint (no discriminator, optimizer slots or eval subgraph),
+    batch norms are folded into the neighbouring conv/fc weights, and the result is cleaned up with TF graph transforms.
+
+    python3 export_completion_graph.py --ckpt path/to/model_1000.ckpt --output path/to/completion.pb
+    The exported graph takes 'input_noisy_cloud' (Bx2048x3, any B) and produces 'completion' (Bx2048x3),
+    load it with pcl2pcl_completer.FrozenPCL2PCLCompleter.
+'''
+import os
+import sys
+import argparse
+
+import numpy as np
+import tensorflow as tf
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR) # model
+from pcl2pcl_completer import default_para_config_gan, default_para_config_ae, INPUT_NODE_NAME, OUTPUT_NODE_NAME
+
+BN_EPSILON = 1e-3 # default epsilon of tf.layers.batch_normalization
+
+def read_bn_affine(reader, scope):
+    '''
+    turn an inference mode batch norm into a per-channel affine: x * scale + shift
+    '''
+    gamma = reader.get_tensor(scope + '/gamma')
+    beta = reader.get_tensor(scope + '/beta')
+    moving_mean = reader.get_tensor(scope + '/moving_mean')
+    moving_variance = reader.get_tensor(scope + '/moving_variance')
+    scale = gamma / np.sqrt(moving_variance + BN_EPSILON)
+    shift = beta - moving_mean * scale
+    return ('affine', scale, shift)
+
+def read_completion_layers(reader, para_config_gan=default_para_config_gan, para_config_ae=default_para_config_ae):
+    '''
+    read the completion path from a checkpoint as a flat list of layers, following the layer order of
+    EncoderPointnet, GeneratorLatentFromLatent and DecoderFC:
+        ('pointwise', W, b) - 1x1 conv on BxNxC
+        ('dense', W, b)     - fc on BxC
+        ('affine', scale, shift), ('act', fn), ('max_pool',), ('reshape', shape)
+    '''
+    assert(para_config_ae['filter_size'] == 1 and para_config_ae['stride'] == 1)
+    layers = []
+
+    # noisy encoder: conv1d -> act -> bn, max pool at the end
+    n_filters = para_config_ae['n_filters'] + [para_config_ae['latent_code_dim']]
+    for f_id, _ in enumerate(n_filters):
+        kernel = reader.get_tensor('noisy_Encoder/conv1d_%d/kernel'%(f_id))
+        layers.append(('pointwise', kernel[0], reader.get_tensor('noisy_Encoder/conv1d_%d/bias'%(f_id))))
+        if para_config_ae['activation_fn'] is not None:
+            layers.append(('act', para_config_ae['activation_fn']))
+        if para_config_ae['encoder_bn']:
+            layers.append(read_bn_affine(reader, 'noisy_Encoder/bn_%d'%(f_id)))
+    layers.append(('max_pool',))
+
+    # G: fc -> bn -> act, no activation and bn at the output
+    for fc_id, _ in enumerate(para_config_gan['g_fc_sizes']):
+        layers.append(('dense', reader.get_tensor('G/fc_%d/kernel'%(fc_id)), reader.get_tensor('G/fc_%d/bias'%(fc_id))))
+        if para_config_gan['g_bn']:
+            layers.append(read_bn_affine(reader, 'G/bn_%d'%(fc_id)))
+        if para_config_gan['g_activation_fn'] is not None:
+            layers.append(('act', para_config_gan['g_activation_fn']))
+    layers.append(('dense', reader.get_tensor('G/fc_output/kernel'), reader.get_tensor('G/fc_output/bias')))
+
+    # clean decoder: fc -> act -> bn, no activation and bn at the output
+    for fc_id, _ in enumerate(para_config_ae['fc_sizes']):
+        layers.append(('dense', reader.get_tensor('clean_Decoder/fc_%d/kernel'%(fc_id)), reader.get_tensor('clean_Decoder/fc_%d/bias'%(fc_id))))
+        if para_config_ae['activation_fn'] is not None:
+            layers.append(('act', para_config_ae['activation_fn']))
+        if para_config_ae['decoder_bn']:
+            layers.append(read_bn_affine(reader, 'clean_Decoder/bn_%d'%(fc_id)))
+    layers.append(('dense', reader.get_tensor('clean_Decoder/fc_output/kernel'), reader.get_tensor('clean_Decoder/fc_output/bias')))
+    layers.append(('reshape', para_config_ae['point_cloud_shape']))
+
+    return layers
+
+def fold_batch_norms(layers):
+    '''
+    fold every affine (inference batch norm) into a neighbouring linear layer:
+        linear -> affine        : W * scale, b * scale + shift
+        affine -> linear        : scale[:,None] * W, b + shift . W
+        affine -> max_pool      : swapped when all scales are positive, so it can fold into the next fc
+    affines that can not be folded are kept as they are
+    '''
+    layers = list(layers)
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(layers)-1):
+            cur, nxt = layers[i], layers[i+1]
+            if cur[0] in ['pointwise', 'dense'] and nxt[0] == 'affine':
+                _, W, b = cur
+                _, scale, shift = nxt
+                layers[i:i+2] = [(cur[0], W * scale[np.newaxis, :], b * scale + shift)]
+            elif cur[0] == 'affine' and nxt[0] in ['pointwise', 'dense']:
+                _, scale, shift = cur
+                _, W, b = nxt
+                layers[i:i+2] = [(nxt[0], W * scale[:, np.newaxis], b + np.dot(shift, W))]
+            elif cur[0] == 'affine' and nxt[0] == 'max_pool' and np.all(cur[1] > 0):
+                layers[i:i+2] = [nxt, cur]
+            else:
+                continue
+            changed = True
+            break
+    return layers
+
+def build_folded_graph(layers, npoint):
+    '''
+    build the completion graph from folded numpy weights, all weights are constants
+    pointwise layers run as one matmul on the (B*N)xC flattened points
+    '''
+    input_pl = tf.placeholder(tf.float32, shape=[None, npoint, 3], name=INPUT_NODE_NAME)
+    layer = tf.reshape(input_pl, [-1, 3])
+    flattened = True
+    for l_id, l in enumerate(layers):
+        if l[0] in ['pointwise', 'dense']:
+            assert(flattened == (l[0] == 'pointwise'))
+            layer = tf.nn.bias_add(tf.matmul(layer, tf.constant(l[1].astype(np.float32))), tf.constant(l[2].astype(np.float32)), name='linear_%d'%(l_id))
+        elif l[0] == 'affine':
+            layer = layer * tf.constant(l[1].astype(np.float32)) + tf.constant(l[2].astype(np.float32))
+        elif l[0] == 'act':
+            layer = l[1](layer, name='act_%d'%(l_id))
+        elif l[0] == 'max_pool':
+            layer = tf.reshape(layer, [-1, npoint, layer.get_shape().as_list()[-1]])
+            layer = tf.reduce_max(layer, axis=1, name='max_pool')
+            flattened = False
+        elif l[0] == 'reshape':
+            layer = tf.reshape(layer, [-1, l[1][0], l[1][1]], name=OUTPUT_NODE_NAME)
+    return input_pl, layer
+
+def optimize_graph_def(graph_def, npoint):
+    '''
+    constant folding and dead-node stripping with TF graph transforms
+    '''
+    try:
+        from tensorflow.tools.graph_transforms import TransformGraph
+    except ImportError:
+        print('Warning: graph transforms not available in this TF build, skip optimizing.')
+        return tf.graph_util.extract_sub_graph(graph_def, [OUTPUT_NODE_NAME])
+    transforms = ['strip_unused_nodes(type=float, shape="-1,%d,3")'%(npoint),
+                  'remove_nodes(op=Identity, op=CheckNumerics)',
+                  'fold_constants(ignore_errors=true)',
+                  'merge_duplicate_nodes',
+                  'sort_by_execution_order']
+    return TransformGraph(graph_def, [INPUT_NODE_NAME], [OUTPUT_NODE_NAME], transforms)
+
+def export_completion_graph(ckpt, output_filename, para_config_gan=default_para_config_gan, para_config_ae=default_para_config_ae):
+    reader = tf.train.NewCheckpointReader(ckpt)
+    layers = read_completion_layers(reader, para_config_gan, para_config_ae)
+    nb_layers = len(layers)
+    layers = fold_batch_norms(layers)
+    print('Folded %d -> %d layers.'%(nb_layers, len(layers)))
+
+    npoint = para_config_ae['point_cloud_shape'][0]
+    with tf.Graph().as_default() as graph:
+        build_folded_graph(layers, npoint)
+        graph_def = optimize_graph_def(graph.as_graph_def(), npoint)
+
+    if os.path.dirname(output_filename) != '' and not os.path.exists(os.path.dirname(output_filename)):
+        os.makedirs(os.path.dirname(output_filename))
+    with tf.gfile.GFile(output_filename, 'wb') as f:
+        f.write(graph_def.SerializeToString())
+    print('Exported %d nodes to %s'%(len(graph_def.node), output_filename))
+    return graph_def
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ckpt', required=True, help='pcl2pcl gan checkpoint, e.g. model_1000.ckpt')
+    parser.add_argument('--output', required=True, help='output .pb filename')
+    FLAGS = parser.parse_args()
+
+    export_completion_graph(FLAGS.ckpt, FLAGS.output)
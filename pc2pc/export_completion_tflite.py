@@ -0,0 +1,116 @@
+'''
+    Convert the frozen completion graph (see export_completion_graph.py) to a TFLite model for CPU inference.
+    quantization:
+        float   - no quantization
+        dynamic - int8 weights, float activations
+        int8    - int8 weights and activations, calibrated on a sample of 3D-EPN training inputs
+
+    python3 export_completion_tflite.py --pb path/to/completion.pb --output path/to/completion_int8.tflite --quantization int8 --cat_name chair
+    Compare against the float model with evaluation/compare_tflite_completion.py.
+'''
+import os
+import sys
+import argparse
+
+import numpy as np
+import tensorflow as tf
+from numpy.random import RandomState
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR) # model
+from pcl2pcl_completer import PCL2PCLCompleter, INPUT_NODE_NAME, OUTPUT_NODE_NAME
+
+def get_tflite_module():
+    '''
+    tf.lite in newer TF 1.x, tf.contrib.lite before
+    '''
+    if hasattr(tf, 'lite'):
+        return tf.lite
+    return tf.contrib.lite
+
+def get_3DEPN_calibration_point_clouds(cat_name, nb_samples=128, npoint=2048, split='train', random_seed=0):
+    '''
+    a random sample of 3D-EPN inputs of a category, preprocessed the same way as in training
+    return: nb_samples x npoint x 3
+    '''
+    import shapenet_pc_dataset
+    import config
+    point_cloud_dir = getattr(config, 'EPN_%s_point_cloud_dir'%(cat_name))
+    dataset = shapenet_pc_dataset.ShapeNet_3DEPN_PointsDataset(point_cloud_dir, batch_size=nb_samples, npoint=npoint, shuffle=True, split=split, random_seed=random_seed, preprocess=False)
+    return dataset.next_batch().astype(np.float32)
+
+def convert_to_tflite(pb_filename, output_filename, quantization='dynamic', calib_point_clouds=None, batch_size=1, npoint=2048):
+    '''
+    the TFLite model has a fixed batch size, TFLiteCompleter resizes it when needed
+    '''
+    lite = get_tflite_module()
+    converter = lite.TFLiteConverter.from_frozen_graph(pb_filename, [INPUT_NODE_NAME], [OUTPUT_NODE_NAME],
+                                                       input_shapes={INPUT_NODE_NAME: [batch_size, npoint, 3]})
+    if quantization == 'dynamic':
+        converter.optimizations = [lite.Optimize.DEFAULT]
+    elif quantization == 'int8':
+        assert(calib_point_clouds is not None)
+        def representative_dataset():
+            for start_idx in range(0, len(calib_point_clouds) - batch_size + 1, batch_size):
+                yield [calib_point_clouds[start_idx:start_idx+batch_size].astype(np.float32)]
+        converter.optimizations = [lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif quantization != 'float':
+        raise NotImplementedError('Quantization %s not implemented!'%(quantization))
+
+    tflite_model = converter.convert()
+    if os.path.dirname(output_filename) != '' and not os.path.exists(os.path.dirname(output_filename)):
+        os.makedirs(os.path.dirname(output_filename))
+    with open(output_filename, 'wb') as f:
+        f.write(tflite_model)
+    print('Exported %s TFLite model (%.2f MB) to %s'%(quantization, len(tflite_model) / 1024.0 / 1024.0, output_filename))
+
+class TFLiteCompleter(PCL2PCLCompleter):
+    '''
+    same as PCL2PCLCompleter, but runs a TFLite model on CPU
+    '''
+    def __init__(self, tflite_filename, batch_size=24, npoint=2048, num_threads=None, random_seed=None):
+        self.tflite_filename = tflite_filename
+        self.batch_size = batch_size
+        self.npoint = npoint
+
+        # make a random generator
+        self.rand_gen = RandomState(random_seed)
+
+        lite = get_tflite_module()
+        if num_threads is not None:
+            self.interpreter = lite.Interpreter(model_path=tflite_filename, num_threads=num_threads)
+        else:
+            self.interpreter = lite.Interpreter(model_path=tflite_filename)
+        self.input_idx = self.interpreter.get_input_details()[0]['index']
+        self.output_idx = self.interpreter.get_output_details()[0]['index']
+        self.cur_batch_size = None
+        print('TFLite completion model loaded from %s'%(self.tflite_filename))
+
+    def complete_batch(self, point_clouds):
+        data_batch = np.array([self.resample(np.asarray(pc)) for pc in point_clouds], dtype=np.float32)
+        if data_batch.shape[0] != self.cur_batch_size:
+            self.interpreter.resize_tensor_input(self.input_idx, list(data_batch.shape))
+            self.interpreter.allocate_tensors()
+            self.cur_batch_size = data_batch.shape[0]
+        self.interpreter.set_tensor(self.input_idx, data_batch)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_idx).copy()
+
+    def close(self):
+        self.interpreter = None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pb', required=True, help='frozen completion graph from export_completion_graph.py')
+    parser.add_argument('--output', required=True, help='output .tflite filename')
+    parser.add_argument('--quantization', default='dynamic', help='[float | dynamic | int8]')
+    parser.add_argument('--cat_name', default='chair', help='category of the 3D-EPN calibration inputs, for int8')
+    parser.add_argument('--nb_calib', type=int, default=128, help='number of calibration inputs, for int8')
+    FLAGS = parser.parse_args()
+
+    calib_point_clouds = None
+    if FLAGS.quantization == 'int8':
+        calib_point_clouds = get_3DEPN_calibration_point_clouds(FLAGS.cat_name, nb_samples=FLAGS.nb_calib)
+    convert_to_tflite(FLAGS.pb, FLAGS.output, quantization=FLAGS.quantization, calib_point_clouds=calib_point_clouds)
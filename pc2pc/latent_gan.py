@@ -13,6 +13,7 @@ sys.path.append(os.path.join(BASE_DIR, 'structural_losses_utils'))
 from tf_nndistance import nn_distance
 from tf_approxmatch import approx_match, match_cost
 from tf_hausdorff_distance import directed_hausdorff
+from tf_sliced_wasserstein import sliced_wasserstein_distance, NUM_PROJECTIONS
 
 default_para_config = {
     'exp_name': 'latent_gan',
@@ -236,6 +237,20 @@ class PCL2PCLGAN:
 
         return G_loss, G_tofool_loss, reconstr_loss, D_loss, D_fake_loss, D_real_loss, fake_clean_reconstr, eval_loss
 
+    def model_completion(self):
+        '''
+        inference only: noisy encoder -> G -> clean decoder
+        no discriminator, clean encoder or losses are built,
+        set para_config['batch_size'] to None to get a dynamic batch dimension
+        '''
+        self.noisy_code = self.noisy_encoder(self.input_noisy_cloud, tf.constant(False, shape=()))
+
+        self.fake_code = self.G(self.noisy_code, tf.constant(False, shape=()))
+
+        fake_clean_reconstr = self.clean_decoder(self.fake_code, tf.constant(False, shape=()))
+
+        return fake_clean_reconstr
+
     def _reconstruction_loss(self, recon, input, eval_loss=None):
         if eval_loss == None:
             if self.para_config['loss'] == 'chamfer':
@@ -246,6 +261,9 @@ class PCL2PCLGAN:
                 loss = match_cost(recon, input, match)
                 loss = tf.reduce_mean(loss)
                 loss = tf.div(loss, self.para_config['point_cloud_shape'][0]) # return point-wise loss
+            elif self.para_config['loss'] == 'swd':
+                distances = sliced_wasserstein_distance(recon, input, self.para_config.get('swd_projections', NUM_PROJECTIONS))
+                loss = tf.reduce_mean(distances) # point-wise, same range as emd
             elif self.para_config['loss'] == 'hausdorff':
                 distances = directed_hausdorff(input, recon) # partial-noisy -> fake_clean
                 loss = tf.reduce_mean(distances)
@@ -260,6 +278,9 @@ class PCL2PCLGAN:
                 loss = match_cost(recon, input, match)
                 loss = tf.reduce_mean(loss)
                 loss = tf.div(loss, self.para_config['point_cloud_shape'][0]) # return point-wise loss
+            elif eval_loss == 'swd':
+                distances = sliced_wasserstein_distance(recon, input, self.para_config.get('swd_projections', NUM_PROJECTIONS))
+                loss = tf.reduce_mean(distances) # point-wise, same range as emd
             elif eval_loss == 'hausdorff':
                 distances = directed_hausdorff(input, recon) # partial-noisy -> fake_clean
                 loss = tf.reduce_mean(distances)
@@ -398,6 +419,9 @@ class PCL2PCLGAN_SingleAE:
                 loss = match_cost(recon, input, match)
                 loss = tf.reduce_mean(loss)
                 loss = tf.div(loss, self.para_config['point_cloud_shape'][0]) # return point-wise loss
+            elif self.para_config['loss'] == 'swd':
+                distances = sliced_wasserstein_distance(recon, input, self.para_config.get('swd_projections', NUM_PROJECTIONS))
+                loss = tf.reduce_mean(distances) # point-wise, same range as emd
             elif self.para_config['loss'] == 'hausdorff':
                 distances = directed_hausdorff(input, recon) # partial-noisy -> fake_clean
                 loss = tf.reduce_mean(distances)
@@ -412,6 +436,9 @@ class PCL2PCLGAN_SingleAE:
                 loss = match_cost(recon, input, match)
                 loss = tf.reduce_mean(loss)
                 loss = tf.div(loss, self.para_config['point_cloud_shape'][0]) # return point-wise loss
+            elif eval_loss == 'swd':
+                distances = sliced_wasserstein_distance(recon, input, self.para_config.get('swd_projections', NUM_PROJECTIONS))
+                loss = tf.reduce_mean(distances) # point-wise, same range as emd
             elif eval_loss == 'hausdorff':
                 distances = directed_hausdorff(input, recon) # partial-noisy -> fake_clean
                 loss = tf.reduce_mean(distances)
@@ -820,6 +847,9 @@ class CyclePCL2PCLGAN:
             loss = match_cost(recon, input, match)
             loss = tf.reduce_mean(loss)
             loss = tf.div(loss, self.para_config['point_cloud_shape'][0]) # return point-wise loss
+        elif self.para_config['loss'] == 'swd':
+            distances = sliced_wasserstein_distance(recon, input, self.para_config.get('swd_projections', NUM_PROJECTIONS))
+            loss = tf.reduce_mean(distances) # point-wise, same range as emd
 
         return loss
 
@@ -933,6 +963,9 @@ class PC2PCGAN:
             loss = match_cost(recon, input, match)
             loss = tf.reduce_mean(loss)
             loss = tf.div(loss, self.para_config['point_cloud_shape'][0]) # return point-wise loss
+        elif self.para_config['loss'] == 'swd':
+            distances = sliced_wasserstein_distance(recon, input, self.para_config.get('swd_projections', NUM_PROJECTIONS))
+            loss = tf.reduce_mean(distances) # point-wise, same range as emd
 
         return loss
 
@@ -1088,6 +1121,9 @@ class CyclePC2PCGAN:
             loss = match_cost(recon, input, match)
             loss = tf.reduce_mean(loss)
             loss = tf.div(loss, self.para_config['point_cloud_shape'][0]) # return point-wise loss
+        elif self.para_config['loss'] == 'swd':
+            distances = sliced_wasserstein_distance(recon, input, self.para_config.get('swd_projections', NUM_PROJECTIONS))
+            loss = tf.reduce_mean(distances) # point-wise, same range as emd
 
         return loss
 
@@ -0,0 +1,242 @@
+'''
+    Batch completion with a trained pcl2pcl GAN.
+    Only the completion path (noisy encoder -> G -> clean decoder) is built, with a dynamic batch dimension,
+    so any number of scans can be completed without padding or wraparound.
+
+    CUDA_VISIBLE_DEVICES=0 python3 pcl2pcl_completer.py --ckpt path/to/model_1000.ckpt --input path/to/scans --output_dir results/completion
+    python3 pcl2pcl_completer.py --pb path/to/completion.pb --input path/to/scans --output_dir results/completion
+    --input can be a directory of ply files, a txt file listing ply files (one per line) or a .npy file (BxNx3 or a list of Nx3 arrays)
+'''
+import os
+import sys
+import argparse
+
+import numpy as np
+import tensorflow as tf
+from numpy.random import RandomState
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+sys.path.append(BASE_DIR) # model
+sys.path.append(os.path.join(ROOT_DIR, 'utils'))
+import pc_util
+from latent_gan import PCL2PCLGAN
+
+# paras for pcl2pcl gan, only the ones needed by the completion path
+default_para_config_gan = {
+    'batch_size': None, # dynamic batch dimension
+    'latent_dim': 128,
+    'point_cloud_shape': [2048, 3],
+
+    # G paras
+    'g_fc_sizes': [128],
+    'g_activation_fn': tf.nn.relu,
+    'g_bn': False,
+
+    #D paras, D is not built for completion, but PCL2PCLGAN needs them
+    'd_fc_sizes': [256, 512],
+    'd_activation_fn': tf.nn.leaky_relu,
+    'd_bn': False,
+}
+# paras for autoencoder, should be consistent with ae training
+default_para_config_ae = {
+    # encoder
+    'latent_code_dim': 128,
+    'n_filters': [64,128,128,256],
+    'filter_size': 1,
+    'stride': 1,
+    'encoder_bn': True,
+
+    # decoder
+    'point_cloud_shape': [2048, 3],
+    'fc_sizes': [256, 256],
+    'decoder_bn': False,
+
+    'activation_fn': tf.nn.relu,
+}
+
+# node names of the frozen completion graph, see export_completion_graph.py
+INPUT_NODE_NAME = 'input_noisy_cloud'
+OUTPUT_NODE_NAME = 'completion'
+
+def list_input_point_clouds(input):
+    '''
+    input: a directory of ply files, a txt file listing ply files, a .npy file,
+           a numpy array (Nx3 or BxNx3) or a list of Nx3 arrays / ply filenames
+    return: a list of names and a list of point clouds or ply filenames (read lazily)
+    '''
+    if isinstance(input, str):
+        if os.path.isdir(input):
+            ply_filenames = [os.path.join(input, f) for f in os.listdir(input) if f.endswith('.ply')]
+            ply_filenames.sort()
+            return [os.path.basename(f) for f in ply_filenames], ply_filenames
+        elif input.endswith('.ply'):
+            return [os.path.basename(input)], [input]
+        elif input.endswith('.txt'):
+            with open(input, 'r') as f:
+                ply_filenames = [l.strip() for l in f.readlines() if l.strip() != '']
+            return [os.path.basename(f) for f in ply_filenames], ply_filenames
+        elif input.endswith('.npy'):
+            input = np.load(input, allow_pickle=True)
+        else:
+            raise NotImplementedError('Input %s not supported!'%(input))
+
+    if isinstance(input, np.ndarray) and input.dtype != object:
+        if input.ndim == 2:
+            input = input[np.newaxis, ...]
+        assert(input.ndim == 3 and input.shape[-1] == 3)
+    point_clouds = list(input)
+    names = []
+    for pc_idx, pc in enumerate(point_clouds):
+        if isinstance(pc, str):
+            names.append(os.path.basename(pc))
+        else:
+            names.append('%d.ply'%(pc_idx))
+    return names, point_clouds
+
+class PCL2PCLCompleter:
+    '''
+    completion only pcl2pcl gan, the checkpoint is loaded once
+    point clouds of arbitrary size are resampled to npoint points,
+    and completed in micro-batches of at most batch_size clouds
+    '''
+    def __init__(self, ckpt, batch_size=24, para_config_gan=default_para_config_gan, para_config_ae=default_para_config_ae, gpu_id=0, random_seed=None):
+        self.ckpt = ckpt
+        self.batch_size = batch_size
+        self.para_config_gan = para_config_gan.copy()
+        self.para_config_gan['batch_size'] = None
+        self.para_config_ae = para_config_ae
+        self.npoint = self.para_config_gan['point_cloud_shape'][0]
+
+        # make a random generator
+        self.rand_gen = RandomState(random_seed)
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            with tf.device('/gpu:'+str(gpu_id)):
+                self.latent_gan = PCL2PCLGAN(self.para_config_gan, self.para_config_ae)
+                self.input_pl = self.latent_gan.input_noisy_cloud
+                self.output = self.latent_gan.model_completion()
+
+                # only noisy encoder, G and clean decoder variables exist in this graph
+                saver = tf.train.Saver()
+
+            # Create a session
+            config = tf.ConfigProto()
+            config.gpu_options.allow_growth = True
+            config.allow_soft_placement = True
+            config.log_device_placement = False
+            self.sess = tf.Session(config=config)
+            saver.restore(self.sess, self.ckpt)
+        print('Completion model loaded from %s'%(self.ckpt))
+
+    def close(self):
+        self.sess.close()
+
+    def resample(self, points):
+        '''
+        points: Mx3, return npoint x 3
+        '''
+        replace = points.shape[0] < self.npoint
+        choice = self.rand_gen.choice(points.shape[0], self.npoint, replace=replace)
+        return points[choice, :3]
+
+    def complete_batch(self, point_clouds):
+        '''
+        point_clouds: a list of Mx3 arrays (M may differ) or a BxMx3 array
+        return: B x npoint x 3 completed point clouds
+        '''
+        data_batch = np.array([self.resample(np.asarray(pc)) for pc in point_clouds], dtype=np.float32)
+        feed_dict = {self.input_pl: data_batch}
+        return self.sess.run(self.output, feed_dict=feed_dict)
+
+    def complete_iter(self, input, rotate_deg=None):
+        '''
+        input: see list_input_point_clouds
+        rotate_deg: if not None, rotate around y axis before completion (e.g. 90 for raw 3D-EPN data)
+        yield (names, inputs, completions) for each micro-batch, the last one may be smaller than batch_size
+        '''
+        names, point_clouds = list_input_point_clouds(input)
+        for start_idx in range(0, len(point_clouds), self.batch_size):
+            end_idx = min(start_idx + self.batch_size, len(point_clouds))
+            inputs_cur = []
+            for pc in point_clouds[start_idx:end_idx]:
+                if isinstance(pc, str):
+                    pc = pc_util.read_ply_xyz(pc)
+                if rotate_deg is not None:
+                    pc = pc_util.rotate_point_cloud_by_axis_angle(pc, [0,1,0], rotate_deg)
+                inputs_cur.append(pc)
+            yield names[start_idx:end_idx], inputs_cur, self.complete_batch(inputs_cur)
+
+    def complete(self, input, rotate_deg=None):
+        '''
+        complete all point clouds in input, return names and a Bxnpointx3 array
+        '''
+        all_names = []
+        all_recons = []
+        for names_cur, _, recons_cur in self.complete_iter(input, rotate_deg=rotate_deg):
+            all_names.extend(names_cur)
+            all_recons.append(recons_cur)
+        if len(all_recons) == 0:
+            return all_names, np.zeros((0, self.npoint, 3), dtype=np.float32)
+        return all_names, np.concatenate(all_recons, axis=0)
+
+class FrozenPCL2PCLCompleter(PCL2PCLCompleter):
+    '''
+    same as PCL2PCLCompleter, but runs a frozen graph exported by export_completion_graph.py,
+    no model code and no checkpoint restoring is involved
+    '''
+    def __init__(self, pb_filename, batch_size=24, npoint=2048, num_threads=0, random_seed=None):
+        self.pb_filename = pb_filename
+        self.batch_size = batch_size
+        self.npoint = npoint
+
+        # make a random generator
+        self.rand_gen = RandomState(random_seed)
+
+        graph_def = tf.GraphDef()
+        with tf.gfile.GFile(pb_filename, 'rb') as f:
+            graph_def.ParseFromString(f.read())
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+            self.input_pl = self.graph.get_tensor_by_name(INPUT_NODE_NAME + ':0')
+            self.output = self.graph.get_tensor_by_name(OUTPUT_NODE_NAME + ':0')
+
+            # minimal session, 0 threads means picked by TF
+            config = tf.ConfigProto()
+            config.gpu_options.allow_growth = True
+            config.allow_soft_placement = True
+            config.intra_op_parallelism_threads = num_threads
+            config.inter_op_parallelism_threads = num_threads
+            self.sess = tf.Session(config=config)
+        print('Frozen completion graph loaded from %s'%(self.pb_filename))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ckpt', default=None, help='pcl2pcl gan checkpoint, e.g. model_1000.ckpt')
+    parser.add_argument('--pb', default=None, help='frozen completion graph, used instead of --ckpt')
+    parser.add_argument('--input', required=True, help='directory of ply files, txt file list or .npy file')
+    parser.add_argument('--output_dir', required=True, help='completed point clouds are written here')
+    parser.add_argument('--batch_size', type=int, default=24, help='max micro-batch size')
+    parser.add_argument('--rotate_deg', type=float, default=None, help='rotate inputs around y axis, 90 for raw 3D-EPN data')
+    parser.add_argument('--save_input', action='store_true', help='also write the resampled inputs')
+    parser.add_argument('--random_seed', type=int, default=None, help='seed for resampling')
+    FLAGS = parser.parse_args()
+
+    if FLAGS.pb is not None:
+        completer = FrozenPCL2PCLCompleter(FLAGS.pb, batch_size=FLAGS.batch_size, random_seed=FLAGS.random_seed)
+    elif FLAGS.ckpt is not None:
+        completer = PCL2PCLCompleter(FLAGS.ckpt, batch_size=FLAGS.batch_size, random_seed=FLAGS.random_seed)
+    else:
+        print('Error, either --ckpt or --pb should be provided.')
+        exit()
+    nb_done = 0
+    for names_cur, inputs_cur, recons_cur in completer.complete_iter(FLAGS.input, rotate_deg=FLAGS.rotate_deg):
+        pc_util.write_ply_batch_with_name(recons_cur, names_cur, os.path.join(FLAGS.output_dir, 'reconstruction'))
+        if FLAGS.save_input:
+            pc_util.write_ply_batch_with_name([np.asarray(pc) for pc in inputs_cur], names_cur, os.path.join(FLAGS.output_dir, 'input'))
+        nb_done += len(names_cur)
+        print('Completed %d point clouds.'%(nb_done))
+    completer.close()
@@ -127,52 +127,74 @@ def batch_distance_matrix_general(A, B):
     return D
 
 
+# A shape is (N, P, C), fn maps a block (N, block_size, C) and its start index to outputs of shape (N, block_size, ...)
+# outputs are joined back to (N, P, ...), blocks are processed one after another so memory is bounded by one block
+def map_point_blocks(fn, A, block_size, dtype):
+    A_shape = tf.shape(A)
+    N, P, C = A_shape[0], A_shape[1], A_shape[2]
+    block_num = (P + block_size - 1) // block_size
+    A_padded = tf.pad(A, [[0, 0], [0, block_num * block_size - P], [0, 0]])
+    A_blocks = tf.transpose(tf.reshape(A_padded, (N, block_num, block_size, C)), perm=(1, 0, 2, 3))
+    outputs = tf.map_fn(lambda x: fn(x[0], x[1]), (A_blocks, tf.range(block_num) * block_size),
+                        dtype=dtype, parallel_iterations=1)
+
+    def join(output):  # (block_num, N, block_size, ...)
+        ndims = output.shape.ndims
+        output = tf.transpose(output, perm=[1, 0] + list(range(2, ndims)))
+        output = tf.reshape(output, tf.concat([[N, block_num * block_size], tf.shape(output)[3:]], axis=0))
+        return output[:, :P]
+
+    return tuple(join(output) for output in outputs) if isinstance(outputs, tuple) else join(outputs)
+
+
 # A shape is (N, P, C)
-def find_duplicate_columns(A):
-    N = A.shape[0]
-    P = A.shape[1]
-    indices_duplicated = np.fill((N, 1, P), 1, dtype=np.int32)
-    for idx in range(N):
-        _, indices = np.unique(A[idx], return_index=True, axis=0)
-        indices_duplicated[idx, :, indices] = 0
-    return indices_duplicated
+# return shape is (N, P), 1.0 for points with the same coordinates as a point before them, as np.unique keeps the first one
+def find_duplicate_columns(A, block_size=1024):
+    point_num = tf.shape(A)[1]
 
+    def duplicated_block(A_block, block_start):
+        equal = tf.reduce_all(tf.equal(tf.expand_dims(A_block, axis=2), tf.expand_dims(A, axis=1)), axis=3)  # (N, Pb, P)
+        before = tf.less(tf.expand_dims(tf.range(point_num), axis=0),
+                         tf.expand_dims(block_start + tf.range(tf.shape(A_block)[1]), axis=1))  # (Pb, P)
+        return tf.cast(tf.reduce_any(tf.logical_and(equal, before), axis=2), tf.float32)
 
-# add a big value to duplicate columns
-def prepare_for_unique_top_k(D, A):
-    indices_duplicated = tf.py_func(find_duplicate_columns, [A], tf.int32)
-    D += tf.reduce_max(D)*tf.cast(indices_duplicated, tf.float32)
+    return map_point_blocks(duplicated_block, A, block_size, tf.float32)
 
 
 # return shape is (N, P, K, 2)
-def knn_indices(points, k, sort=True, unique=True):
-    points_shape = tf.shape(points)
-    batch_size = points_shape[0]
-    point_num = points_shape[1]
-
-    D = batch_distance_matrix(points)
-    if unique:
-        prepare_for_unique_top_k(D, points)
-    distances, point_indices = tf.nn.top_k(-D, k=k, sorted=sort) # (N, P, K)
-    batch_indices = tf.tile(tf.reshape(tf.range(batch_size), (-1, 1, 1, 1)), (1, point_num, k, 1))
-    indices = tf.concat([batch_indices, tf.expand_dims(point_indices, axis=3)], axis=3)
-    return -distances, indices
+def knn_indices(points, k, sort=True, unique=True, query_block_size=512):
+    return knn_indices_general(points, points, k, sort, unique, query_block_size)
 
 
 # return shape is (N, P, K, 2)
 # last dim is 2: batch index, point index
-def knn_indices_general(queries, points, k, sort=True, unique=True):
+# queries are processed in blocks of query_block_size, only a (N, query_block_size, P_points) distance matrix is in memory
+def knn_indices_general(queries, points, k, sort=True, unique=True, query_block_size=512):
     queries_shape = tf.shape(queries)
     batch_size = queries_shape[0]
     point_num = queries_shape[1]
 
-    D = batch_distance_matrix_general(queries, points)
     if unique:
-        prepare_for_unique_top_k(D, points)
-    distances, point_indices = tf.nn.top_k(-D, k=k, sorted=sort)  # (N, P, K)
+        # add a big value to duplicate columns
+        duplicated = tf.expand_dims(find_duplicate_columns(points), axis=1)  # (N, 1, P)
+
+    def knn_block(queries_block, block_start):
+        D = batch_distance_matrix_general(queries_block, points)
+        if unique:
+            D += tf.reduce_max(D) * duplicated
+        distances, point_indices = tf.nn.top_k(-D, k=k, sorted=sort)  # (N, Pb, K)
+        return -distances, point_indices
+
+    query_num = queries.get_shape()[1].value
+    if query_num is not None and query_num <= query_block_size:
+        distances, point_indices = knn_block(queries, 0)
+    else:
+        distances, point_indices = map_point_blocks(knn_block, queries, query_block_size, (tf.float32, tf.int32))
+        distances.set_shape(queries.shape[:2].concatenate([k]))
+        point_indices.set_shape(queries.shape[:2].concatenate([k]))
     batch_indices = tf.tile(tf.reshape(tf.range(batch_size), (-1, 1, 1, 1)), (1, point_num, k, 1))
     indices = tf.concat([batch_indices, tf.expand_dims(point_indices, axis=3)], axis=3)
-    return -distances, indices
+    return distances, indices
 
 
 # indices is (N, P, K, 2)
@@ -12,6 +12,7 @@ ROOT_DIR = os.path.dirname(BASE_DIR)
 sys.path.append(os.path.join(ROOT_DIR, 'utils'))
 import provider
 import pc_util
+import dataset_manifest
 
 snc_synth_id_to_category = {
     '02691156': 'airplane',  '02773838': 'bag',        '02801938': 'basket',
@@ -210,27 +211,14 @@ class ShapeNetPartPointsDataset:
         return a list of point clouds
         '''
         # prepare file names
-        split_filename = os.path.join(os.path.dirname(dir), os.path.basename(dir)+'_%s_split.pickle'%(self.split))
-        with open(split_filename, 'rb') as pf:
-            pc_name_list = pickle.load(pf)
-        pc_filenames = []
-        for pc_n in pc_name_list:
-            pc_filenames.append(os.path.join(dir, pc_n))
-        pc_filenames.sort() # NOTE: sort the file names here!
+        pc_filenames = dataset_manifest.get_split_filenames(dir, self.split) # NOTE: sorted file names
 
         pickle_filename = os.path.join(os.path.dirname(dir), os.path.basename(dir)+'_%s.pickle'%(self.split))
-        if os.path.exists(pickle_filename):
-            print('Loading cached pickle file: %s'%(pickle_filename))
-            p_f = open(pickle_filename, 'rb')
-            point_clouds = pickle.load(p_f)
-            p_f.close()
-        else:
+        point_clouds = dataset_manifest.load_point_cloud_cache(pickle_filename, pc_filenames)
+        if point_clouds is None:
             print('Reading and caching pickle file.')
             point_clouds = pc_util.read_ply_from_file_list(pc_filenames) # a list of arrays
-            p_f = open(pickle_filename, 'wb')
-            pickle.dump(point_clouds, p_f)
-            print('Cache to %s'%(pickle_filename))
-            p_f.close()
+            dataset_manifest.save_point_cloud_cache(pickle_filename, pc_filenames, point_clouds)
 
         print('Loaded #point clouds: ', len(point_clouds))
 
@@ -452,22 +440,12 @@ class ShapeNetPartPointsDataset_V1:
         return a list of point clouds
         '''
         # prepare file names
-        split_filename = os.path.join(os.path.dirname(dir), os.path.basename(dir)+'_%s_split.pickle'%(self.split))
-        with open(split_filename, 'rb') as pf:
-            pc_name_list = pickle.load(pf)
-        self.pc_filenames = []
-        for pc_n in pc_name_list:
-            self.pc_filenames.append(os.path.join(dir, pc_n))
-        self.pc_filenames.sort() # NOTE: sort the file names here!
+        self.pc_filenames = dataset_manifest.get_split_filenames(dir, self.split) # NOTE: sorted file names
         #print(self.pc_filenames)
 
         pickle_filename = os.path.join(os.path.dirname(dir), os.path.basename(dir)+'_%s_rotated.pickle'%(self.split))
-        if os.path.exists(pickle_filename):
-            print('Loading cached pickle file: %s'%(pickle_filename))
-            p_f = open(pickle_filename, 'rb')
-            point_clouds = pickle.load(p_f)
-            p_f.close()
-        else:
+        point_clouds = dataset_manifest.load_point_cloud_cache(pickle_filename, self.pc_filenames)
+        if point_clouds is None:
             print('Reading and caching pickle file.')
             point_clouds = pc_util.read_ply_from_file_list(self.pc_filenames) # a list of arrays
 
@@ -477,10 +455,7 @@ class ShapeNetPartPointsDataset_V1:
                 rotated_points = pc_util.rotate_point_cloud_by_axis_angle(pc, [0,1,0], 90)
                 point_clouds[pc_id] = rotated_points
 
-            p_f = open(pickle_filename, 'wb')
-            pickle.dump(point_clouds, p_f)
-            print('Cache to %s'%(pickle_filename))
-            p_f.close()
+            dataset_manifest.save_point_cloud_cache(pickle_filename, self.pc_filenames, point_clouds)
 
         print('Loaded #point clouds: ', len(point_clouds))
 
@@ -709,21 +684,11 @@ class ShapeNet_3DEPN_PointsDataset:
         return a list of point clouds
         '''
         # prepare file names
-        split_filename = os.path.join(os.path.dirname(dir), os.path.basename(dir)+'_%s_split.pickle'%(self.split))
-        with open(split_filename, 'rb') as pf:
-            pc_name_list = pickle.load(pf)
-        self.pc_filenames = []
-        for pc_n in pc_name_list:
-            self.pc_filenames.append(os.path.join(dir, pc_n))
-        self.pc_filenames.sort() # NOTE: sort the file names here!
+        self.pc_filenames = dataset_manifest.get_split_filenames(dir, self.split) # NOTE: sorted file names
 
         pickle_filename = os.path.join(os.path.dirname(dir), os.path.basename(dir)+'_%s.pickle'%(self.split))
-        if os.path.exists(pickle_filename):
-            print('Loading cached pickle file: %s'%(pickle_filename))
-            p_f = open(pickle_filename, 'rb')
-            point_clouds = pickle.load(p_f)
-            p_f.close()
-        else:
+        point_clouds = dataset_manifest.load_point_cloud_cache(pickle_filename, self.pc_filenames)
+        if point_clouds is None:
             print('Reading and caching pickle file.')
             point_clouds = pc_util.read_ply_from_file_list(self.pc_filenames) # a list of arrays
 
@@ -732,10 +697,7 @@ class ShapeNet_3DEPN_PointsDataset:
                 rotated_points = pc_util.rotate_point_cloud_by_axis_angle(pc, [0,1,0], 90)
                 point_clouds[pc_id] = rotated_points
 
-            p_f = open(pickle_filename, 'wb')
-            pickle.dump(point_clouds, p_f)
-            print('Cache to %s'%(pickle_filename))
-            p_f.close()
+            dataset_manifest.save_point_cloud_cache(pickle_filename, self.pc_filenames, point_clouds)
 
         print('Loaded #point clouds: ', len(point_clouds))
 
@@ -0,0 +1,59 @@
+import math
+import numpy as np
+import tensorflow as tf
+
+NUM_PROJECTIONS = 100
+
+def _projection_scale(dim):
+  '''
+  1 / E|<u,v>| for unit v and u uniform on the unit sphere,
+  a distance projected onto a random direction is on average this many times shorter
+  '''
+  return math.sqrt(math.pi) * math.exp(math.lgamma((dim + 1) / 2.0) - math.lgamma(dim / 2.0))
+
+def sliced_wasserstein_distance(point_cloud_A, point_cloud_B, num_projections=NUM_PROJECTIONS):
+  '''
+  both clouds are projected onto random directions, in 1-D the optimal matching pairs the sorted values,
+  O(L*N*logN) instead of the O(N^2) approxmatch, differentiable through the sort
+  input:
+    point_cloud_A: Tensor, B x N x C
+    point_cloud_B: Tensor, B x N x C, same N
+    num_projections: number of random directions L, drawn anew at every run
+  return:
+    Tensor, B, mean point-wise distance of the sorted matchings, scaled by _projection_scale to the range of the point-wise emd (below it)
+  '''
+  npoint = point_cloud_A.get_shape()[1].value
+  dim = point_cloud_A.get_shape()[2].value
+  assert(point_cloud_B.get_shape()[1].value == npoint)
+
+  directions = tf.random_normal((dim, num_projections))
+  directions = tf.nn.l2_normalize(directions, 0) # (C, L)
+
+  proj_A = tf.transpose(tf.tensordot(point_cloud_A, directions, axes=1), (0, 2, 1)) # (B, L, N)
+  proj_B = tf.transpose(tf.tensordot(point_cloud_B, directions, axes=1), (0, 2, 1)) # (B, L, N)
+
+  sorted_A, _ = tf.nn.top_k(proj_A, k=npoint) # (B, L, N)
+  sorted_B, _ = tf.nn.top_k(proj_B, k=npoint) # (B, L, N)
+
+  distances = tf.reduce_mean(tf.abs(sorted_A - sorted_B), axis=[1, 2]) # (B)
+
+  return distances * _projection_scale(dim)
+
+if __name__=='__main__':
+  np.random.seed(100)
+  u = np.random.random((2, 2048, 3)).astype('float32')
+  v = u + np.array([0.1, 0, 0], dtype='float32') # every point moved by 0.1
+  w = u[:, np.random.permutation(2048), :] # same clouds, shuffled
+
+  u_tensor = tf.constant(u)
+  distances = sliced_wasserstein_distance(u_tensor, tf.constant(v))
+  distances1 = sliced_wasserstein_distance(u_tensor, tf.constant(w))
+
+  with tf.Session() as sess:
+    d_val = sess.run(distances)
+    print(d_val) # about 0.1
+    print(d_val.shape)
+
+    d_val1 = sess.run(distances1)
+    print(d_val1) # 0
+    print(d_val1.shape)
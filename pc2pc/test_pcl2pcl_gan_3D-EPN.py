@@ -8,6 +8,7 @@ from datetime import datetime
 import socket
 import os
 import sys
+import glob
 
 import tensorflow as tf
 import pickle
@@ -27,7 +28,7 @@ import config
 parser = argparse.ArgumentParser()
 parser.add_argument('--cat_name', default='chair', help='category name for training')
 parser.add_argument('--split_name', default='test', help='split name for inferring')
-parser.add_argument('--pcl2pcl_mode', default='sharedAE', help='[sharedAE | separateAE | withoutGAN | withoutRecon | EMD | GT]')
+parser.add_argument('--pcl2pcl_mode', default='sharedAE', help='[sharedAE | separateAE | withoutGAN | withoutRecon | EMD | SWD | GT]')
 FLAGS = parser.parse_args()
 
 split_name = FLAGS.split_name
@@ -100,6 +101,9 @@ if FLAGS.pcl2pcl_mode is not None:
     elif FLAGS.pcl2pcl_mode == 'EMD':
         para_config_gan['l_alpha'] = 0.25
         para_config_gan['l_beta'] = 0.75
+    elif FLAGS.pcl2pcl_mode == 'SWD':
+        para_config_gan['l_alpha'] = 0.25
+        para_config_gan['l_beta'] = 0.75
     elif FLAGS.pcl2pcl_mode == 'sharedAE' or FLAGS.pcl2pcl_mode == 'separateAE':
         para_config_gan['l_alpha'] = 0.25
         para_config_gan['l_beta'] = 0.75
@@ -266,6 +270,14 @@ elif cat_name == 'dresser':
         model_idx = 1000
         para_config_gan['pcl2pcl_gan_ckpt'] = '/workspace/pcl2pcl-gan/pc2pc/run/run_3D-EPN_pcl2pcl_GT/run_dresser/log_dresser_pcl2pcl_GT_3D-EPN_emd_sharedAE_2019-08-06-18-42-35/ckpts/model_%s.ckpt'%(model_idx)
 
+if pcl2pcl_mode == 'SWD':
+    # latest run of train_pcl2pcl_gan_3D-EPN.py --pcl2pcl_mode SWD for the category
+    model_idx = 1000
+    swd_run_dir = '/workspace/pcl2pcl-gan/pc2pc/run/run_3D-EPN_pcl2pcl_SWD/run_%s'%(cat_name)
+    swd_log_dirs = sorted(glob.glob(os.path.join(swd_run_dir, 'log_%s_pcl2pcl_gan_3D-EPN_swd_sharedAE_*'%(cat_name))))
+    swd_log_dir = swd_log_dirs[-1] if swd_log_dirs else os.path.join(swd_run_dir, 'log_%s_pcl2pcl_gan_3D-EPN_swd_sharedAE'%(cat_name))
+    para_config_gan['pcl2pcl_gan_ckpt'] = os.path.join(swd_log_dir, 'ckpts', 'model_%s.ckpt'%(model_idx))
+
 if not os.path.exists(os.path.dirname(para_config_gan['pcl2pcl_gan_ckpt'])):
     print('pcl2pcl_gan_ckpt not exist! %s'%(os.path.dirname(para_config_gan['pcl2pcl_gan_ckpt'])))
     exit()
@@ -0,0 +1,63 @@
+'''
+    Import time of the shared utils and data processing modules, from python -X importtime in a fresh interpreter.
+    Reports the cumulative import time of every module (best of --repeats) and its heaviest direct dependencies.
+
+    python3 benchmark_import_time.py
+    python3 benchmark_import_time.py --modules pc_util GKNN --repeats 10
+'''
+import os,sys
+import argparse
+import subprocess
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+SEARCH_DIRS = [os.path.join(ROOT_DIR, '../utils'), ROOT_DIR, os.path.join(ROOT_DIR, 'data_processing')]
+
+ENTRY_MODULES = ['pc_util', 'mesh_util', 'provider', 'GKNN', 'dataset_manifest', 'transform_point_clouds', 'sdf_util', 'job_queue']
+
+def import_times(module):
+    '''
+    return: cumulative us of importing module in a fresh interpreter and (cumulative us, name) of its direct imports,
+    None if it fails
+    '''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(SEARCH_DIRS + [env.get('PYTHONPATH', '')])
+    proc = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', 'import %s'%(module)],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, universal_newlines=True)
+    _, err = proc.communicate()
+    if proc.returncode != 0:
+        print('%s failed to import: %s'%(module, err.strip().split('\n')[-1]))
+        return None
+    entries = [] # (depth, cumulative us, name), a module is listed after all its imports
+    for line in err.split('\n'):
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, int(cumulative_us), name.strip()))
+    for i, (depth, cumulative_us, name) in enumerate(entries):
+        if depth == 0 and name == module:
+            deps = []
+            for dep_depth, dep_us, dep_name in reversed(entries[:i]):
+                if dep_depth == 0:
+                    break
+                if dep_depth == 1:
+                    deps.append((dep_us, dep_name))
+            return cumulative_us, deps
+    return None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modules', nargs='+', default=ENTRY_MODULES, help='modules to import')
+    parser.add_argument('--repeats', type=int, default=5, help='fresh interpreters per module, the best is reported')
+    parser.add_argument('--top', type=int, default=5, help='heaviest top level imports to list')
+    FLAGS = parser.parse_args()
+
+    for module in FLAGS.modules:
+        runs = [import_times(module) for _ in range(FLAGS.repeats)]
+        runs = [r for r in runs if r is not None]
+        if len(runs) == 0:
+            continue
+        cumulative_us, deps = min(runs, key=lambda r: r[0])
+        heaviest = sorted(deps, reverse=True)[:FLAGS.top]
+        print('%-24s %8.1f ms   %s'%(module, cumulative_us / 1000.0, ', '.join(['%s %.1f'%(name, us / 1000.0) for us, name in heaviest])))
@@ -11,6 +11,7 @@ import trimesh
 import pymesh
 from transforms3d.axangles import axangle2aff
 import glob
+import multiprocessing
 from tqdm import tqdm
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -19,6 +20,7 @@ import pc_util
 
 dim = 128
 points_sample_nb = 2048
+num_workers = multiprocessing.cpu_count()
 distance_field_dir = '/workspace/pointnet2/pc2pc/data/3D-EPN_dataset/EPN_results/converted_txt_dim%d'%(dim)
 if dim == 128:
     iso_val = 1.0
@@ -29,21 +31,25 @@ def find_files(dir, extension='.txt', recursive=True):
     filenames = glob.glob(os.path.join(dir, '**', '*'+extension), recursive=True)
     return filenames
 
-def read_df_from_txt(df_txt_filename):
-    
+def read_df_from_txt(df_txt_filename, use_cache=True):
+    '''
+    text format: 'dimx dimy dimz ' followed by the distances, x changes fastest
+    with use_cache, the volume is saved as .npy next to the text file and loaded from there next time
+    '''
+    cache_filename = df_txt_filename[:-4] + '.npy'
+    if use_cache and os.path.exists(cache_filename) and os.path.getmtime(cache_filename) >= os.path.getmtime(df_txt_filename):
+        return np.load(cache_filename)
+
     with open(df_txt_filename, 'r') as file:
-        long_line = file.readline()
-        numbers = long_line.split(' ')
-
-        dimx, dimy, dimz = int(numbers[0]), int(numbers[1]), int(numbers[2])
-        volume_data = np.zeros((dimx, dimy, dimz))
-        data = numbers[3:dimx*dimy*dimz+3]
-        data_idx = 0
-        for z_i in range(dimz):
-            for y_i in range(dimy):
-                for x_i in range(dimx):
-                    volume_data[x_i, y_i, z_i] = float(data[data_idx])
-                    data_idx += 1
+        numbers = np.fromstring(file.read(), sep=' ')
+    dimx, dimy, dimz = int(numbers[0]), int(numbers[1]), int(numbers[2])
+    volume_data = np.reshape(numbers[3:dimx*dimy*dimz+3], (dimx, dimy, dimz), order='F')
+
+    if use_cache:
+        # write to a tmp file first, so that a concurrent reader never sees a partial cache
+        tmp_filename = cache_filename[:-4] + '.%d.tmp.npy'%(os.getpid())
+        np.save(tmp_filename, volume_data)
+        os.replace(tmp_filename, cache_filename)
     return volume_data
 
 def get_clsId_modelId(df_filename):
@@ -52,7 +58,7 @@ def get_clsId_modelId(df_filename):
     return cls_id, mdl_id
 
 def get_isosurface(volume_data, iso_val):
-    vs, fs, _, _ = measure.marching_cubes_lewiner(df, iso_val)
+    vs, fs, _, _ = measure.marching_cubes_lewiner(volume_data, iso_val)
     
     final_mesh = trimesh.Trimesh(vertices=vs, faces=fs, validate=True)
     return final_mesh
@@ -86,21 +92,15 @@ def align_dfmesh_scanpc(df_mesh, df_resolution, scan_pc):
 
     return df_mesh
 
-df_txt_filenames = find_files(distance_field_dir)
-for df_txt_fn in tqdm(df_txt_filenames):
+def process_one_df(df_txt_fn):
 
     out_dir = os.path.dirname(df_txt_fn) + '_results_log_dimscale-align_iso-%f/pcloud'%(float(iso_val))
     out_gt_dir = os.path.join(out_dir, 'gt')
     out_recon_dir = os.path.join(out_dir, 'reconstruction')
     out_recon_mesh_dir = os.path.join(out_dir, 'reconstruction_mesh')
-    if not os.path.exists(out_dir):
-        os.makedirs(out_dir)
-    if not os.path.exists(out_gt_dir):
-        os.mkdir(out_gt_dir)
-    if not os.path.exists(out_recon_dir):
-        os.mkdir(out_recon_dir)
-    if not os.path.exists(out_recon_mesh_dir):
-        os.mkdir(out_recon_mesh_dir)
+    # other workers may be creating the same folders
+    for d in [out_gt_dir, out_recon_dir, out_recon_mesh_dir]:
+        os.makedirs(d, exist_ok=True)
 
     df = read_df_from_txt(df_txt_fn)
     df_mesh = get_isosurface(df, iso_val)
@@ -109,7 +109,7 @@ for df_txt_fn in tqdm(df_txt_filenames):
     scanned_pc_filename = os.path.join(SHAPENET_POINTCLOUD_DIR, cls_id, 'point_cloud_clean', mdl_id+'_clean.ply')
     if not os.path.exists(scanned_pc_filename):
         print('No scanning available: %s'%(scanned_pc_filename))
-        continue
+        return
     scan_pc = pc_util.read_ply_xyz(scanned_pc_filename)
     if 'v1' in SHAPENET_POINTCLOUD_DIR:
         # for v1 data, rotate it to align with v2
@@ -124,3 +124,11 @@ for df_txt_fn in tqdm(df_txt_filenames):
     recon_samples, _ = trimesh.sample.sample_surface(df_mesh, points_sample_nb)
     pc_util.write_ply(np.array(recon_samples), os.path.join(out_recon_dir, mdl_id+'.ply'))
 
+if __name__ == "__main__":
+    df_txt_filenames = find_files(distance_field_dir)
+    # reseed every worker, forked workers would sample the same gt points
+    pool = multiprocessing.Pool(num_workers, initializer=np.random.seed)
+    for _ in tqdm(pool.imap_unordered(process_one_df, df_txt_filenames), total=len(df_txt_filenames)):
+        pass
+    pool.close()
+    pool.join()
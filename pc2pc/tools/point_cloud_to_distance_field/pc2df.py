@@ -1,36 +1,59 @@
+'''
+    Convert all point clouds (.ply) of a directory to distance fields in the 3D-EPN text format.
+
+    python3 pc2df.py --input_dir path/to/point_cloud_clean --num_workers 8
+    python3 pc2df.py --input_dir path/to/point_cloud_clean --filter 1d63eb2b1f78aa88acf77e718d93f3e1
+'''
 import pc2df_utils
 import numpy as np
 import os,sys
-import pickle
+import argparse
+import multiprocessing
 from tqdm import tqdm
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(BASE_DIR, '../../../utils'))
 import pc_util
 
-reconstructed_pc_dir = '/workspace/pointnet2/pc2pc/data/ShapeNet_v2_point_cloud/02691156/point_cloud_clean'
-output_dir = os.path.join(os.path.dirname(reconstructed_pc_dir), os.path.basename(reconstructed_pc_dir)+'_gt_df')
+parser = argparse.ArgumentParser()
+parser.add_argument('--input_dir', default='/workspace/pointnet2/pc2pc/data/ShapeNet_v2_point_cloud/02691156/point_cloud_clean', help='directory of the .ply point clouds')
+parser.add_argument('--output_dir', default=None, help='<input_dir>_gt_df by default')
+parser.add_argument('--resolution', type=int, default=32, help='resolution of the distance fields')
+parser.add_argument('--filter', default=None, help='only convert point clouds with this in the name')
+parser.add_argument('--save_npy', action='store_true', help='also save the distance field as .npy next to the .txt')
+parser.add_argument('--num_workers', type=int, default=multiprocessing.cpu_count(), help='number of worker processes')
+FLAGS = parser.parse_args()
+
+reconstructed_pc_dir = FLAGS.input_dir
+output_dir = FLAGS.output_dir
+if output_dir is None:
+    output_dir = os.path.join(os.path.dirname(reconstructed_pc_dir), os.path.basename(reconstructed_pc_dir)+'_gt_df')
 if not os.path.exists(output_dir):
     os.mkdir(output_dir)
 
-resolution = 32
-
-all_recon_ply_names = os.listdir(reconstructed_pc_dir)
-for rpn in tqdm(all_recon_ply_names):
+resolution = FLAGS.resolution
 
-    if '1d63eb2b1f78aa88acf77e718d93f3e1' not in rpn:
-        continue
-    
+def convert_one(rpn):
     ply_filename = os.path.join(reconstructed_pc_dir, rpn)
     recon_pc = pc_util.read_ply_xyz(ply_filename)
 
     recon_pc = pc_util.rotate_point_cloud_by_axis_angle(recon_pc, [0,1,0], -90)
 
     recon_df, recon_df_arr = pc2df_utils.convert_pc2df(recon_pc, resolution=resolution)
-    
+
     #output_filename = os.path.join(output_dir, rpn[:-4]+'.txt')
     output_filename = os.path.join(output_dir, rpn[:-10]+'__0__.txt')
-    with open(output_filename, 'w') as file:
-        file.write('%d %d %d '%(resolution, resolution, resolution))
-        for ele in recon_df_arr:
-            file.write('%f '%(ele))
\ No newline at end of file
+    pc2df_utils.write_df_txt(output_filename, recon_df_arr, resolution)
+    if FLAGS.save_npy:
+        np.save(output_filename[:-4]+'.npy', recon_df)
+
+if __name__ == "__main__":
+    all_recon_ply_names = [rpn for rpn in sorted(os.listdir(reconstructed_pc_dir)) if rpn.endswith('.ply')]
+    if FLAGS.filter is not None:
+        all_recon_ply_names = [rpn for rpn in all_recon_ply_names if FLAGS.filter in rpn]
+
+    pool = multiprocessing.Pool(FLAGS.num_workers)
+    for _ in tqdm(pool.imap_unordered(convert_one, all_recon_ply_names), total=len(all_recon_ply_names)):
+        pass
+    pool.close()
+    pool.join()
@@ -20,6 +20,7 @@ def convert_pc2df(points, resolution=32):
     '''
     the range is defined by the bbox of points
     points: Nx3, np array
+    return: df_mat indexed as [x, y, z], df_arr in file order (x changes fastest)
     '''
     # scale points to fit within a cube of resolution (32) size length
     # move points to center at (resolution/2, resolution/2, resolution/2)
@@ -31,27 +32,26 @@ def convert_pc2df(points, resolution=32):
 
     bbox_center = (pts_max + pts_min) / 2.0
     trans_v = np.array([resolution/2.0, resolution/2.0, resolution/2.0]) - bbox_center
-    
-    for pidx, p in enumerate(points):
-        points[pidx] = p * scale_factor
-        points[pidx] = points[pidx] + trans_v    
-    ####
-
-    x_grid_size, y_grid_size, z_grid_size = 1, 1, 1
 
-    tree = spatial.KDTree(points)
-
-    df_mat = np.zeros((resolution, resolution, resolution))
-    df_arr = []
-    for z_i in range(resolution):
-        for y_i in range(resolution):
-            for x_i in range(resolution):
+    points = points * scale_factor + trans_v
+    ####
 
-                center_cur = get_cell_center(np.array([0,0,0]), x_i, y_i, z_i, x_grid_size, y_grid_size, z_grid_size)
+    # centers of all cells of size 1, one batched query
+    coords = np.arange(resolution) + 0.5
+    xv, yv, zv = np.meshgrid(coords, coords, coords, indexing='ij')
+    centers = np.stack((xv, yv, zv), axis=-1).reshape(-1, 3)
 
-                nearest_dist, _ = tree.query(center_cur)
+    tree = spatial.cKDTree(points)
+    nearest_dist, _ = tree.query(centers)
 
-                df_mat[x_i, y_i, z_i] = nearest_dist
-                df_arr.append(nearest_dist)
-    df_arr = np.array(df_arr)
+    df_mat = nearest_dist.reshape(resolution, resolution, resolution)
+    df_arr = df_mat.flatten(order='F')
     return df_mat, df_arr
+
+def write_df_txt(filename, df_arr, resolution=32):
+    '''
+    text format: 'res res res ' followed by the distances, each followed by a space
+    '''
+    with open(filename, 'w') as file:
+        file.write('%d %d %d '%(resolution, resolution, resolution))
+        file.write(' '.join(np.char.mod('%f', df_arr)) + ' ')
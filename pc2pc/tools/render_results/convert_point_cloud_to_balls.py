@@ -1,4 +1,12 @@
+'''
+    Convert point clouds to meshes of small spheres, one per point, for rendering paper figures.
+
+    python3 convert_point_cloud_to_balls.py --input_dir path/to/log_dir/pcloud --format obj
+    converts all .ply under input_dir (e.g. input/, reconstruction/, gt/ of a test log dir) to <input_dir>_balls, same tree
+'''
 import os,sys
+import argparse
+import multiprocessing
 import trimesh
 from plyfile import PlyData, PlyElement
 import numpy as np
@@ -7,6 +15,7 @@ from tqdm import tqdm
 #sphere_r = 0.01
 sphere_r = 0.008
 #sphere_r = 0.005
+sphere_count = [16,16]
 
 
 def read_ply_xyz(filename):
@@ -21,27 +30,79 @@ def read_ply_xyz(filename):
         vertices[:,2] = plydata['vertex'].data['z']
     return vertices
 
-def convert_point_cloud_to_balls(pc_ply_filename, output_filename):
+def write_mesh(points, faces, output_filename):
+    '''
+    binary ply or obj, both formatted in one go
+    '''
+    if output_filename.endswith('.ply'):
+        vertex = np.zeros(points.shape[0], dtype=[('x', '<f4'), ('y', '<f4'), ('z', '<f4')])
+        vertex['x'], vertex['y'], vertex['z'] = points[:,0], points[:,1], points[:,2]
+        face = np.zeros(faces.shape[0], dtype=[('n', 'u1'), ('vertex_indices', '<i4', (3,))])
+        face['n'] = 3
+        face['vertex_indices'] = faces
+        header = ('ply\nformat binary_little_endian 1.0\n'
+                  'element vertex %d\nproperty float x\nproperty float y\nproperty float z\n'
+                  'element face %d\nproperty list uchar int vertex_indices\nend_header\n')%(points.shape[0], faces.shape[0])
+        with open(output_filename, 'wb') as f:
+            f.write(header.encode('ascii'))
+            f.write(vertex.tobytes())
+            f.write(face.tobytes())
+    elif output_filename.endswith('.obj'):
+        with open(output_filename, 'w') as f:
+            f.write(('v %f %f %f\n'*points.shape[0])%tuple(points.ravel()))
+            f.write(('f %d %d %d\n'*faces.shape[0])%tuple((faces + 1).ravel())) # obj indices start from 1
+    else:
+        raise NotImplementedError('Format of %s not supported!'%(output_filename))
+
+def point_cloud_to_balls(pc, radius=sphere_r, count=sphere_count):
+    '''
+    pc: Nx3
+    return: vertices (N*V)x3 and faces (N*F)x3 of one template sphere instanced at every point
+    '''
+    sphere_m = trimesh.creation.uv_sphere(radius=radius, count=count)
+    sphere_v = np.array(sphere_m.vertices)
+    sphere_f = np.array(sphere_m.faces)
+
+    points = pc[:, np.newaxis, :] + sphere_v[np.newaxis, :, :] # N x V x 3
+    faces = sphere_f[np.newaxis, :, :] + (np.arange(pc.shape[0]) * sphere_v.shape[0])[:, np.newaxis, np.newaxis] # N x F x 3
+    return points.reshape(-1, 3), faces.reshape(-1, 3)
+
+def convert_point_cloud_to_balls(pc_ply_filename, output_filename, radius=sphere_r, count=sphere_count):
     pc = read_ply_xyz(pc_ply_filename)
+    points, faces = point_cloud_to_balls(pc, radius, count)
+    write_mesh(points, faces, output_filename)
+    return points.shape[0], faces.shape[0]
+
+def _convert_one(args):
+    pc_ply_filename, output_filename, radius, count = args
+    convert_point_cloud_to_balls(pc_ply_filename, output_filename, radius, count)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input_dir', required=True, help='result folder, all .ply under it are converted')
+    parser.add_argument('--output_dir', default=None, help='<input_dir>_balls by default, same tree as input_dir')
+    parser.add_argument('--format', default='obj', help='[obj | ply]')
+    parser.add_argument('--radius', type=float, default=sphere_r, help='sphere radius')
+    parser.add_argument('--count', type=int, default=sphere_count[0], help='latitude/longitude count of the sphere')
+    parser.add_argument('--num_workers', type=int, default=multiprocessing.cpu_count(), help='number of worker processes')
+    FLAGS = parser.parse_args()
+
+    input_dir = FLAGS.input_dir.rstrip('/')
+    output_dir = FLAGS.output_dir if FLAGS.output_dir is not None else input_dir + '_balls'
+
+    jobs = []
+    for cur_dir, _, filenames in os.walk(input_dir):
+        for fn in sorted(filenames):
+            if not fn.endswith('.ply'):
+                continue
+            out_dir = os.path.join(output_dir, os.path.relpath(cur_dir, input_dir))
+            if not os.path.exists(out_dir):
+                os.makedirs(out_dir)
+            out_filename = os.path.join(out_dir, fn[:-4] + '_spheres.' + FLAGS.format)
+            jobs.append((os.path.join(cur_dir, fn), out_filename, FLAGS.radius, [FLAGS.count, FLAGS.count]))
 
-    points = []
-    faces = []
-
-    for pts in tqdm(pc):
-        sphere_m = trimesh.creation.uv_sphere(radius=sphere_r, count=[16,16])
-        sphere_m.apply_translation(pts)
-
-        faces_offset = np.array(sphere_m.faces) + len(points)
-        faces.extend(faces_offset)
-        points.extend(np.array(sphere_m.vertices))
-    
-    points = np.array(points)
-    faces = np.array(faces)
-    print(points.shape, faces.shape)
-    finale_mesh = trimesh.Trimesh(vertices=points, faces=faces)
-    finale_mesh.export(output_filename)
-    #write_obj(points, faces, output_filename)
-
-convert_point_cloud_to_balls('pcl2pcl_motor_30P_25_gt.ply', 'pcl2pcl_motor_30P_25_gt_spheres.obj')
-convert_point_cloud_to_balls('pcl2pcl_motor_30P_25_recon.ply', 'pcl2pcl_motor_30P_25_recon_spheres.obj')
-convert_point_cloud_to_balls('pcl2pcl_motor_30P_25_input.ply', 'pcl2pcl_motor_30P_25_input_spheres.obj')
\ No newline at end of file
+    pool = multiprocessing.Pool(FLAGS.num_workers)
+    list(tqdm(pool.imap_unordered(_convert_one, jobs), total=len(jobs)))
+    pool.close()
+    pool.join()
+    print('Converted %d point clouds to %s'%(len(jobs), output_dir))
@@ -1,6 +1,10 @@
 # excute it with python2 !
 
 import os,sys
+import hashlib
+import multiprocessing
+# offscreen context without a display, every worker process creates its own, set before pyrender is imported
+os.environ.setdefault('PYOPENGL_PLATFORM', 'egl')
 import numpy as np
 import trimesh
 from PIL import Image, ImageDraw, ImageFont
@@ -41,6 +45,9 @@ def get_transformation_matrix(rx, ry, rz, tx, ty, tz):
 YFOV = np.pi / 3.0
 POINT_LIGHT_INTENSITY = 5.
 POINT_SIZE = 8
+VIEWPORT_WIDTH = 640*2
+VIEWPORT_HEIGHT = 480*2
+NUM_RENDER_WORKERS = 4 # one offscreen context each
 
 # for real data
 #CAM_POSE = get_transformation_matrix(-20,0,0,0,1.0,0)
@@ -81,103 +88,123 @@ def add_point_cloud_mesh_to_scene(point_cloud, scene, pose, pts_colors):
 
     return pc_node
 
-def render_big_gallery_overlay(dir_1, dir_2, pts_color_1=[0.5,0.5,0.5], pts_color_2=[0.5,0.5,0.5], nb=30):
-    '''
-    return np array of a big image
-    '''
+# per worker process: renderer and scene with camera and light
+_renderer = None
+_scene = None
+
+def _init_render_worker():
+    global _renderer, _scene
     cam = PerspectiveCamera(yfov=(YFOV))
-    cam_pose = CAM_POSE
-    
     point_l = PointLight(color=np.ones(3), intensity=POINT_LIGHT_INTENSITY)
-    scene = Scene(bg_color=np.array([1,1,1,0]))
-
-    # cam and light
-    _ = scene.add(cam, pose=cam_pose)
-    _ = scene.add(point_l, pose=cam_pose)
-
-    input_ply_filenames_1 = get_all_filnames(dir_1, nb)
-    input_ply_filenames_2 = get_all_filnames(dir_2, nb)
-
-    r = OffscreenRenderer(viewport_width=640*2, viewport_height=480*2, point_size=POINT_SIZE)
-    pc_pose = PC_POSE
-
-    images = []
-    for idx, input_pf in enumerate(input_ply_filenames_1):
-
-        input_pc_1 = read_ply_xyz(input_pf)
-        input_pc_2 = read_ply_xyz(input_ply_filenames_2[idx])
-
-        color_1 = np.array(pts_color_1)
-        color_1 = np.tile(color_1, (input_pc_1.shape[0], 1))
-
-        color_2 = np.array(pts_color_2)
-        color_2 = np.tile(color_2, (input_pc_2.shape[0], 1))
-
-        input_pc_node_1 = add_point_cloud_mesh_to_scene(input_pc_1, scene, pc_pose, color_1)
-        input_pc_node_2 = add_point_cloud_mesh_to_scene(input_pc_2, scene, pc_pose, color_2)
-
-        renderred_color, _ = r.render(scene)
+    _scene = Scene(bg_color=np.array([1,1,1,0]))
+    _ = _scene.add(cam, pose=CAM_POSE)
+    _ = _scene.add(point_l, pose=CAM_POSE)
+    _renderer = OffscreenRenderer(viewport_width=VIEWPORT_WIDTH, viewport_height=VIEWPORT_HEIGHT, point_size=POINT_SIZE)
 
-        scene.remove_node(input_pc_node_1)
-        scene.remove_node(input_pc_node_2)
-
-        images.append(renderred_color)
-
-    big_gallery = np.concatenate(images, axis=0)
-
-    r.delete()
+def get_tile_key(ply_filenames, pts_colors, draw_text):
+    '''
+    hash of the point cloud files and everything that changes the rendering
+    '''
+    h = hashlib.md5()
+    for pf, color in zip(ply_filenames, pts_colors):
+        with open(pf, 'rb') as f:
+            h.update(f.read())
+        h.update(np.asarray(color, dtype=np.float64).tobytes())
+    for v in [CAM_POSE, PC_POSE, np.array([YFOV, POINT_LIGHT_INTENSITY, POINT_SIZE, VIEWPORT_WIDTH, VIEWPORT_HEIGHT])]:
+        h.update(np.asarray(v, dtype=np.float64).tobytes())
+    h.update(('text:%s'%(os.path.basename(ply_filenames[0]) if draw_text else '')).encode('utf-8'))
+    return h.hexdigest()
+
+def render_tile(job):
+    '''
+    job: (ply filenames overlaid in one tile, their colors, draw_text, cache_dir)
+    render in the worker, or load from the cache
+    return: filename of the cached tile, HxWx3 uint8 .npy
+    '''
+    ply_filenames, pts_colors, draw_text, cache_dir = job
+    tile_filename = os.path.join(cache_dir, get_tile_key(ply_filenames, pts_colors, draw_text) + '.npy')
+    if os.path.exists(tile_filename):
+        return tile_filename
+
+    nodes = []
+    for pf, color in zip(ply_filenames, pts_colors):
+        input_pc = read_ply_xyz(pf)
+        colors = np.tile(np.array(color), (input_pc.shape[0], 1))
+        nodes.append(add_point_cloud_mesh_to_scene(input_pc, _scene, PC_POSE, colors))
+
+    renderred_color, _ = _renderer.render(_scene)
+
+    for node in nodes:
+        _scene.remove_node(node)
+
+    if draw_text:
+        im_here = Image.fromarray(renderred_color)
+        d = ImageDraw.Draw(im_here)
+        fnt = ImageFont.truetype(font='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', size=100)
+        d.text((0,0), ply_filenames[0].split('/')[-1], fill=(0,0,0,255), font=fnt)
+        renderred_color = np.array(im_here)
+
+    # write then rename, a killed worker never leaves a partial tile
+    tmp_filename = tile_filename[:-4] + '.%d.tmp.npy'%(os.getpid())
+    np.save(tmp_filename, renderred_color[:,:,:3])
+    os.rename(tmp_filename, tile_filename)
+    return tile_filename
+
+def render_tiles(jobs, num_workers=NUM_RENDER_WORKERS):
+    '''
+    render all tiles across worker processes, keeps the order of jobs
+    return: list of tile filenames
+    '''
+    for cache_dir in set([job[3] for job in jobs]):
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+    pool = multiprocessing.Pool(num_workers, initializer=_init_render_worker)
+    tile_filenames = list(tqdm(pool.imap(render_tile, jobs), total=len(jobs)))
+    pool.close()
+    pool.join()
+    return tile_filenames
+
+def assemble_gallery(tile_columns, canvas_filename):
+    '''
+    tile_columns: list of columns, each a list of tile filenames from top to bottom
+    tiles are streamed one by one into a memory-mapped canvas, not all kept in memory
+    return: the canvas, rows x columns tiles
+    '''
+    tile_h, tile_w = VIEWPORT_HEIGHT, VIEWPORT_WIDTH
+    nb_rows = max([len(col) for col in tile_columns])
+    canvas = np.lib.format.open_memmap(canvas_filename, mode='w+', dtype=np.uint8, shape=(nb_rows*tile_h, len(tile_columns)*tile_w, 3))
+    canvas[:] = 255
+    for c, col in enumerate(tile_columns):
+        for r, tile_filename in enumerate(col):
+            canvas[r*tile_h:(r+1)*tile_h, c*tile_w:(c+1)*tile_w] = np.load(tile_filename, mmap_mode='r')
+    canvas.flush()
+    return canvas
+
+def get_gallery_jobs(dirs, pts_colors, nb=30, draw_text=False, cache_dir=None):
+    '''
+    one tile per shape, the shapes of all dirs overlaid
+    tiles are cached in cache_dir, by default log_dir/render_cache for dirs like log_dir/pcloud/input,
+    never inside the point cloud dirs
+    '''
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(dirs[0]))), 'render_cache')
+    all_filenames = [get_all_filnames(d, nb) for d in dirs]
+    return [(list(pfs), pts_colors, draw_text, cache_dir) for pfs in zip(*all_filenames)]
 
-    return big_gallery
+def render_big_gallery_overlay(dir_1, dir_2, pts_color_1=[0.5,0.5,0.5], pts_color_2=[0.5,0.5,0.5], nb=30, cache_dir=None):
+    '''
+    return np array of a big image
+    '''
+    tile_filenames = render_tiles(get_gallery_jobs([dir_1, dir_2], [pts_color_1, pts_color_2], nb, cache_dir=cache_dir))
+    return np.concatenate([np.load(tf) for tf in tile_filenames], axis=0)
 
-def render_big_gallery(results_dir, nb=30, pts_colors=[0.5,0.5,0.5], draw_text=False):
+def render_big_gallery(results_dir, nb=30, pts_colors=[0.5,0.5,0.5], draw_text=False, cache_dir=None):
     '''
     pts_colors: [0,0,0]
     return np array of a big image
     '''
-
-    cam = PerspectiveCamera(yfov=(YFOV))
-    cam_pose = CAM_POSE
-    
-    point_l = PointLight(color=np.ones(3), intensity=POINT_LIGHT_INTENSITY)
-    scene = Scene(bg_color=np.array([1,1,1,0]))
-
-    # cam and light
-    _ = scene.add(cam, pose=cam_pose)
-    _ = scene.add(point_l, pose=cam_pose)
-
-    input_ply_filenames = get_all_filnames(results_dir, nb)
-
-    r = OffscreenRenderer(viewport_width=640*2, viewport_height=480*2, point_size=POINT_SIZE)
-    pc_pose = PC_POSE
-
-    images = []
-    for _, input_pf in enumerate(input_ply_filenames):
-
-        input_pc = read_ply_xyz(input_pf)
-
-        colors = np.array(pts_colors)
-        colors = np.tile(colors, (input_pc.shape[0], 1))
-
-        input_pc_node = add_point_cloud_mesh_to_scene(input_pc, scene, pc_pose, colors)
-
-        renderred_color, _ = r.render(scene)
-        
-        scene.remove_node(input_pc_node)
-
-        if draw_text:
-            im_here = Image.fromarray(renderred_color)
-            d = ImageDraw.Draw(im_here)
-            fnt = ImageFont.truetype(font='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', size=100)
-            d.text((0,0), input_pf.split('/')[-1], fill=(0,0,0,255), font=fnt)
-            renderred_color = np.array(im_here)
-
-        images.append(renderred_color)
-
-    big_gallery = np.concatenate(images, axis=0)
-
-    r.delete()
-
-    return big_gallery
+    tile_filenames = render_tiles(get_gallery_jobs([results_dir], [pts_colors], nb, draw_text, cache_dir))
+    return np.concatenate([np.load(tf) for tf in tile_filenames], axis=0)
 '''
 if __name__=='__main__':
     nb_chairs_to_show = 50
@@ -202,24 +229,36 @@ if __name__=='__main__':
     big_1_img.save(out_filename)
     print(out_filename)
 '''
-def render_log_dir(log_dir, nb_im=50, with_gt=False):
+def render_log_dir(log_dir, nb_im=50, with_gt=False, num_workers=NUM_RENDER_WORKERS):
+    '''
+    columns: input, reconstruction, overlay (and gt), tiles of all columns rendered in one pass and cached in log_dir/render_cache
+    '''
     nb_chairs_to_show = nb_im
 
     test_results_log_dir_1 = log_dir
     out_filename = test_results_log_dir_1 + '.png'
+    cache_dir = os.path.join(test_results_log_dir_1, 'render_cache')
+    input_dir = os.path.join(test_results_log_dir_1, 'pcloud','input')
+    recon_dir = os.path.join(test_results_log_dir_1, 'pcloud','reconstruction')
 
-    input_color_arr_1 = render_big_gallery(os.path.join(test_results_log_dir_1, 'pcloud','input'), nb_chairs_to_show, [.5,0.5,.5],draw_text=True)
-    recon_color_arr_1 = render_big_gallery(os.path.join(test_results_log_dir_1, 'pcloud','reconstruction'), nb_chairs_to_show, [0,0,1])
-    overlaid_1 = render_big_gallery_overlay(os.path.join(test_results_log_dir_1, 'pcloud','input'), os.path.join(test_results_log_dir_1, 'pcloud','reconstruction'), [.5,.5,.5], [1,0,0], nb_chairs_to_show)
-
-    big_1_im = np.concatenate([input_color_arr_1, recon_color_arr_1, overlaid_1], axis=1)
-
+    columns = [get_gallery_jobs([input_dir], [[.5,0.5,.5]], nb_chairs_to_show, True, cache_dir),
+               get_gallery_jobs([recon_dir], [[0,0,1]], nb_chairs_to_show, False, cache_dir),
+               get_gallery_jobs([input_dir, recon_dir], [[.5,.5,.5], [1,0,0]], nb_chairs_to_show, False, cache_dir)]
     if with_gt:
-        gt_color_arr_1 = render_big_gallery(os.path.join(test_results_log_dir_1, 'pcloud','gt'), nb_chairs_to_show, [0,0,1])
-        big_1_im = np.concatenate([big_1_im, gt_color_arr_1], axis=1)
+        columns.append(get_gallery_jobs([os.path.join(test_results_log_dir_1, 'pcloud','gt')], [[0,0,1]], nb_chairs_to_show, False, cache_dir))
+
+    tile_filenames = render_tiles([job for col in columns for job in col], num_workers)
+    tile_columns = []
+    for col in columns:
+        tile_columns.append(tile_filenames[:len(col)])
+        tile_filenames = tile_filenames[len(col):]
 
+    canvas_filename = os.path.join(cache_dir, 'canvas.npy')
+    big_1_im = assemble_gallery(tile_columns, canvas_filename)
     big_1_img = Image.fromarray(big_1_im)
     big_1_img.save(out_filename)
+    del big_1_im, big_1_img
+    os.remove(canvas_filename)
     print(out_filename)
 
 if __name__=='__main__':
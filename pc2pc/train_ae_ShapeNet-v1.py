@@ -37,7 +37,8 @@ para_config = {
     'epoch': 2001,
     'save_interval': 40, # unit in epoch
     
-    'loss': 'emd',
+    'loss': 'emd', # 'emd' | 'chamfer' | 'swd'
+    'swd_projections': 100, # random directions of the swd loss
     
     'data_aug': None,
 
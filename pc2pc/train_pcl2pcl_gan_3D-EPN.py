@@ -30,7 +30,7 @@ parser = argparse.ArgumentParser()
 parser.add_argument('--cat_name', default='chair', help='category name for training')
 parser.add_argument('--restore_ckpt', default=None, help='restore training checkpoint')
 parser.add_argument('--ae_mode', default='shared', help='shared or separate AE')
-parser.add_argument('--pcl2pcl_mode', default=None, help='pcl2pcl mode: [None | withoutGAN | withoutRecon | EMD]')
+parser.add_argument('--pcl2pcl_mode', default=None, help='pcl2pcl mode: [None | withoutGAN | withoutRecon | EMD | SWD]')
 FLAGS = parser.parse_args()
 
 cat_name = FLAGS.cat_name
@@ -47,6 +47,10 @@ if FLAGS.pcl2pcl_mode is not None:
         l_alpha = 0.25
         l_beta = 0.75
         loss = 'emd'
+    elif FLAGS.pcl2pcl_mode == 'SWD': # sliced wasserstein, fast emd estimate
+        l_alpha = 0.25
+        l_beta = 0.75
+        loss = 'swd'
     else:
         raise NotImplementedError('Pcl2pcl mode %s not implemented!'%(FLAGS.pcl2pcl_mode))
 else:
@@ -3,10 +3,13 @@
 #include <cstring> // memset
 #include <cstdlib> // rand, RAND_MAX
 #include <cmath> // sqrtf
+#include <vector>
+#include <algorithm> // min, max
 #include "tensorflow/core/framework/op.h"
 #include "tensorflow/core/framework/op_kernel.h"
 #include "tensorflow/core/framework/shape_inference.h"
 #include "tensorflow/core/framework/common_shape_fns.h"
+#include "tensorflow/core/util/work_sharder.h"
 using namespace tensorflow;
 
 REGISTER_OP("ThreeNN")
@@ -14,6 +17,7 @@ REGISTER_OP("ThreeNN")
     .Input("xyz2: float32")
     .Output("dist: float32")
     .Output("idx: int32")
+    .Attr("grid_min_points: int = 1024")
     .SetShapeFn([](::tensorflow::shape_inference::InferenceContext* c) {
         c->set_output(0, c->input(0));
         c->set_output(1, c->input(0));
@@ -54,101 +58,229 @@ static double get_time(){
     return tp.tv_sec+tp.tv_nsec*1e-9;
 }
 
-// Find three nearest neigbors with square distance
+// Keep the three smallest (d,k), ties broken by the smaller index as the brute force scan does
+static inline void insert_best3(double d, int k, double *best, int *besti) {
+    if (d<best[0] || (d==best[0] && k<besti[0])) {
+        best[2]=best[1]; besti[2]=besti[1];
+        best[1]=best[0]; besti[1]=besti[0];
+        best[0]=d; besti[0]=k;
+    } else if (d<best[1] || (d==best[1] && k<besti[1])) {
+        best[2]=best[1]; besti[2]=besti[1];
+        best[1]=d; besti[1]=k;
+    } else if (d<best[2] || (d==best[2] && k<besti[2])) {
+        best[2]=d; besti[2]=k;
+    }
+}
+
+// Find three nearest neigbors with square distance, for the flattened query points [start,limit) of (b,n)
 // input: xyz1 (b,n,3), xyz2(b,m,3)
 // output: dist (b,n,3), idx (b,n,3)
-void threenn_cpu(int b, int n, int m, const float *xyz1, const float *xyz2, float *dist, int *idx) {
-     for (int i=0;i<b;++i) {
-        for (int j=0;j<n;++j) {
-	    float x1=xyz1[j*3+0];
-	    float y1=xyz1[j*3+1];
-	    float z1=xyz1[j*3+2];
-            double best1=1e40; double best2=1e40; double best3=1e40;
-            int besti1=0; int besti2=0; int besti3=0;
-            for (int k=0;k<m;++k) {
-                float x2=xyz2[k*3+0];
-	        float y2=xyz2[k*3+1];
-	        float z2=xyz2[k*3+2];
-		//float d=max(sqrtf((x2-x1)*(x2-x1)+(y2-y1)*(y2-y1)+(z2-z1)*(z2-z1)),1e-20f);
-		double d=(x2-x1)*(x2-x1)+(y2-y1)*(y2-y1)+(z2-z1)*(z2-z1);
-                if (d<best1) {
-                    best3=best2;
-                    besti3=besti2;
-                    best2=best1;
-                    besti2=besti1;
-                    best1=d;
-                    besti1=k;
-                } else if (d<best2) {
-                    best3=best2;
-                    besti3=besti2;
-                    best2=d;
-                    besti2=k;
-                } else if (d<best3) {
-                    best3=d;
-                    besti3=k;
+void threenn_cpu(int n, int m, const float *xyz1, const float *xyz2, float *dist, int *idx, int64 start, int64 limit) {
+    for (int64 q=start;q<limit;++q) {
+        const float *pts2=xyz2+(q/n)*m*3;
+        float x1=xyz1[q*3+0];
+        float y1=xyz1[q*3+1];
+        float z1=xyz1[q*3+2];
+        double best1=1e40; double best2=1e40; double best3=1e40;
+        int besti1=0; int besti2=0; int besti3=0;
+        for (int k=0;k<m;++k) {
+            float x2=pts2[k*3+0];
+            float y2=pts2[k*3+1];
+            float z2=pts2[k*3+2];
+            double d=(x2-x1)*(x2-x1)+(y2-y1)*(y2-y1)+(z2-z1)*(z2-z1);
+            if (d<best1) {
+                best3=best2;
+                besti3=besti2;
+                best2=best1;
+                besti2=besti1;
+                best1=d;
+                besti1=k;
+            } else if (d<best2) {
+                best3=best2;
+                besti3=besti2;
+                best2=d;
+                besti2=k;
+            } else if (d<best3) {
+                best3=d;
+                besti3=k;
+            }
+        }
+        dist[q*3]=best1;
+        idx[q*3]=besti1;
+        dist[q*3+1]=best2;
+        idx[q*3+1]=besti2;
+        dist[q*3+2]=best3;
+        idx[q*3+2]=besti3;
+    }
+}
+
+// Uniform grid of cubic cells over the bbox of one set of known points, points sorted by cell (counting sort, stable in index)
+struct PointGrid {
+    float origin[3];
+    float cell_size;
+    int res[3];
+    std::vector<int> cell_start; // (res[0]*res[1]*res[2]+1)
+    std::vector<int> cell_points; // (m)
+
+    int cell_coord(float v, int axis) const {
+        int c=(int)floorf((v-origin[axis])/cell_size);
+        return std::min(std::max(c,0),res[axis]-1);
+    }
+    int cell_index(int cx, int cy, int cz) const {
+        return (cx*res[1]+cy)*res[2]+cz;
+    }
+};
+
+// Build the grid of xyz2 (m,3) with about kGridPointsPerCell points per cell for a volume filling cloud
+const int kGridPointsPerCell=2;
+bool build_point_grid(int m, const float *xyz2, PointGrid *grid) {
+    float pmin[3], pmax[3];
+    for (int a=0;a<3;++a) {
+        pmin[a]=xyz2[a];
+        pmax[a]=xyz2[a];
+    }
+    for (int k=1;k<m;++k) {
+        for (int a=0;a<3;++a) {
+            pmin[a]=std::min(pmin[a],xyz2[k*3+a]);
+            pmax[a]=std::max(pmax[a],xyz2[k*3+a]);
+        }
+    }
+    float extent=std::max(pmax[0]-pmin[0],std::max(pmax[1]-pmin[1],pmax[2]-pmin[2]));
+    if (!(extent>0)) // all points at one place, or nan
+        return false;
+    int max_res=std::max(1,(int)ceil(cbrt((double)m/kGridPointsPerCell)));
+    grid->cell_size=extent/max_res;
+    for (int a=0;a<3;++a) {
+        grid->origin[a]=pmin[a];
+        grid->res[a]=std::min(max_res,(int)((pmax[a]-pmin[a])/grid->cell_size)+1);
+    }
+    int nb_cells=grid->res[0]*grid->res[1]*grid->res[2];
+    std::vector<int> cell_of(m);
+    grid->cell_start.assign(nb_cells+1,0);
+    for (int k=0;k<m;++k) {
+        cell_of[k]=grid->cell_index(grid->cell_coord(xyz2[k*3],0),grid->cell_coord(xyz2[k*3+1],1),grid->cell_coord(xyz2[k*3+2],2));
+        grid->cell_start[cell_of[k]+1]++;
+    }
+    for (int c=0;c<nb_cells;++c)
+        grid->cell_start[c+1]+=grid->cell_start[c];
+    std::vector<int> fill(grid->cell_start.begin(),grid->cell_start.end()-1);
+    grid->cell_points.resize(m);
+    for (int k=0;k<m;++k)
+        grid->cell_points[fill[cell_of[k]]++]=k;
+    return true;
+}
+
+// Same output as threenn_cpu, searching the cells around each query in growing shells of the grid of its batch
+// grids: (b), built by build_point_grid on xyz2
+void threenn_grid_cpu(int n, int m, const float *xyz1, const float *xyz2, const PointGrid *grids, float *dist, int *idx, int64 start, int64 limit) {
+    for (int64 q=start;q<limit;++q) {
+        const PointGrid &grid=grids[q/n];
+        const float *pts2=xyz2+(q/n)*m*3;
+        float x1=xyz1[q*3+0];
+        float y1=xyz1[q*3+1];
+        float z1=xyz1[q*3+2];
+        const float p1[3]={x1,y1,z1};
+        int c1[3]={grid.cell_coord(x1,0),grid.cell_coord(y1,1),grid.cell_coord(z1,2)};
+        double best[3]={1e40,1e40,1e40};
+        int besti[3]={0,0,0};
+        for (int s=0;;++s) {
+            int lo[3], hi[3];
+            for (int a=0;a<3;++a) {
+                lo[a]=std::max(c1[a]-s,0);
+                hi[a]=std::min(c1[a]+s,grid.res[a]-1);
+            }
+            // cells at chebyshev distance s from the query cell, inner columns only have their two z faces in the shell
+            for (int cx=lo[0];cx<=hi[0];++cx) {
+                for (int cy=lo[1];cy<=hi[1];++cy) {
+                    bool inner=std::abs(cx-c1[0])<s && std::abs(cy-c1[1])<s;
+                    for (int cz=lo[2];cz<=hi[2];++cz) {
+                        if (inner && std::abs(cz-c1[2])<s) {
+                            cz=c1[2]+s-1; // jump to the upper face
+                            continue;
+                        }
+                        int c=grid.cell_index(cx,cy,cz);
+                        for (int e=grid.cell_start[c];e<grid.cell_start[c+1];++e) {
+                            int k=grid.cell_points[e];
+                            float x2=pts2[k*3+0];
+                            float y2=pts2[k*3+1];
+                            float z2=pts2[k*3+2];
+                            double d=(x2-x1)*(x2-x1)+(y2-y1)*(y2-y1)+(z2-z1)*(z2-z1);
+                            insert_best3(d,k,best,besti);
+                        }
+                    }
                 }
-            } 
-            dist[j*3]=best1;
-            idx[j*3]=besti1;
-            dist[j*3+1]=best2;
-            idx[j*3+1]=besti2;
-            dist[j*3+2]=best3;
-            idx[j*3+2]=besti3;
-        } 
-        xyz1+=n*3;
-        xyz2+=m*3;
-        dist+=n*3;
-        idx+=n*3;
+            }
+            // points outside the searched cells are at least gap away, stop once the third best is strictly closer
+            // (less a margin for points rounded into a neighbouring cell)
+            double gap=1e40;
+            for (int a=0;a<3;++a) {
+                if (c1[a]-s>0)
+                    gap=std::min(gap,(double)p1[a]-(grid.origin[a]+(double)(c1[a]-s)*grid.cell_size));
+                if (c1[a]+s<grid.res[a]-1)
+                    gap=std::min(gap,grid.origin[a]+(double)(c1[a]+s+1)*grid.cell_size-(double)p1[a]);
+            }
+            if (gap>=1e40)
+                break;
+            gap-=1e-3*grid.cell_size;
+            if (gap>0 && best[2]<gap*gap)
+                break;
+        }
+        for (int t=0;t<3;++t) {
+            dist[q*3+t]=best[t];
+            idx[q*3+t]=besti[t];
+        }
     }
-} 
+}
 
-// input: points (b,m,c), idx (b,n,3), weight (b,n,3)
+// input: points (b,m,c), idx (b,n,3), weight (b,n,3), for the flattened query points [start,limit) of (b,n)
 // output: out (b,n,c)
-void threeinterpolate_cpu(int b, int m, int c, int n, const float *points, const int *idx, const float *weight, float *out) {
+void threeinterpolate_cpu(int m, int c, int n, const float *points, const int *idx, const float *weight, float *out, int64 start, int64 limit) {
      float w1,w2,w3;
      int i1,i2,i3;
-     for (int i=0;i<b;++i) {
-        for (int j=0;j<n;++j) {
-            w1=weight[j*3];
-            w2=weight[j*3+1];
-            w3=weight[j*3+2]; 
-            i1=idx[j*3];
-            i2=idx[j*3+1];
-            i3=idx[j*3+2];
-            for (int l=0;l<c;++l) {
-                out[j*c+l] = points[i1*c+l]*w1 + points[i2*c+l]*w2 + points[i3*c+l]*w3;
-            }
-        } 
-        points+=m*c;
-        idx+=n*3;
-        weight+=n*3;
-        out+=n*c;
+     for (int64 q=start;q<limit;++q) {
+        const float *pts=points+(q/n)*m*c;
+        w1=weight[q*3];
+        w2=weight[q*3+1];
+        w3=weight[q*3+2];
+        i1=idx[q*3];
+        i2=idx[q*3+1];
+        i3=idx[q*3+2];
+        for (int l=0;l<c;++l) {
+            out[q*c+l] = pts[i1*c+l]*w1 + pts[i2*c+l]*w2 + pts[i3*c+l]*w3;
+        }
     }
 }
 
-// input: grad_out (b,n,c), idx (b,n,3), weight (b,n,3)
+// Channels per work unit of the gradient, units own disjoint (batch, channel block) slices of grad_points
+const int kGradChannelBlock=16;
+
+// input: grad_out (b,n,c), idx (b,n,3), weight (b,n,3), for the (batch, channel block) units [start,limit)
 // output: grad_points (b,m,c)
-void threeinterpolate_grad_cpu(int b, int n, int c, int m, const float *grad_out, const int *idx, const float *weight, float *grad_points) {
+void threeinterpolate_grad_cpu(int n, int c, int m, const float *grad_out, const int *idx, const float *weight, float *grad_points, int64 start, int64 limit) {
+     int nb_blocks=(c+kGradChannelBlock-1)/kGradChannelBlock;
      float w1,w2,w3;
      int i1,i2,i3;
-     for (int i=0;i<b;++i) {
+     for (int64 u=start;u<limit;++u) {
+        int i=u/nb_blocks;
+        int l0=(u%nb_blocks)*kGradChannelBlock;
+        int l1=std::min(l0+kGradChannelBlock,c);
+        const float *g=grad_out+(int64)i*n*c;
+        const int *id=idx+(int64)i*n*3;
+        const float *w=weight+(int64)i*n*3;
+        float *gp=grad_points+(int64)i*m*c;
         for (int j=0;j<n;++j) {
-            w1=weight[j*3];
-            w2=weight[j*3+1];
-            w3=weight[j*3+2]; 
-            i1=idx[j*3];
-            i2=idx[j*3+1];
-            i3=idx[j*3+2];
-            for (int l=0;l<c;++l) {
-                grad_points[i1*c+l] += grad_out[j*c+l]*w1;
-                grad_points[i2*c+l] += grad_out[j*c+l]*w2;
-                grad_points[i3*c+l] += grad_out[j*c+l]*w3;
+            w1=w[j*3];
+            w2=w[j*3+1];
+            w3=w[j*3+2];
+            i1=id[j*3];
+            i2=id[j*3+1];
+            i3=id[j*3+2];
+            for (int l=l0;l<l1;++l) {
+                gp[i1*c+l] += g[j*c+l]*w1;
+                gp[i2*c+l] += g[j*c+l]*w2;
+                gp[i3*c+l] += g[j*c+l]*w3;
             }
-        } 
-        grad_out+=n*c;
-        idx+=n*3;
-        weight+=n*3;
-        grad_points+=m*c;
+        }
     }
 }
 
@@ -156,7 +288,9 @@ void threeinterpolate_grad_cpu(int b, int n, int c, int m, const float *grad_out
 
 class ThreeNNOp : public OpKernel {
     public:
-        explicit ThreeNNOp(OpKernelConstruction* context) : OpKernel(context) {}
+        explicit ThreeNNOp(OpKernelConstruction* context) : OpKernel(context) {
+            OP_REQUIRES_OK(context, context->GetAttr("grid_min_points", &grid_min_points_));
+        }
 
         void Compute(OpKernelContext* context) override {
             const Tensor& xyz1_tensor = context->input(0);
@@ -181,8 +315,32 @@ class ThreeNNOp : public OpKernel {
             float *dist = &(dist_flat(0));
             auto idx_flat = idx_tensor->flat<int>();
             int *idx = &(idx_flat(0));
-            threenn_cpu(b,n,m,xyz1,xyz2,dist,idx);
+
+            // b x n query points split over the cpu worker threads, grid search when there are many known points
+            auto worker_threads = *(context->device()->tensorflow_cpu_worker_threads());
+            if (grid_min_points_>0 && m>=grid_min_points_ && m>=3) {
+                std::vector<PointGrid> grids(b);
+                std::vector<char> grid_ok(b);
+                Shard(worker_threads.num_threads, worker_threads.workers, b, (int64)m*20,
+                      [&](int64 start, int64 limit) {
+                          for (int64 i=start;i<limit;++i)
+                              grid_ok[i]=build_point_grid(m,xyz2+i*m*3,&grids[i]);
+                      });
+                if (std::find(grid_ok.begin(),grid_ok.end(),0)==grid_ok.end()) {
+                    Shard(worker_threads.num_threads, worker_threads.workers, (int64)b*n, 1000,
+                          [&](int64 start, int64 limit) {
+                              threenn_grid_cpu(n,m,xyz1,xyz2,&grids[0],dist,idx,start,limit);
+                          });
+                    return;
+                }
+            }
+            Shard(worker_threads.num_threads, worker_threads.workers, (int64)b*n, (int64)m*10,
+                  [&](int64 start, int64 limit) {
+                      threenn_cpu(n,m,xyz1,xyz2,dist,idx,start,limit);
+                  });
         }
+    private:
+        int grid_min_points_;
 };
 REGISTER_KERNEL_BUILDER(Name("ThreeNN").Device(DEVICE_CPU), ThreeNNOp);
 
@@ -216,7 +374,11 @@ class ThreeInterpolateOp: public OpKernel{
             const float *weight = &(weight_flat(0));
             auto out_flat = out_tensor->flat<float>();
             float *out = &(out_flat(0));
-            threeinterpolate_cpu(b,m,c,n,points,idx,weight,out);
+            auto worker_threads = *(context->device()->tensorflow_cpu_worker_threads());
+            Shard(worker_threads.num_threads, worker_threads.workers, (int64)b*n, (int64)c*6,
+                  [&](int64 start, int64 limit) {
+                      threeinterpolate_cpu(m,c,n,points,idx,weight,out,start,limit);
+                  });
         }
 };
 REGISTER_KERNEL_BUILDER(Name("ThreeInterpolate").Device(DEVICE_CPU),ThreeInterpolateOp);
@@ -256,7 +418,13 @@ class ThreeInterpolateGradOp: public OpKernel{
             auto grad_points_flat = grad_points_tensor->flat<float>();
             float *grad_points = &(grad_points_flat(0));
             memset(grad_points, 0, sizeof(float)*b*m*c);
-            threeinterpolate_grad_cpu(b,n,c,m,grad_out,idx,weight,grad_points);
+            // units of (batch, channel block) write disjoint slices of grad_points, no races between threads
+            auto worker_threads = *(context->device()->tensorflow_cpu_worker_threads());
+            int nb_blocks=(c+kGradChannelBlock-1)/kGradChannelBlock;
+            Shard(worker_threads.num_threads, worker_threads.workers, (int64)b*nb_blocks, (int64)n*kGradChannelBlock*6,
+                  [&](int64 start, int64 limit) {
+                      threeinterpolate_grad_cpu(n,c,m,grad_out,idx,weight,grad_points,start,limit);
+                  });
         }
 };
 REGISTER_KERNEL_BUILDER(Name("ThreeInterpolateGrad").Device(DEVICE_CPU),ThreeInterpolateGradOp);
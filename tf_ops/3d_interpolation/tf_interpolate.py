@@ -5,16 +5,17 @@ import os
 BASE_DIR = os.path.dirname(__file__)
 sys.path.append(BASE_DIR)
 interpolate_module=tf.load_op_library(os.path.join(BASE_DIR, 'tf_interpolate_so.so'))
-def three_nn(xyz1, xyz2):
+def three_nn(xyz1, xyz2, grid_min_points=1024):
     '''
     Input:
         xyz1: (b,n,3) float32 array, unknown points
         xyz2: (b,m,3) float32 array, known points
+        grid_min_points: int, CPU kernel searches a uniform grid of xyz2 when m >= grid_min_points (same output), 0 to always brute force
     Output:
         dist: (b,n,3) float32 array, distances to known points
         idx: (b,n,3) int32 array, indices to known points
     '''
-    return interpolate_module.three_nn(xyz1, xyz2)
+    return interpolate_module.three_nn(xyz1, xyz2, grid_min_points=grid_min_points)
 ops.NoGradient('ThreeNN')
 def three_interpolate(points, idx, weight):
     '''
@@ -0,0 +1,76 @@
+'''
+    Benchmark the blocked knn_point against the previous full distance matrix version, on GPU (selection_sort is GPU only).
+    Checks that both give identical outputs, reports time per run and peak GPU memory of each.
+
+    python benchmark_knn_point.py --batch_size 16 --npoint 1024 --k 32
+'''
+import argparse
+import time
+import numpy as np
+import tensorflow as tf
+from tf_grouping import knn_point, select_top_k
+
+def knn_point_dense(k, xyz1, xyz2):
+    '''
+    previous knn_point: (b,m,n,c) tiled points and the full (b,m,n) distance matrix
+    '''
+    b = xyz1.get_shape()[0].value
+    n = xyz1.get_shape()[1].value
+    c = xyz1.get_shape()[2].value
+    m = xyz2.get_shape()[1].value
+    xyz1 = tf.tile(tf.reshape(xyz1, (b,1,n,c)), [1,m,1,1])
+    xyz2 = tf.tile(tf.reshape(xyz2, (b,m,1,c)), [1,1,n,1])
+    dist = tf.reduce_sum((xyz1-xyz2)**2, -1)
+    outi, out = select_top_k(k, dist)
+    idx = tf.slice(outi, [0,0,0], [-1,-1,k])
+    val = tf.slice(out, [0,0,0], [-1,-1,k])
+    return val, idx
+
+def run(knn_fn, k, xyz1_np, xyz2_np, nb_runs):
+    '''
+    return: outputs, seconds per run, peak GPU bytes
+    '''
+    tf.reset_default_graph()
+    with tf.device('/gpu:0'):
+        xyz1 = tf.constant(xyz1_np)
+        xyz2 = tf.constant(xyz2_np)
+        val, idx = knn_fn(k, xyz1, xyz2)
+        max_bytes = tf.contrib.memory_stats.MaxBytesInUse()
+    config = tf.ConfigProto()
+    config.gpu_options.allow_growth = True
+    with tf.Session(config=config) as sess:
+        outputs = sess.run([val, idx]) # warm up
+        start_time = time.time()
+        for _ in range(nb_runs):
+            sess.run([val, idx])
+        elapsed = (time.time() - start_time) / nb_runs
+        peak_bytes = sess.run(max_bytes)
+    return outputs, elapsed, peak_bytes
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ndatasets', type=int, nargs='+', default=[2048, 8192], help='numbers of input points n')
+    parser.add_argument('--batch_size', type=int, default=16)
+    parser.add_argument('--npoint', type=int, default=1024, help='number of query points m')
+    parser.add_argument('--k', type=int, default=32)
+    parser.add_argument('--nb_runs', type=int, default=20)
+    FLAGS = parser.parse_args()
+
+    np.random.seed(100)
+    for n in FLAGS.ndatasets:
+        xyz1_np = np.random.random((FLAGS.batch_size, n, 3)).astype('float32')
+        xyz2_np = xyz1_np[:, np.random.choice(n, FLAGS.npoint, replace=False), :]
+
+        print('n=%d, m=%d, b=%d, k=%d'%(n, FLAGS.npoint, FLAGS.batch_size, FLAGS.k))
+        results = {}
+        for name, knn_fn in [('dense', knn_point_dense), ('blocked', knn_point)]:
+            try:
+                results[name] = run(knn_fn, FLAGS.k, xyz1_np, xyz2_np, FLAGS.nb_runs)
+            except tf.errors.ResourceExhaustedError:
+                print('  %-8s out of memory'%(name))
+                continue
+            _, elapsed, peak_bytes = results[name]
+            print('  %-8s %8.2f ms/run, peak %8.1f MB'%(name, elapsed*1000, peak_bytes/2.0**20))
+        if len(results) == 2:
+            same = np.array_equal(results['dense'][0][0], results['blocked'][0][0]) and np.array_equal(results['dense'][0][1], results['blocked'][0][1])
+            print('  identical outputs: %s'%(same))
@@ -45,30 +45,39 @@ def _group_point_grad(op, grad_out):
     idx = op.inputs[1]
     return [grouping_module.group_point_grad(points, idx, grad_out), None]
 
-def knn_point(k, xyz1, xyz2):
+def knn_point(k, xyz1, xyz2, max_block_size=2**24):
     '''
     Input:
         k: int32, number of k in k-nn search
         xyz1: (batch_size, ndataset, c) float32 array, input points
         xyz2: (batch_size, npoint, c) float32 array, query points
+        max_block_size: max number of (query, point) pairs of the batch in memory at a time
     Output:
         val: (batch_size, npoint, k) float32 array, L2 distances
         idx: (batch_size, npoint, k) int32 array, indices to input points
+    queries are processed in blocks, one after another, so memory does not grow with npoint,
+    every query row is computed and sorted as with the full distance matrix, the outputs are identical
     '''
     b = xyz1.get_shape()[0].value
     n = xyz1.get_shape()[1].value
     c = xyz1.get_shape()[2].value
     m = xyz2.get_shape()[1].value
-    print(b, n, c, m)
-    print(xyz1, b,1,n,c)
-    xyz1 = tf.tile(tf.reshape(xyz1, (b,1,n,c)), [1,m,1,1])
-    xyz2 = tf.tile(tf.reshape(xyz2, (b,m,1,c)), [1,1,n,1])
-    dist = tf.reduce_sum((xyz1-xyz2)**2, -1)
-    print(dist, k)
-    outi, out = select_top_k(k, dist)
-    idx = tf.slice(outi, [0,0,0], [-1,-1,k])
-    val = tf.slice(out, [0,0,0], [-1,-1,k])
-    print(idx, val)
+    block_m = min(m, max(1, max_block_size // (b*n)))
+    block_num = (m + block_m - 1) // block_m
+
+    def knn_block(xyz2_block):
+        dist = tf.reduce_sum((tf.expand_dims(xyz1, 1) - tf.expand_dims(xyz2_block, 2))**2, -1) # (b,block_m,n)
+        outi, out = select_top_k(k, dist)
+        return tf.slice(outi, [0,0,0], [-1,-1,k]), tf.slice(out, [0,0,0], [-1,-1,k])
+
+    if block_num == 1:
+        idx, val = knn_block(xyz2)
+    else:
+        xyz2_blocks = tf.pad(xyz2, [[0,0], [0,block_num*block_m-m], [0,0]])
+        xyz2_blocks = tf.transpose(tf.reshape(xyz2_blocks, (b,block_num,block_m,c)), [1,0,2,3])
+        idx, val = tf.map_fn(knn_block, xyz2_blocks, dtype=(tf.int32, tf.float32), parallel_iterations=1, back_prop=False)
+        idx = tf.reshape(tf.transpose(idx, [1,0,2,3]), (b,block_num*block_m,k))[:,:m,:]
+        val = tf.reshape(tf.transpose(val, [1,0,2,3]), (b,block_num*block_m,k))[:,:m,:]
     #val, idx = tf.nn.top_k(-dist, k=k) # ONLY SUPPORT CPU
     return val, idx
 
@@ -4,21 +4,14 @@ import time
 import sys
 
 import numpy as np
-import pygraph.algorithms
-import pygraph.algorithms.minmax
-import pygraph.classes.graph
-import tensorflow as tf
 #from matplotlib import pyplot as plt
 from scipy import spatial
+from scipy.sparse import csr_matrix, csgraph
 from tqdm import tqdm
 
 
 
 import pc_util
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-TF_SAMPLING_DIR = os.path.join(BASE_DIR, '../tf_ops/sampling')
-sys.path.append(TF_SAMPLING_DIR)
-from tf_sampling import farthest_point_sample
 
 class GKNN():
     def __init__(self, point_path, patch_size=2048, patch_num=100, normalization=False, add_noise=False):
@@ -66,20 +59,18 @@ class GKNN():
         self.nbrs = spatial.cKDTree(self.clean_data)
         # dists,idxs = self.nbrs.query(self.clean_data,k=6,distance_upper_bound=0.2)
         dists,idxs = self.nbrs.query(self.clean_data,k=16)
-        self.graph=[] # xl: not used??
+        self.graph=[] # neighbour sets for bfs_knn
         for item,dist in zip(idxs,dists):
             item = item[dist<0.07] #use 0.03 for chair7 model; otherwise use 0.05
             self.graph.append(set(item))
-        print("Build the graph cost %f second" % (time.time() - start))
 
-        self.graph2 = pygraph.classes.graph.graph()
-        self.graph2.add_nodes(range(len(self.clean_data)))
-        sid = 0
-        for idx, dist in zip(idxs, dists):
-            for eid, d in zip(idx, dist):
-                if not self.graph2.has_edge((sid, eid)) and eid < len(self.clean_data):
-                    self.graph2.add_edge((sid, eid), d)
-            sid = sid + 1
+        # sparse kNN graph for the geodesic distances, dijkstra treats it as undirected
+        nb_points = len(self.clean_data)
+        rows = np.repeat(np.arange(nb_points), idxs.shape[1])
+        valid = np.logical_and(idxs.ravel() < nb_points, idxs.ravel() != rows)
+        self.graph2 = csr_matrix((dists.ravel()[valid], (rows[valid], idxs.ravel()[valid])), shape=(nb_points, nb_points))
+        # mean spacing of the points, for the initial search radius of geodesic_knn_batch
+        self.point_spacing = np.mean(dists[:, 1])
         print("Build the graph cost %f second" % (time.time() - start))
 
         return
@@ -99,28 +90,59 @@ class GKNN():
         return result
 
     def geodesic_knn(self, seed=0, patch_size=1024):
-        _, dist = pygraph.algorithms.minmax.shortest_path(self.graph2, seed)
-        dist_list = np.asarray([dist[item] if item in dist else 10000 for item in range(len(self.data))])
-        idx = np.argsort(dist_list)
-        return idx[:patch_size]
-
+        return self.geodesic_knn_batch([seed], patch_size)[0]
+
+    def geodesic_knn_batch(self, seeds, patch_size=1024, max_batch_entries=2**25):
+        '''
+        patch_size geodesically nearest points of every seed, sorted by distance
+        dijkstra only explores up to a limit, starting from the radius of a disk of patch_size points
+        and doubled for the seeds that reach less than patch_size points, unbounded once a seed stops reaching new points
+        return: len(seeds) x patch_size indices
+        '''
+        seeds = np.asarray(seeds)
+        nb_points = len(self.data)
+        batch_size = max(1, max_batch_entries // nb_points) # bound the seeds x points distance matrix
+        result = np.empty((len(seeds), min(patch_size, nb_points)), dtype=np.int64)
+        for start_idx in range(0, len(seeds), batch_size):
+            batch_seeds = seeds[start_idx:start_idx+batch_size]
+            limit = 2.0 * np.sqrt(patch_size / np.pi) * self.point_spacing
+            dist = csgraph.dijkstra(self.graph2, directed=False, indices=batch_seeds, limit=limit)
+            nb_reached = np.sum(np.isfinite(dist), axis=1)
+            todo = nb_reached < patch_size
+            while np.any(todo):
+                limit = limit * 2.0
+                dist[todo] = csgraph.dijkstra(self.graph2, directed=False, indices=batch_seeds[todo], limit=limit)
+                new_nb_reached = np.sum(np.isfinite(dist), axis=1)
+                # a seed can stall while kNN edges longer than the limit still lead to more points,
+                # only the unbounded search tells that the whole component is reached
+                stalled = todo & (new_nb_reached < patch_size) & (new_nb_reached <= nb_reached)
+                if np.any(stalled):
+                    dist[stalled] = csgraph.dijkstra(self.graph2, directed=False, indices=batch_seeds[stalled])
+                    new_nb_reached = np.sum(np.isfinite(dist), axis=1)
+                todo = todo & ~stalled & (new_nb_reached < patch_size)
+                nb_reached = new_nb_reached
+            dist[np.isinf(dist)] = 10000 # unreachable points last
+            idx = np.argpartition(dist, result.shape[1]-1, axis=1)[:, :result.shape[1]]
+            order = np.argsort(np.take_along_axis(dist, idx, axis=1), axis=1)
+            result[start_idx:start_idx+len(batch_seeds)] = np.take_along_axis(idx, order, axis=1)
+        return result
 
     def estimate_single_density(self,id=0,patch_size=128):
-        query_point = self.data[id]
-        try:
-            point = self.bfs_knn(id, patch_size=patch_size)
-        except:
-            return np.asarray([0])
-        dist = np.sum((query_point-point)**2,axis=-1)
-        avg_dist = np.sum(dist)/patch_size
-        return avg_dist
-
-    def estimate_density(self):
-        self.density=[]
-        for id in tqdm(range(len(self.data))):
-            dist = self.estimate_single_density(id)
-            self.density.append(dist)
-        self.density = np.asarray(self.density)
+        return self.estimate_density_of(np.asarray([id]), patch_size)[0]
+
+    def estimate_density_of(self, idx, patch_size=128):
+        '''
+        mean squared distance to the patch_size nearest points, for all idx with one kNN query
+        k is clamped to the number of points, the tree pads missing neighbours with inf
+        '''
+        idx = np.atleast_1d(idx)
+        k = min(patch_size, len(self.data))
+        dist, _ = self.nbrs.query(self.data[idx], k=k, workers=-1)
+        dist = dist.reshape(len(idx), k) # k=1 returns (len(idx),)
+        return np.sum(dist**2, axis=-1)/k
+
+    def estimate_density(self, patch_size=128):
+        self.density = self.estimate_density_of(np.arange(len(self.data)), patch_size)
         #plt.hist(self.density)
         #plt.show()
 
@@ -129,11 +151,7 @@ class GKNN():
             candidata_num = min(len(self.data), seed_num * 50)
             print("Total %d candidata random points" % candidata_num)
             idx = np.random.permutation(len(self.data))[:candidata_num]
-        density = []
-        for item in tqdm(idx):
-            dist = self.estimate_single_density(item)
-            density.append(dist)
-        density = np.asarray(density)
+        density = self.estimate_density_of(np.asarray(idx))
         density = density*density
         density = density/np.sum(density)
         idx = np.random.choice(idx,size=seed_num,replace=False,p=density)
@@ -141,21 +159,10 @@ class GKNN():
 
 
     def get_idx(self, num):
-        idx1 = np.asarray([])
-
-        # randomly select seed
-        idx2 = np.random.randint(0, len(self.clean_data)-20, [num-len(idx1), 1])
-        idx2 = idx2 + np.arange(0,20).reshape((1,20))
-        point = self.clean_data[idx2]
-        point = np.mean(point, axis=1)
-        _,idx2 = self.nbrs.query(point,k=10)
-
-        all_samples = tf.convert_to_tensor(self.clean_data, dtype=np.float32)
-        all_samples = tf.expand_dims(all_samples, axis=0)
-        sample_indices = farthest_point_sample(num, all_samples)
-        idxxxx = self.sess.run(sample_indices)
-        idxxxx_np = np.squeeze(np.array(idxxxx))
-        return idxxxx_np       
+        '''
+        farthest point sampling of num seeds on CPU, starting from the first point as the tf op did
+        '''
+        return pc_util.farthest_point_sample(self.clean_data, num, start_idx=0)
 
     def crop_patch(self, save_root_path, use_dijkstra=True, scale_ratio=1, gpu_id=0):
         if save_root_path[-1]=='/':
@@ -163,33 +170,22 @@ class GKNN():
         if not os.path.exists(save_root_path):
             os.makedirs(save_root_path)
 
-        print('Creating TF session...')
-        config = tf.ConfigProto()
-        config.gpu_options.visible_device_list=str(gpu_id)
-        config.gpu_options.allow_growth = True
-        config.allow_soft_placement = True
-        self.sess = tf.Session(config=config)
-        
         seeds = self.get_idx(self.patch_num)
         print(seeds)
 
-        self.sess.close()
+        assert scale_ratio>=1.0
+        patch_sizes = [int(self.patch_size*np.random.uniform(1.0, scale_ratio)) for _ in seeds]
+        if use_dijkstra:
+            # all seeds at once, the patch of a seed is a prefix of its neighbors sorted by geodesic distance
+            all_idx = self.geodesic_knn_batch(seeds, max(patch_sizes))
 
         i = -1
-        for seed in (seeds):
+        for seed, patch_size in zip(seeds, patch_sizes):
             i = i+1
-            # patch_size = self.patch_size*np.random.randint(1,scale_ratio+1)
-            assert scale_ratio>=1.0
-            patch_size = int(self.patch_size*np.random.uniform(1.0, scale_ratio))
-            try:
-                if use_dijkstra:
-                    idx = self.geodesic_knn(seed, patch_size)
-                else:
-                    idx = self.bfs_knn(seed, patch_size)
-            except Exception as e:
-                    exc_type, exc_obj, exc_tb = sys.exc_info()
-                    fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-                    print(exc_type, fname, exc_tb.tb_lineno)
+            if use_dijkstra:
+                idx = all_idx[i][:patch_size]
+            else:
+                idx = np.asarray(self.bfs_knn(seed, patch_size))
             idxx = np.random.permutation(patch_size)[:self.patch_size]
             idxx.sort()
             idx = idx[idxx]
@@ -212,6 +208,7 @@ class GKNN():
             os.makedirs(save_root_path + "_edgepoint")
             os.makedirs(save_root_path + "_face")
             os.makedirs(save_root_path + "_facepoint")
+        import tensorflow as tf # only the edge/face distances need tf
 
         ## the first part
         if boxes is not None:
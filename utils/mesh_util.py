@@ -1,18 +1,19 @@
 import os
 import sys
 import numpy as np
-from plyfile import PlyData, PlyElement
-import pymesh
+import trimesh
 
 ############## mesh I/O ####################
 def read_obj(filename):
     '''
     return pymesh mesh
     '''
+    import pymesh # only the pymesh helpers need it, the virtual scan only uses trimesh
     mesh = pymesh.load_mesh(filename)
     return mesh
 
 def convert_obj2ply(obj_filename, ply_filename, recenter=False, center_mode='pt_center'):
+    import pymesh
     mesh = pymesh.load_mesh(obj_filename)
     pymesh.remove_isolated_vertices(mesh)
 
@@ -28,3 +29,77 @@ def convert_obj2ply(obj_filename, ply_filename, recenter=False, center_mode='pt_
         mesh = pymesh.form_mesh(new_vertices, mesh.faces)
 
     pymesh.save_mesh(ply_filename, mesh)
+
+############## virtual scan ####################
+def read_obj_vertices(obj_filename):
+    '''
+    all vertex positions of an OBJ file, including the ones no face uses
+    return: N x 3
+    '''
+    with open(obj_filename, 'r') as f:
+        vertices = [line.split()[1:4] for line in f if line.startswith('v ')]
+    return np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+
+def load_obj_recentered(obj_filename, center_mode='box_center'):
+    '''
+    same recentering as convert_obj2ply, without writing a ply
+    return trimesh mesh
+    '''
+    mesh = trimesh.load(obj_filename, force='mesh', process=False)
+    # convert_obj2ply centers on every OBJ vertex, isolated ones included,
+    # but trimesh drops the unreferenced vertices, so read them from the file
+    all_vertices = read_obj_vertices(obj_filename)
+    if center_mode == 'pt_center':
+        center = np.mean(all_vertices, axis=0)
+    elif center_mode == 'box_center':
+        center = (np.amin(all_vertices, axis=0) + np.amax(all_vertices, axis=0)) / 2.0
+    return trimesh.Trimesh(vertices=mesh.vertices - center, faces=mesh.faces, process=False)
+
+def get_scan_ray_directions(view_point, target_point, nb_scans=600, pts_in_scan=600, vert_res=0.125, hor_res=0.125):
+    '''
+    unit ray directions of one view: a nb_scans x pts_in_scan grid of angles (in degree) around the viewing direction,
+    same scan pattern as pcl_virtual_scanner
+    return: (nb_scans*pts_in_scan) x 3
+    '''
+    forward = np.asarray(target_point, dtype=np.float64) - np.asarray(view_point, dtype=np.float64)
+    forward = forward / np.linalg.norm(forward)
+    # the world axis least aligned with the view is the up reference, so views along any axis work
+    up_ref = np.eye(3)[np.argmin(np.abs(forward))]
+    right = np.cross(forward, up_ref)
+    right = right / np.linalg.norm(right)
+    up = np.cross(right, forward)
+
+    vert = np.radians((np.arange(nb_scans) - nb_scans / 2.0) * vert_res)
+    hor = np.radians((np.arange(pts_in_scan) - pts_in_scan / 2.0) * hor_res)
+    vert, hor = np.meshgrid(vert, hor, indexing='ij')
+    directions = (np.cos(vert) * np.cos(hor))[..., np.newaxis] * forward \
+               + (np.cos(vert) * np.sin(hor))[..., np.newaxis] * right \
+               + np.sin(vert)[..., np.newaxis] * up
+    return directions.reshape(-1, 3)
+
+def virtual_scan_mesh(mesh, cam_view_points, cam_target_points, nb_scans=600, pts_in_scan=600, vert_res=0.125, hor_res=0.125,
+                      point_sigma=0.0, max_rays_per_call=2000000, rand_gen=np.random):
+    '''
+    in-process replacement of pcl_virtual_scanner, the first hit of every ray of every view, all views merged
+    mesh: trimesh mesh
+    cam_view_points, cam_target_points: flat [x0,y0,z0,x1,...] or Vx3, e.g. from generate_camera_view_target_points
+    point_sigma: std of the gaussian noise added along the rays, 0 for a noise-free scan
+    max_rays_per_call: views are ray cast together, up to this many rays per call
+    return: Nx3
+    '''
+    view_points = np.reshape(cam_view_points, (-1, 3))
+    target_points = np.reshape(cam_target_points, (-1, 3))
+    assert(view_points.shape == target_points.shape)
+
+    rays_per_view = nb_scans * pts_in_scan
+    views_per_call = max(1, max_rays_per_call // rays_per_view)
+    all_points = []
+    for start_idx in range(0, view_points.shape[0], views_per_call):
+        end_idx = min(start_idx + views_per_call, view_points.shape[0])
+        ray_directions = np.concatenate([get_scan_ray_directions(view_points[v_idx], target_points[v_idx], nb_scans, pts_in_scan, vert_res, hor_res) for v_idx in range(start_idx, end_idx)], axis=0)
+        ray_origins = np.repeat(view_points[start_idx:end_idx], rays_per_view, axis=0)
+        locations, index_ray, _ = mesh.ray.intersects_location(ray_origins, ray_directions, multiple_hits=False)
+        if point_sigma > 0:
+            locations = locations + ray_directions[index_ray] * rand_gen.normal(0, point_sigma, (locations.shape[0], 1))
+        all_points.append(locations)
+    return np.concatenate(all_points, axis=0)
@@ -7,6 +7,7 @@ Date: November 2016
 import os
 import sys
 import math
+import itertools
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(BASE_DIR)
 
@@ -14,10 +15,8 @@ sys.path.append(BASE_DIR)
 from eulerangles import euler2mat
 
 # Point cloud IO
+# plyfile, pymesh and open3d are imported in the functions that need them, most scripts only read and write plys
 import numpy as np
-from plyfile import PlyData, PlyElement
-import pymesh
-import open3d
 from tqdm import tqdm
 
 ##################### colors for vis #############################
@@ -117,20 +116,58 @@ def get_color_by_label_array(label_arr):
 # ----------------------------------------
 # Point Cloud/Volume Conversions
 # ----------------------------------------
+def _group_by_key(keys):
+    '''
+    sort points by their cell key
+    return: order of the points, keys of the occupied cells, start of every cell in order and #points of every cell
+    '''
+    order = np.argsort(keys, kind='stable')
+    cell_keys, cell_start, cell_count = np.unique(keys[order], return_index=True, return_counts=True)
+    return order, cell_keys, cell_start, cell_count
+
+def _sample_per_cell(order, cell_start, cell_count, num_sample):
+    '''
+    num_sample point indices per cell: a random subset of a cell with more points,
+    otherwise all points of the cell in order, padded with the last one
+    return: #cells x num_sample
+    '''
+    cell_of = np.repeat(np.arange(len(cell_start)), cell_count)
+    # shuffle within the cells to sample, stable sort keeps the order of the others
+    rand_keys = np.random.rand(len(order))
+    rand_keys[cell_count[cell_of] <= num_sample] = 0
+    shuffled = order[np.lexsort((rand_keys, cell_of))]
+    return shuffled[cell_start[:, np.newaxis] + np.minimum(np.arange(num_sample)[np.newaxis, :], cell_count[:, np.newaxis] - 1)]
+
+def _majority_label(inverse, nb_groups, label):
+    '''
+    most frequent label of every group, the smallest one on ties as np.argmax(np.bincount()) does
+    '''
+    label = label.astype(np.int64)
+    nb_labels = np.amax(label) + 1
+    pair_keys, pair_count = np.unique(inverse * nb_labels + label, return_counts=True)
+    pair_group = pair_keys // nb_labels
+    pair_label = pair_keys % nb_labels
+    best = np.lexsort((pair_label, -pair_count, pair_group))
+    _, first = np.unique(pair_group[best], return_index=True)
+    uvlabel = np.zeros(nb_groups, dtype=np.int64)
+    uvlabel[pair_group[best][first]] = pair_label[best][first]
+    return uvlabel
+
 def point_cloud_label_to_surface_voxel_label(point_cloud, label, res=0.0484):
     coordmax = np.max(point_cloud,axis=0)
     coordmin = np.min(point_cloud,axis=0)
     nvox = np.ceil((coordmax-coordmin)/res)
     vidx = np.ceil((point_cloud-coordmin)/res)
     vidx = vidx[:,0]+vidx[:,1]*nvox[0]+vidx[:,2]*nvox[0]*nvox[1]
-    uvidx = np.unique(vidx)
+    uvidx, inverse = np.unique(vidx, return_inverse=True)
+    inverse = inverse.reshape(-1)
     if label.ndim==1:
-        uvlabel = [np.argmax(np.bincount(label[vidx==uv].astype(np.uint32))) for uv in uvidx]
+        uvlabel = _majority_label(inverse, len(uvidx), label)
     else:
         assert(label.ndim==2)
-    uvlabel = np.zeros(len(uvidx),label.shape[1])
-    for i in range(label.shape[1]):
-	    uvlabel[:,i] = np.array([np.argmax(np.bincount(label[vidx==uv,i].astype(np.uint32))) for uv in uvidx])
+        uvlabel = np.zeros((len(uvidx),label.shape[1]))
+        for i in range(label.shape[1]):
+            uvlabel[:,i] = _majority_label(inverse, len(uvidx), label[:,i])
     return uvidx, uvlabel, nvox
 
 def point_cloud_label_to_surface_voxel_label_fast(point_cloud, label, res=0.0484):
@@ -144,7 +181,7 @@ def point_cloud_label_to_surface_voxel_label_fast(point_cloud, label, res=0.0484
         uvlabel = label[vpidx]
     else:
         assert(label.ndim==2)
-    uvlabel = label[vpidx,:]
+        uvlabel = label[vpidx,:]
     return uvidx, uvlabel, nvox
 
 def point_cloud_to_volume_batch(point_clouds, vsize=12, radius=1.0, flatten=True):
@@ -185,27 +222,48 @@ def volume_to_point_cloud(vol):
     """
     vsize = vol.shape[0]
     assert(vol.shape[1] == vsize and vol.shape[1] == vsize)
-    points = []
-    for a in range(vsize):
-        for b in range(vsize):
-            for c in range(vsize):
-                if vol[a,b,c] == 1:
-                    points.append(np.array([a,b,c]))
+    points = np.argwhere(vol == 1) # same order as looping over a, b, c
     if len(points) == 0:
         return np.zeros((0,3))
-    points = np.vstack(points)
     return points
 
+def _point_cloud_to_cells_batch(point_clouds, nb_dims, gsize, radius, num_sample):
+    """ group the points of a batch by the cells of a gsize^nb_dims grid on their first nb_dims coordinates
+        return: normalized points BxGx..xGxnum_samplex3, as point_cloud_to_volume_v2/point_cloud_to_image
+    """
+    batch_size = point_clouds.shape[0]
+    cell = 2*radius/float(gsize)
+    locations = ((point_clouds[:,:,0:nb_dims] + radius)/cell).astype(int) # BxNxnb_dims
+    batch_idx = np.repeat(np.arange(batch_size), point_clouds.shape[1])
+    locations = locations.reshape(-1, nb_dims)
+    points = point_clouds.reshape(-1, 3)
+    # points outside the grid are dropped
+    valid = np.all(np.logical_and(locations >= 0, locations < gsize), axis=-1)
+    keys = batch_idx[valid]
+    for d in range(nb_dims):
+        keys = keys * gsize + locations[valid, d]
+    order, cell_keys, cell_start, cell_count = _group_by_key(keys)
+    cell_points = points[valid][_sample_per_cell(order, cell_start, cell_count, num_sample)] # #cells x num_sample x 3
+
+    # cell coordinates back from the keys, normalize
+    cell_locations = np.zeros((len(cell_keys), nb_dims), dtype=np.int64)
+    rest = cell_keys
+    for d in reversed(range(nb_dims)):
+        cell_locations[:, d] = rest % gsize
+        rest = rest // gsize
+    pc_center = (cell_locations + 0.5)*cell - radius
+    cell_points[:,:,0:nb_dims] = (cell_points[:,:,0:nb_dims] - pc_center[:, np.newaxis, :])/cell
+
+    grid = np.zeros((batch_size*gsize**nb_dims, num_sample, 3))
+    grid[cell_keys] = cell_points
+    return grid.reshape((batch_size,) + (gsize,)*nb_dims + (num_sample, 3))
+
 def point_cloud_to_volume_v2_batch(point_clouds, vsize=12, radius=1.0, num_sample=128):
     """ Input is BxNx3 a batch of point cloud
         Output is BxVxVxVxnum_samplex3
         Added on Feb 19
     """
-    vol_list = []
-    for b in range(point_clouds.shape[0]):
-        vol = point_cloud_to_volume_v2(point_clouds[b,:,:], vsize, radius, num_sample)
-        vol_list.append(np.expand_dims(vol, 0))
-    return np.concatenate(vol_list, 0)
+    return _point_cloud_to_cells_batch(np.asarray(point_clouds)[:,:,0:3], 3, vsize, radius, num_sample)
 
 def point_cloud_to_volume_v2(points, vsize, radius=1.0, num_sample=128):
     """ input is Nx3 points
@@ -215,50 +273,14 @@ def point_cloud_to_volume_v2(points, vsize, radius=1.0, num_sample=128):
         num_sample points, replicate the points
         Added on Feb 19
     """
-    vol = np.zeros((vsize,vsize,vsize,num_sample,3))
-    voxel = 2*radius/float(vsize)
-    locations = (points + radius)/voxel
-    locations = locations.astype(int)
-    loc2pc = {}
-    for n in range(points.shape[0]):
-        loc = tuple(locations[n,:])
-        if loc not in loc2pc:
-            loc2pc[loc] = []
-        loc2pc[loc].append(points[n,:])
-    #print loc2pc
-
-    for i in range(vsize):
-        for j in range(vsize):
-            for k in range(vsize):
-                if (i,j,k) not in loc2pc:
-                    vol[i,j,k,:,:] = np.zeros((num_sample,3))
-                else:
-                    pc = loc2pc[(i,j,k)] # a list of (3,) arrays
-                    pc = np.vstack(pc) # kx3
-                    # Sample/pad to num_sample points
-                    if pc.shape[0]>num_sample:
-                        choices = np.random.choice(pc.shape[0], num_sample, replace=False)
-                        pc = pc[choices,:]
-                    elif pc.shape[0]<num_sample:
-                        pc = np.lib.pad(pc, ((0,num_sample-pc.shape[0]),(0,0)), 'edge')
-                    # Normalize
-                    pc_center = (np.array([i,j,k])+0.5)*voxel - radius
-                    #print 'pc center: ', pc_center
-                    pc = (pc - pc_center) / voxel # shift and scale
-                    vol[i,j,k,:,:] = pc 
-                #print (i,j,k), vol[i,j,k,:,:]
-    return vol
+    return point_cloud_to_volume_v2_batch(points[np.newaxis,:,:], vsize, radius, num_sample)[0]
 
 def point_cloud_to_image_batch(point_clouds, imgsize, radius=1.0, num_sample=128):
     """ Input is BxNx3 a batch of point cloud
         Output is BxIxIxnum_samplex3
         Added on Feb 19
     """
-    img_list = []
-    for b in range(point_clouds.shape[0]):
-        img = point_cloud_to_image(point_clouds[b,:,:], imgsize, radius, num_sample)
-        img_list.append(np.expand_dims(img, 0))
-    return np.concatenate(img_list, 0)
+    return _point_cloud_to_cells_batch(np.asarray(point_clouds)[:,:,0:3], 2, imgsize, radius, num_sample)
 
 
 def point_cloud_to_image(points, imgsize, radius=1.0, num_sample=128):
@@ -269,43 +291,20 @@ def point_cloud_to_image(points, imgsize, radius=1.0, num_sample=128):
         num_sample points, replicate the points
         Added on Feb 19
     """
-    img = np.zeros((imgsize, imgsize, num_sample, 3))
-    pixel = 2*radius/float(imgsize)
-    locations = (points[:,0:2] + radius)/pixel # Nx2
-    locations = locations.astype(int)
-    loc2pc = {}
-    for n in range(points.shape[0]):
-        loc = tuple(locations[n,:])
-        if loc not in loc2pc:
-            loc2pc[loc] = []
-        loc2pc[loc].append(points[n,:])
-    for i in range(imgsize):
-        for j in range(imgsize):
-            if (i,j) not in loc2pc:
-                img[i,j,:,:] = np.zeros((num_sample,3))
-            else:
-                pc = loc2pc[(i,j)]
-                pc = np.vstack(pc)
-                if pc.shape[0]>num_sample:
-                    choices = np.random.choice(pc.shape[0], num_sample, replace=False)
-                    pc = pc[choices,:]
-                elif pc.shape[0]<num_sample:
-                    pc = np.lib.pad(pc, ((0,num_sample-pc.shape[0]),(0,0)), 'edge')
-                pc_center = (np.array([i,j])+0.5)*pixel - radius
-                pc[:,0:2] = (pc[:,0:2] - pc_center)/pixel
-                img[i,j,:,:] = pc
-    return img
+    return point_cloud_to_image_batch(points[np.newaxis,:,:], imgsize, radius, num_sample)[0]
 # ----------------------------------------
 # Point cloud IO
 # ----------------------------------------
 
 def read_ply(filename):
     """ read XYZ point cloud from filename PLY file """
+    import pymesh
     mesh = pymesh.load_mesh(filename)
     return mesh.vertices
 
 def read_ply_xyz(filename):
     """ read XYZ point cloud from filename PLY file """
+    from plyfile import PlyData
     if not os.path.isfile(filename):
         print(filename)
         assert(os.path.isfile(filename))
@@ -320,6 +319,7 @@ def read_ply_xyz(filename):
 
 def read_ply_xyzrgb(filename):
     """ read XYZRGB point cloud from filename PLY file """
+    from plyfile import PlyData
     assert(os.path.isfile(filename))
     with open(filename, 'rb') as f:
         plydata = PlyData.read(f)
@@ -334,10 +334,12 @@ def read_ply_xyzrgb(filename):
     return vertices
 
 def read_obj(filename):
+    import pymesh
     mesh = pymesh.load_mesh(filename)
     return mesh.vertices
 
 def read_pcd(filename):
+    import open3d
     pcd_load = open3d.read_point_cloud(filename)
     xyz_load = np.asarray(pcd_load.points)
     return xyz_load
@@ -376,8 +378,10 @@ def read_ply_from_file_list(file_list):
 
 def write_ply(points, filename, text=False):
     """ input: Nx3, write points to filename as PLY format. """
-    points = [(points[i,0], points[i,1], points[i,2]) for i in range(points.shape[0])]
-    vertex = np.array(points, dtype=[('x', 'f4'), ('y', 'f4'),('z', 'f4')])
+    from plyfile import PlyData, PlyElement
+    # fill the columns at once, no per-point tuples
+    vertex = np.empty(points.shape[0], dtype=[('x', 'f4'), ('y', 'f4'),('z', 'f4')])
+    vertex['x'], vertex['y'], vertex['z'] = points[:,0], points[:,1], points[:,2]
     el = PlyElement.describe(vertex, 'vertex', comments=['vertices'])
     with open(filename, mode='wb') as f:
         PlyData([el], text=text).write(f)
@@ -437,6 +441,7 @@ def write_ply_batch_with_name(point_cloud_batch, name_batch, out_dir):
 
 def write_ply_versatile(points, filename, colors=None, normals=None, text=False):
     """ input: Nx3, write points to filename as PLY format. """
+    from plyfile import PlyData, PlyElement
     if colors is not None: assert(points.shape[0]==colors.shape[0])
     if normals is not None: assert(points.shape[0]==normals.shape[0])
 
@@ -534,15 +539,123 @@ def point_cloud_normalized(point_clouds, tol=0.0):
     
     return res_pc
 
+def _voxel_cells(points, voxel_size):
+    '''
+    integer grid coordinates of the points, starting from 1 so that neighbour cells are never negative
+    '''
+    return np.floor((points - np.amin(points, axis=0)) / voxel_size).astype(np.int64) + 1
+
+def _linear_cell_keys(cells, dims):
+    return (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+
+def _grid_dims(cells):
+    dims = np.amax(cells, axis=0) + 2
+    if np.prod(dims.astype(np.float64)) >= 2**62:
+        raise ValueError('Grid of %s cells too large, increase the cell size.'%(str(dims)))
+    return dims
+
+def _greedy_min_distance_mask(points, tol):
+    '''
+    keep mask of points, a point is dropped if it is closer than tol to an earlier kept point.
+    points are hashed into a grid of cell size tol, so only points in the 27 neighbouring cells are compared.
+    '''
+    nb_points = points.shape[0]
+    cells = _voxel_cells(points[:, :3], tol)
+    dims = _grid_dims(cells)
+    keys = _linear_cell_keys(cells, dims)
+    order = np.argsort(keys, kind='stable')
+    cell_keys, cell_start, cell_count = np.unique(keys[order], return_index=True, return_counts=True)
+
+    # (later, earlier) pairs of points closer than tol, neighbour cells are looked up for all occupied cells at once
+    later, earlier = [], []
+    for offset in itertools.product([-1, 0, 1], repeat=3):
+        nb_keys = cell_keys + (offset[0] * dims[1] + offset[1]) * dims[2] + offset[2]
+        nb_cell = np.minimum(np.searchsorted(cell_keys, nb_keys), len(cell_keys) - 1)
+        cell_a = np.nonzero(cell_keys[nb_cell] == nb_keys)[0]
+        cell_b = nb_cell[cell_a]
+        # all point pairs between cell_a and cell_b
+        nb_pairs = cell_count[cell_a] * cell_count[cell_b]
+        rank = np.arange(np.sum(nb_pairs)) - np.repeat(np.cumsum(nb_pairs) - nb_pairs, nb_pairs)
+        count_b = np.repeat(cell_count[cell_b], nb_pairs)
+        src_idx = order[np.repeat(cell_start[cell_a], nb_pairs) + rank // count_b]
+        dst_idx = order[np.repeat(cell_start[cell_b], nb_pairs) + rank % count_b]
+        mask = dst_idx < src_idx
+        src_idx, dst_idx = src_idx[mask], dst_idx[mask]
+        mask = np.sum((points[src_idx, :3] - points[dst_idx, :3])**2, axis=-1) < tol**2
+        later.append(src_idx[mask])
+        earlier.append(dst_idx[mask])
+    later = np.concatenate(later)
+    earlier = np.concatenate(earlier)
+
+    # same result as merging in order: a point is dropped if an earlier neighbour is kept,
+    # kept if all earlier neighbours are dropped. every round decides at least the first undecided point.
+    state = np.zeros(nb_points, dtype=np.int8) # 0: undecided, 1: kept, -1: dropped
+    has_earlier = np.zeros(nb_points, dtype=bool)
+    has_earlier[later] = True
+    state[~has_earlier] = 1
+    while np.any(state == 0):
+        drop = np.zeros(nb_points, dtype=bool)
+        drop[later[state[earlier] == 1]] = True
+        state[(state == 0) & drop] = -1
+        blocked = np.zeros(nb_points, dtype=bool)
+        blocked[later[state[earlier] != -1]] = True
+        state[(state == 0) & ~blocked] = 1
+    return state == 1
+
 def remove_duplicated_points(points, tol=0.0001):
     '''
     input is a numpy array: Nx3
+    drop every point closer than tol to an earlier kept point, as pymesh.remove_duplicated_vertices does.
     '''
-    fake_faces = np.array([[0,1,2]])
-    mesh = pymesh.form_mesh(points, fake_faces)
-    mesh, info = pymesh.remove_duplicated_vertices(mesh, tol)
-    print('#Merged points: {}'.format(info["num_vertex_merged"]))
-    return mesh.vertices
+    points = np.asarray(points)
+    if points.shape[0] == 0:
+        return points
+    keep = _greedy_min_distance_mask(points, tol)
+    print('#Merged points: {}'.format(np.sum(~keep)))
+    return points[keep]
+
+def voxel_downsample_point_cloud(points, voxel_size):
+    '''
+    input is a numpy array: NxC
+    return one point per occupied cell of a voxel_size grid, the average of the points in it: MxC
+    '''
+    points = np.asarray(points)
+    if points.shape[0] == 0:
+        return points
+    cells = _voxel_cells(points[:, :3], voxel_size)
+    _, inverse, counts = np.unique(_linear_cell_keys(cells, _grid_dims(cells)), return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+    sums = np.stack([np.bincount(inverse, weights=points[:, c], minlength=len(counts)) for c in range(points.shape[1])], axis=-1)
+    return sums / counts[:, np.newaxis]
+
+def farthest_point_sample(points, npoint, start_idx=0):
+    '''
+    input is a numpy array: NxC, O(N*npoint)
+    return: indices of npoint points, each the farthest one from those picked before
+    '''
+    nb_points = points.shape[0]
+    xyz = points[:, :3].astype(np.float64)
+    sample_indices = np.zeros(npoint, dtype=np.int64)
+    min_dist = np.full(nb_points, np.inf)
+    cur_idx = start_idx
+    for i in range(npoint):
+        sample_indices[i] = cur_idx
+        diff = xyz - xyz[cur_idx]
+        np.minimum(min_dist, np.einsum('ij,ij->i', diff, diff), out=min_dist)
+        cur_idx = np.argmax(min_dist)
+    return sample_indices
+
+def poisson_disk_sample(points, radius, rand_gen=np.random):
+    '''
+    input is a numpy array: NxC
+    return: indices of a random subset in which no two points are closer than radius
+    '''
+    perm = rand_gen.permutation(points.shape[0])
+    # two points in a cell of size radius/sqrt(3) are always too close, keep the first one of every cell in random order
+    cells = _voxel_cells(points[perm, :3], radius / np.sqrt(3))
+    _, first_idx = np.unique(_linear_cell_keys(cells, _grid_dims(cells)), return_index=True)
+    candidates = perm[np.sort(first_idx)]
+    return candidates[_greedy_min_distance_mask(points[candidates], radius)]
 
 def add_gaussian_noise(points, noise_mu=0, noise_sigma=0.0012):
     '''
@@ -559,7 +672,7 @@ def rotate_point_cloud(points, transformation_mat):
     return new_points
 
 def rotate_point_cloud_by_axis_angle(points, axis, angle_deg):
-
+    import pymesh
     angle = math.radians(angle_deg)
     rot_m = pymesh.Quaternion.fromAxisAngle(axis, angle)
     rot_m = rot_m.to_matrix()
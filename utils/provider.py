@@ -1,7 +1,6 @@
 import os
 import sys
 import numpy as np
-import h5py
 import math
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(BASE_DIR)
@@ -353,6 +352,7 @@ def getDataFiles(list_filename):
     return [line.rstrip() for line in open(list_filename)]
 
 def load_h5(h5_filename):
+    import h5py
     f = h5py.File(h5_filename)
     data = f['data'][:]
     label = f['label'][:]